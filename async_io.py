@@ -0,0 +1,179 @@
+"""
+Asyncio I/O layer for the read-heavy paths (existence checks, PR lookups,
+gear mapping, snapshot exports): many Notion queries in flight at once,
+under one global concurrency limit. Garmin backfills fetch in parallel with
+garmin_many(), under the adaptive limit of throttle.Adaptive.
+
+All coroutines run on one background event loop, so the keep-alive
+connections of the shared HTTP pool are reused by every stage of a run.
+Real Notion clients are served by notion_client.AsyncClient on that pool;
+anything else (the fakes, a snapshot reader) and the synchronous
+garminconnect calls are run in worker threads. Stages stay synchronous:
+
+    responses = async_io.query_many(notion, [{"database_id": ..., "filter": ...}, ...])
+"""
+import os
+import time
+import asyncio
+import threading
+import instrumentation
+from concurrent.futures import ThreadPoolExecutor
+from instrumentation import Instrumented, payload_size
+from throttle import GARMIN_MAX_CONCURRENCY, MAX_RETRIES, Adaptive, Throttled, garmin_concurrency, is_rate_limited, notion_limiter, retry_after
+
+# Requests in flight at once, across every stage and tenant of the process
+CONCURRENCY = int(os.getenv("IO_CONCURRENCY", 8))
+KEEPALIVE_SECONDS = 30
+TIMEOUT_SECONDS = 60
+
+_loop = None
+_loop_thread = None
+_loop_lock = threading.Lock()
+# Real Notion requests awaiting a response; only changed on the loop thread
+_notion_in_flight = 0
+_semaphore = None
+_http = None
+_async_notion = None
+
+def event_loop():
+    """The background event loop, started on first use"""
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=loop.run_forever, name="async-io", daemon=True)
+            _loop_thread.start()
+            _loop = loop
+        return _loop
+
+def waiting_on_notion(thread_id):
+    """True if `thread_id` is the loop thread and Notion requests are in flight (see profiling.py)"""
+    return _loop_thread is not None and thread_id == _loop_thread.ident and _notion_in_flight > 0
+
+def run(coro):
+    """Runs a coroutine on the background loop and waits for its result (from synchronous code)"""
+    return asyncio.run_coroutine_threadsafe(coro, event_loop()).result()
+
+def gather(*coros):
+    """Runs coroutines concurrently; returns their results in order"""
+    async def _gather():
+        return await asyncio.gather(*coros)
+    return run(_gather())
+
+def _limit():
+    # Created on the loop thread, where every coroutine of this module runs
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(CONCURRENCY)
+    return _semaphore
+
+def http_client():
+    """Shared pooled HTTP client (keep-alive) for the async Notion clients"""
+    global _http
+    if _http is None:
+        import httpx
+        limits = httpx.Limits(max_connections=CONCURRENCY, max_keepalive_connections=CONCURRENCY, keepalive_expiry=KEEPALIVE_SECONDS)
+        _http = httpx.AsyncClient(limits=limits, timeout=TIMEOUT_SECONDS)
+    return _http
+
+def _unwrap(client):
+    """Innermost client behind Instrumented / Throttled wrappers, and the Throttled rate limiter if any"""
+    limiter = None
+    while isinstance(client, (Instrumented, Throttled)):
+        limiter = limiter or client.__dict__.get("_limiter")
+        client = client.__dict__["_target"]
+    return client, limiter
+
+def _async_client():
+    # One client for every token: the token is sent per request, so
+    # tenants share the connection pool without sharing credentials
+    global _async_notion
+    if _async_notion is None:
+        from notion_client import AsyncClient
+        _async_notion = AsyncClient(client=http_client())
+    return _async_notion
+
+def _resolve(client, path):
+    for attr_name in path.split("."):
+        client = getattr(client, attr_name)
+    return client
+
+async def notion_call(notion, path, **kwargs):
+    """
+    Awaits one Notion API call such as "databases.query". A real
+    notion_client.Client is replaced by the shared AsyncClient with the same
+    token, rate limited per token and retried on 429 like throttle.Throttled.
+    """
+    global _notion_in_flight
+    inner, limiter = _unwrap(notion)
+    if type(inner).__module__.split(".")[0] != "notion_client":
+        async with _limit():
+            return await asyncio.to_thread(_resolve(notion, path), **kwargs)
+
+    token = inner.options.auth
+    method = _resolve(_async_client(), path)
+    limiter = limiter or notion_limiter(token)
+    name = f"notion.{path}"
+    async with _limit():
+        for attempt in range(MAX_RETRIES + 1):
+            await limiter.acquire_async()
+            started = time.perf_counter()
+            try:
+                _notion_in_flight += 1
+                try:
+                    result = await method(**kwargs, auth=token)
+                finally:
+                    _notion_in_flight -= 1
+            except Exception as e:
+                instrumentation.metrics.record_call(name, (time.perf_counter() - started) * 1000, payload_size(kwargs), 0, e)
+                if not is_rate_limited(e) or attempt == MAX_RETRIES:
+                    raise
+                instrumentation.metrics.record_retry(name)
+                await asyncio.sleep(retry_after(e, attempt))
+                continue
+            instrumentation.metrics.record_call(name, (time.perf_counter() - started) * 1000, payload_size(kwargs), payload_size(result))
+            return result
+
+async def query(notion, **query):
+    """One page of a databases.query"""
+    return await notion_call(notion, "databases.query", **query)
+
+async def query_all(notion, **query):
+    """All results of a databases.query, following the cursors"""
+    results = []
+    next_cursor = None
+    while True:
+        resp = await notion_call(notion, "databases.query", **query, start_cursor=next_cursor)
+        results.extend(resp['results'])
+        if not resp['has_more']:
+            return results
+        next_cursor = resp['next_cursor']
+
+async def garmin_call(garmin, method_name, *args):
+    """Runs a synchronous garminconnect call in a worker thread"""
+    return await asyncio.to_thread(getattr(garmin, method_name), *args)
+
+def query_many(notion, queries):
+    """First page of each query (dicts of databases.query arguments), all sent at once"""
+    return gather(*[query(notion, **q) for q in queries])
+
+def _adaptive(garmin):
+    """The client itself if it is already adaptively limited, else wrapped in the default controller"""
+    client = garmin
+    # Every wrapper (Instrumented, Throttled, a worker's lease fence, ...) keeps its client in _target
+    while "_target" in getattr(client, "__dict__", {}):
+        if isinstance(client, Adaptive):
+            return garmin
+        client = client.__dict__["_target"]
+    return Adaptive(garmin, garmin_concurrency(None))
+
+def garmin_many(garmin, method_name, calls):
+    """
+    Results of one Garmin method for each argument tuple in `calls`, in order.
+    The calls run in parallel threads; how many at once is decided by the
+    adaptive limit (throttle.Adaptive), so a backfill speeds up while Garmin
+    answers and backs off on 429s.
+    """
+    method = getattr(_adaptive(garmin), method_name)
+    with ThreadPoolExecutor(max_workers=GARMIN_MAX_CONCURRENCY, thread_name_prefix="garmin") as pool:
+        return list(pool.map(lambda args: method(*args), calls))
@@ -0,0 +1,163 @@
+import json
+import time
+import uuid
+import argparse
+import datetime
+import tempfile
+import importlib
+from fakes import FakeGarmin, FakeNotion
+from instrumentation import Metrics, collect_metrics, instrument
+from profiling import enable as enable_profiling, profiled
+from stages import STAGE_NAMES, load_stage
+from sync_state import use_state_dir
+from throttle import Adaptive, AdaptiveConcurrency, RateLimiter, Throttled
+
+def _database_id(name):
+    """Fixed fake database ID as copied from a Notion URL (no dashes; the fake API answers with dashes)"""
+    return uuid.uuid5(uuid.NAMESPACE_URL, f"benchmark/{name}").hex
+
+# Fake database IDs, in the settings the stages read
+CONFIG = {
+    "NOTION_DB_ID": _database_id("activities"),
+    "NOTION_PR_DB_ID": _database_id("prs"),
+    "NOTION_BEST_EFFORTS_DB_ID": _database_id("best-efforts"),
+    "NOTION_STEPS_DB_ID": _database_id("steps"),
+    "NOTION_SLEEP_DB_ID": _database_id("sleep"),
+    "NOTION_HEALTH_DB_ID": _database_id("health"),
+    "NOTION_GEAR_DB_ID": _database_id("gear"),
+    "NOTION_COACH_DB_ID": _database_id("coach"),
+    "NOTION_ROLLUPS_DB_ID": _database_id("rollups"),
+    "COACH_LLM": "local",
+}
+
+# Newest activities left out of Notion so the activities stage has work to do
+UNSYNCED_ACTIVITIES = 5
+
+def seed_notion(notion, garmin):
+    """Fills the fake Notion databases with history matching the fake Garmin account"""
+    activities_script = importlib.import_module("garmin-activities")
+    for activity in garmin.activities[UNSYNCED_ACTIVITIES:]:
+        notion.pages.create(
+            parent={"database_id": CONFIG["NOTION_DB_ID"]},
+            properties=activities_script.build_activity_properties(activity)
+        )
+
+    yesterday = garmin.today - datetime.timedelta(days=1)
+    for day in garmin.days:
+        if day < yesterday:
+            steps = garmin.get_daily_steps(day.isoformat(), day.isoformat())[0]
+            notion.pages.create(parent={"database_id": CONFIG["NOTION_STEPS_DB_ID"]}, properties={
+                "Activity Type": {"title": [{"text": {"content": "Walking"}}]},
+                "Date": {"date": {"start": day.isoformat()}},
+                "Total Steps": {"number": steps['totalSteps']},
+                "Step Goal": {"number": steps['stepGoal']},
+                "Total Distance (km)": {"number": round(steps['totalDistance'] / 1000, 2)},
+            })
+        if day < garmin.today:
+            notion.pages.create(parent={"database_id": CONFIG["NOTION_SLEEP_DB_ID"]}, properties={
+                "Date": {"title": [{"text": {"content": day.strftime("%d.%m.%Y")}}]},
+                "Long Date": {"date": {"start": day.isoformat()}},
+            })
+            summary = garmin.get_user_summary(day.isoformat())
+            notion.pages.create(parent={"database_id": CONFIG["NOTION_HEALTH_DB_ID"]}, properties={
+                "Date": {"date": {"start": day.isoformat()}},
+                "HRV (ms)": {"number": summary['hrvStatus']['lastNightAvg']},
+                "Body Battery Max": {"number": summary['bodyBatteryHighestValue']},
+                "Stress Avg": {"number": summary['averageStressLevel']},
+            })
+
+    for gear_id in range(500, 505):
+        notion.pages.create(parent={"database_id": CONFIG["NOTION_GEAR_DB_ID"]}, properties={
+            "Name": {"title": [{"text": {"content": f"Shoe {gear_id}"}}]},
+            "Garmin ID": {"rich_text": [{"text": {"content": str(gear_id)}}]},
+        })
+
+    notion.pages.create(parent={"database_id": CONFIG["NOTION_COACH_DB_ID"]}, properties={
+        "Name": {"title": [{"text": {"content": "Week Analysis: seed"}}]},
+        "Date": {"date": {"start": (garmin.today - datetime.timedelta(days=7)).isoformat()}},
+    })
+
+# Calls that change Notion; a stage that makes none only ran its no-op path
+NOTION_WRITES = ("pages.create", "pages.update", "blocks.children.append")
+
+def summarize_calls(snapshot):
+    """Call counts per service (garmin, notion, llm), Notion writes, 429s and retries"""
+    summary = {"notion_writes": 0}
+    for name, stats in snapshot['calls'].items():
+        service = name.split(".")[0]
+        summary[f"{service}_calls"] = summary.get(f"{service}_calls", 0) + stats['count']
+        if service == "notion" and name.endswith(NOTION_WRITES):
+            summary["notion_writes"] += stats['count'] - stats['errors']
+        summary["rate_limited"] = summary.get("rate_limited", 0) + stats['rate_limited']
+        summary["retries"] = summary.get("retries", 0) + stats['retries']
+    return summary
+
+def run_benchmark(scale, stages, rate_limit=None, latency=0.0, garmin_limit=None):
+    """Runs each stage once against fresh fakes of the given scale; returns one result row per stage"""
+    garmin = FakeGarmin(scale, latency=latency, max_concurrency=garmin_limit)
+    notion = FakeNotion(latency=latency)
+    seed_notion(notion, garmin)
+    notion.rate_limit = rate_limit
+
+    rows = []
+    controller = None
+    with tempfile.TemporaryDirectory() as state_dir, use_state_dir(state_dir):
+        for stage in stages:
+            registry = Metrics()
+            with collect_metrics(registry):
+                # One adaptive Garmin limit for all stages, learned from scratch in the temporary state folder
+                if controller is None:
+                    controller = AdaptiveConcurrency()
+                stage_garmin = Adaptive(instrument(garmin, "garmin"), controller)
+                stage_notion = instrument(notion, "notion")
+                if rate_limit:
+                    stage_notion = Throttled(stage_notion, RateLimiter(rate_limit, notion.burst))
+
+                started = time.perf_counter()
+                error = None
+                try:
+                    with profiled(f"benchmark-{scale}-{stage}"):
+                        load_stage(stage)(stage_garmin, stage_notion, CONFIG)
+                except Exception as e:
+                    error = str(e)
+                wall_ms = (time.perf_counter() - started) * 1000
+
+            row = {"scale": scale, "stage": stage, "wall_ms": round(wall_ms, 1), "error": error}
+            row.update(summarize_calls(registry.snapshot()))
+            if error is None and not row["notion_writes"]:
+                row["error"] = "no Notion writes: the seed data gave the stage nothing to do"
+            rows.append(row)
+    return rows
+
+def print_table(rows):
+    columns = ["scale", "stage", "wall_ms", "garmin_calls", "notion_calls", "notion_writes", "llm_calls", "rate_limited", "retries", "error"]
+    print(" | ".join(f"{c:>12}" for c in columns))
+    for row in rows:
+        print(" | ".join(f"{str(row.get(c, 0) if row.get(c) is not None else ''):>12}" for c in columns))
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of every sync stage against local fakes")
+    parser.add_argument("--scales", default="10,1000,10000", help="Comma separated entity counts")
+    parser.add_argument("--stages", default=",".join(STAGE_NAMES), help="Comma separated stage names")
+    parser.add_argument("--rate-limit", type=float, help="Make the fake Notion API answer 429 above this many requests/s")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated seconds per API call")
+    parser.add_argument("--garmin-limit", type=int, help="Make the fake Garmin answer 429 above this many parallel calls")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    parser.add_argument("--profile", action="store_true", help="Profile each stage (see profiling.py)")
+    args = parser.parse_args()
+    if args.profile:
+        enable_profiling()
+
+    stages = [s for s in args.stages.split(",") if s]
+    rows = []
+    for scale in [int(s) for s in args.scales.split(",")]:
+        print(f"Benchmarking {len(stages)} stages at scale {scale}...")
+        rows += run_benchmark(scale, stages, args.rate_limit, args.latency, args.garmin_limit)
+
+    print_table(rows)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+import os
+import numpy as np
+import async_io
+from sync_state import load_state, save_state
+from instrumentation import instrument, timed_stage
+
+# Best efforts computed locally from activity streams.
+# Distance efforts: fastest time over the distance (meters).
+DISTANCE_EFFORTS = {
+    "400m": 400,
+    "1K": 1000,
+    "1mi": 1609.34,
+    "5K": 5000,
+    "10K": 10000,
+    "Half Marathon": 21097.5,
+    "Marathon": 42195,
+}
+
+# Power efforts: highest average power over the window (seconds).
+POWER_EFFORTS = {
+    "5s Power": 5,
+    "1 min Power": 60,
+    "5 min Power": 300,
+    "20 min Power": 1200,
+    "60 min Power": 3600,
+}
+
+RUNNING_TYPES = {"running", "trail_running", "treadmill_running", "track_running", "street_running"}
+
+STATE_NAME = "best_efforts"
+PAGE_SIZE = 100
+
+def extract_streams(details):
+    """
+    Turns a get_activity_details() response into NumPy arrays.
+    Returns (elapsed_seconds, cumulative_distance_m, power_w); any stream may be None.
+    """
+    descriptors = {d['key']: d['metricsIndex'] for d in details.get('metricDescriptors', [])}
+    rows = [row['metrics'] for row in details.get('activityDetailMetrics', [])]
+    if not rows or 'sumElapsedDuration' not in descriptors:
+        return None, None, None
+
+    # dtype=float turns missing (None) samples into NaN
+    table = np.array(rows, dtype=float)
+
+    def column(key):
+        idx = descriptors.get(key)
+        if idx is None or np.isnan(table[:, idx]).all():
+            return None
+        return table[:, idx]
+
+    return column('sumElapsedDuration'), column('sumDistance'), column('directPower')
+
+def best_distance_times(elapsed, distance, targets):
+    """
+    Fastest time for each target distance.
+    For every sample j, the start point is where cumulative distance equals
+    distance[j] - target; np.interp finds its time for all j at once.
+    """
+    valid = ~(np.isnan(elapsed) | np.isnan(distance))
+    t, d = elapsed[valid], np.maximum.accumulate(distance[valid])
+    results = {}
+    if len(d) < 2:
+        return results
+    for name, target in targets.items():
+        ends = d >= d[0] + target
+        if not ends.any():
+            continue
+        start_times = np.interp(d[ends] - target, d, t)
+        results[name] = float(np.min(t[ends] - start_times))
+    return results
+
+def best_power(elapsed, power, windows):
+    """
+    Highest average power for each window, on a 1 Hz resampled stream.
+    Rolling means come from a single cumulative sum.
+    """
+    valid = ~(np.isnan(elapsed) | np.isnan(power))
+    t, p = elapsed[valid], power[valid]
+    results = {}
+    if len(t) < 2:
+        return results
+    grid = np.arange(t[0], t[-1] + 1)
+    csum = np.concatenate(([0.0], np.cumsum(np.interp(grid, t, p))))
+    for name, window in windows.items():
+        if len(grid) < window:
+            continue
+        rolling = (csum[window:] - csum[:-window]) / window
+        results[name] = float(rolling.max())
+    return results
+
+def compute_activity_efforts(activity, details):
+    """Best efforts found in one activity: {effort_name: value}"""
+    elapsed, distance, power = extract_streams(details)
+    if elapsed is None:
+        return {}
+
+    efforts = {}
+    sport = activity.get('activityType', {}).get('typeKey')
+    if distance is not None and sport in RUNNING_TYPES:
+        efforts.update(best_distance_times(elapsed, distance, DISTANCE_EFFORTS))
+    if power is not None:
+        efforts.update(best_power(elapsed, power, POWER_EFFORTS))
+    return efforts
+
+def is_better(effort_name, value, current):
+    if current is None:
+        return True
+    if effort_name in POWER_EFFORTS:
+        return value > current['value']
+    return value < current['value']
+
+def merge_efforts(table, activity, efforts):
+    """Merges one activity's efforts into the best-of table, returns changed effort names"""
+    changed = []
+    for name, value in efforts.items():
+        if is_better(name, value, table.get(name)):
+            table[name] = {
+                "value": value,
+                "activityId": activity['activityId'],
+                "activityName": activity.get('activityName'),
+                "date": activity['startTimeLocal'][:10],
+                "activityType": activity.get('activityType', {}).get('typeKey'),
+            }
+            changed.append(name)
+    return changed
+
+def get_new_activities(garmin, processed_ids):
+    """
+    Pages through activities (newest first) until a page contains only
+    activities that were already processed.
+    """
+    new_activities = []
+    start = 0
+    while True:
+        page = garmin.get_activities(start, PAGE_SIZE)
+        if not page:
+            break
+        fresh = [a for a in page if a['activityId'] not in processed_ids]
+        new_activities += fresh
+        if not fresh:
+            break
+        start += PAGE_SIZE
+    return new_activities
+
+def format_effort_value(effort_name, value):
+    if effort_name in POWER_EFFORTS:
+        return f"{round(value)} W", ""
+
+    total_seconds = round(value)
+    hours = total_seconds // 3600
+    minutes = (total_seconds % 3600) // 60
+    seconds = total_seconds % 60
+    if hours > 0:
+        formatted_value = f"{hours}:{minutes:02d}:{seconds:02d}"
+    else:
+        formatted_value = f"{minutes}:{seconds:02d}"
+
+    pace_seconds = round(value / (DISTANCE_EFFORTS[effort_name] / 1000))
+    formatted_pace = f"{pace_seconds // 60}:{pace_seconds % 60:02d} /km"
+    return formatted_value, formatted_pace
+
+def write_best_effort(client, database_id, effort_name, effort):
+    """Creates or updates the single page for an effort in the Best Efforts database"""
+    value, pace = format_effort_value(effort_name, effort['value'])
+    properties = {
+        "Record": {"title": [{"text": {"content": effort_name}}]},
+        "Date": {"date": {"start": effort['date']}},
+        "Activity Type": {"select": {"name": (effort['activityType'] or "other").replace('_', ' ').title()}},
+        "Value": {"rich_text": [{"text": {"content": value}}]},
+        "Activity ID": {"rich_text": [{"text": {"content": str(effort['activityId'])}}]},
+    }
+    if pace:
+        properties["Pace"] = {"rich_text": [{"text": {"content": pace}}]}
+
+    query = client.databases.query(
+        database_id=database_id,
+        filter={"property": "Record", "title": {"equals": effort_name}}
+    )
+    if query['results']:
+        client.pages.update(page_id=query['results'][0]['id'], properties=properties)
+    else:
+        client.pages.create(parent={"database_id": database_id}, properties=properties)
+
+def sync_best_efforts(garmin, client, database_id):
+    state = load_state(STATE_NAME, {"processed": [], "best": {}})
+    processed_ids = set(state['processed'])
+    table = state['best']
+
+    activities = get_new_activities(garmin, processed_ids)
+    print(f"Scanning {len(activities)} new activities for best efforts...")
+
+    changed = set()
+    for start in range(0, len(activities), PAGE_SIZE):
+        batch = activities[start:start + PAGE_SIZE]
+        # Details are fetched in parallel, as fast as Garmin allows (see throttle.Adaptive)
+        batch_details = async_io.garmin_many(garmin, "get_activity_details", [(a['activityId'],) for a in batch])
+        for activity, details in zip(batch, batch_details):
+            efforts = compute_activity_efforts(activity, details)
+            changed.update(merge_efforts(table, activity, efforts))
+            processed_ids.add(activity['activityId'])
+
+        # A long backfill resumes after the last finished batch
+        save_state(STATE_NAME, {"processed": sorted(processed_ids), "best": table})
+
+    for effort_name in sorted(changed):
+        effort = table[effort_name]
+        value, pace = format_effort_value(effort_name, effort['value'])
+        print(f"New best effort: {effort_name} - {value} ({effort['date']})")
+        if database_id:
+            write_best_effort(client, database_id, effort_name, effort)
+
+    if not changed:
+        print("No new best efforts.")
+
+def run(garmin, client, config):
+    sync_best_efforts(garmin, client, config.get("NOTION_BEST_EFFORTS_DB_ID"))
+
+def main():
+    from garminconnect import Garmin
+    from notion_client import Client
+
+    garmin_email = os.getenv("GARMIN_EMAIL")
+    garmin_password = os.getenv("GARMIN_PASSWORD")
+    notion_token = os.getenv("NOTION_TOKEN")
+
+    garmin = instrument(Garmin(garmin_email, garmin_password), "garmin")
+    garmin.login()
+    client = instrument(Client(auth=notion_token), "notion")
+
+    with timed_stage("best-efforts"):
+        run(garmin, client, os.environ)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+"""
+Single entry point for every sync stage and tool:
+
+    python cli.py activities            (any stage: prs, steps, sleep, coach, ...)
+    python cli.py all                   (every stage whose database is configured)
+    python cli.py reconcile --dry-run
+    python cli.py snapshot [--full | --sql "SELECT ..."]
+    python cli.py coach-batch --weeks 12 [--roster tenants.json]
+    python cli.py status | report
+    python cli.py --profile-startup status
+    python cli.py --profile activities
+
+Only the standard library is imported up front. Stage scripts, client
+libraries and clients are loaded when a command needs them.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import importlib
+import subprocess
+from stages import STAGE_NAMES, enabled_stages, load_stage, needs_garmin
+
+# Rows shown by --profile-startup
+PROFILE_TOP = 15
+
+def load_env():
+    from dotenv import load_dotenv
+    load_dotenv()
+
+def client_modules(stages):
+    """Client libraries the given stages will import once their clients are created"""
+    modules = ["notion_client"]
+    if any(needs_garmin(stage) for stage in stages):
+        modules.insert(0, "garminconnect")
+    return modules
+
+def run_stages(stages, args):
+    runs = [(stage, load_stage(stage)) for stage in stages]
+    if args.imports_only:
+        for module in client_modules(stages):
+            importlib.import_module(module)
+        return
+
+    from clients import make_garmin, make_notion
+    from instrumentation import timed_stage
+
+    load_env()
+    garmin = make_garmin(os.environ) if any(needs_garmin(stage) for stage in stages) else None
+    notion = make_notion(os.environ)
+    for stage, run in runs:
+        with timed_stage(stage):
+            run(garmin, notion, os.environ)
+
+def stage_command(args):
+    if getattr(args, "backfill", None) and args.command in ("activities", "steps"):
+        return backfill_command(args)
+    run_stages([args.command], args)
+
+def backfill_command(args):
+    script = importlib.import_module("garmin-activities" if args.command == "activities" else "daily-steps")
+    if args.imports_only:
+        for module in client_modules([args.command]):
+            importlib.import_module(module)
+        return
+
+    from clients import make_garmin, make_notion
+    from instrumentation import timed_stage
+
+    load_env()
+    garmin, notion = make_garmin(os.environ), make_notion(os.environ)
+    with timed_stage(args.command):
+        if args.command == "activities":
+            script.backfill_activities(garmin, notion, os.getenv("NOTION_DB_ID"))
+        else:
+            script.backfill_daily_steps(garmin, notion, os.getenv("NOTION_STEPS_DB_ID"), args.backfill)
+
+def all_command(args):
+    load_env()
+    stages = enabled_stages(os.environ)
+    if not stages:
+        print("No stage has its Notion database configured.")
+        return
+    run_stages(stages, args)
+
+def reconcile_command(args):
+    reconcile = importlib.import_module("reconcile")
+    if args.imports_only:
+        for module in client_modules(["activities"]):
+            importlib.import_module(module)
+        return
+    load_env()
+    reconcile.main(args)
+
+def snapshot_command(args):
+    snapshot = importlib.import_module("snapshot")
+    if args.imports_only:
+        if not args.sql:
+            importlib.import_module("notion_client")
+        return
+    load_env()
+    snapshot.main(args)
+
+def coach_batch_command(args):
+    coach_batch = importlib.import_module("coach-batch")
+    if args.imports_only:
+        importlib.import_module("notion_client")
+        return
+    load_env()
+    coach_batch.main(args)
+
+def status_command(args):
+    """Local state only: pending journal entries and the last reconciliation"""
+    from journal import Journal
+    from sync_state import current_state_dir, load_state
+    if args.imports_only:
+        return
+
+    print(f"State folder: {current_state_dir()}")
+    pending = Journal().pending()
+    print(f"Pending Notion writes: {len(pending)}")
+    for row in pending[:10]:
+        print(f"  {row['op']} {row['key']}")
+    failed = Journal().failed()
+    if failed:
+        print(f"Failed Notion writes (given up during recovery): {len(failed)}")
+        for row in failed[-10:]:
+            print(f"  {row['op']} {row['key']}: {row['error']}")
+
+    status = load_state("reconcile_status")
+    if not status:
+        print("Reconciliation: never run")
+        return
+    print(f"Reconciliation: {status['checked']} ({status['months']} months{'' if status['repaired'] else ', dry run'})")
+    for name, stats in status['domains'].items():
+        drift = stats['missing'] + stats['different']
+        print(f"  {name}: {stats['months'] - len(stats['differing_months'])}/{stats['months']} months in sync "
+              f"({stats.get('checked_months', stats['months'])} read), "
+              f"{drift} entries {'repaired' if status['repaired'] else 'to repair'}, {stats['only_in_notion']} only in Notion")
+
+def report_command(args):
+    """Summary of a performance report (the latest one by default)"""
+    from instrumentation import REPORT_DIR
+    if args.imports_only:
+        return
+
+    path = args.file
+    if not path:
+        reports = [os.path.join(REPORT_DIR, f) for f in os.listdir(REPORT_DIR) if f.endswith(".json")] if os.path.isdir(REPORT_DIR) else []
+        if not reports:
+            print(f"No reports in {REPORT_DIR}/")
+            return
+        path = max(reports, key=os.path.getmtime)
+
+    with open(path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    print(f"Run {report.get('run_id')} ({path})")
+    for name, stats in sorted(report.get('stages', {}).items()):
+        print(f"  stage {name:<28} {stats['total_s']:>8.1f}s  runs {stats['runs']}  errors {stats['errors']}")
+    for name, stats in sorted(report.get('calls', {}).items(), key=lambda item: -item[1]['total_ms']):
+        avg = stats['total_ms'] / stats['count'] if stats['count'] else 0
+        print(f"  {name:<34} {stats['count']:>6} calls  avg {avg:>7.0f}ms  429s {stats['rate_limited']}  retries {stats['retries']}")
+
+def profile_startup(argv):
+    """Re-runs the command with `python -X importtime`, importing what it needs without running it"""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", os.path.abspath(__file__), "--imports-only", *argv],
+        stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, text=True
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if result.returncode != 0:
+        print(result.stderr)
+        return result.returncode
+
+    # Lines look like "import time:   self [us] | cumulative | <indent>package";
+    # only top-level imports are listed, nested ones are part of their cumulative time
+    top_level = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        if name[1:2] == " ":
+            continue
+        top_level.append((int(cumulative_us) / 1000, name.strip()))
+
+    total_ms = sum(ms for ms, _ in top_level)
+    print(f"Startup of `{' '.join(argv)}`: {wall_ms:.0f}ms wall, {total_ms:.0f}ms importing")
+    for ms, name in sorted(top_level, reverse=True)[:PROFILE_TOP]:
+        print(f"  {ms:>8.1f}ms  {name}")
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Garmin to Notion sync")
+    parser.add_argument("--profile-startup", action="store_true", help="Show where the command's startup time goes instead of running it")
+    parser.add_argument("--profile", action="store_true", help="Profile each stage (see profiling.py)")
+    parser.add_argument("--imports-only", action="store_true", help=argparse.SUPPRESS)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    for stage in STAGE_NAMES:
+        stage_parser = commands.add_parser(stage, help=f"Run the {stage} stage")
+        stage_parser.set_defaults(handler=stage_command)
+        if stage == "activities":
+            stage_parser.add_argument("--backfill", action="store_true", help="Import the whole activity history")
+        elif stage == "steps":
+            stage_parser.add_argument("--backfill", type=int, metavar="DAYS", help="Import the last DAYS days")
+
+    commands.add_parser("all", help="Run every stage whose Notion database is configured").set_defaults(handler=all_command)
+
+    reconcile_parser = commands.add_parser("reconcile", help="Find and repair drift between Garmin and Notion")
+    reconcile_parser.add_argument("--months", type=int, default=12, help="How many months back to check")
+    reconcile_parser.add_argument("--domains", default="activities,sleep,steps", help="Comma separated: activities, sleep, steps")
+    reconcile_parser.add_argument("--dry-run", action="store_true", help="Only report differences")
+    reconcile_parser.set_defaults(handler=reconcile_command)
+
+    snapshot_parser = commands.add_parser("snapshot", help="Export the Notion databases into a local SQLite snapshot")
+    snapshot_parser.add_argument("--full", action="store_true", help="Re-export everything (drops pages archived in Notion)")
+    snapshot_parser.add_argument("--sql", help="Query the snapshot instead of exporting")
+    snapshot_parser.set_defaults(handler=snapshot_command)
+
+    coach_batch_parser = commands.add_parser("coach-batch", help="Generate coach reports for several weeks and athletes at once")
+    coach_batch_parser.add_argument("--roster", help="Tenant roster (see multi-tenant-sync.py); default: the environment as one athlete")
+    coach_batch_parser.add_argument("--athletes", help="Comma separated athlete names from the roster")
+    coach_batch_parser.add_argument("--weeks", type=int, default=4, help="The last N complete weeks (default 4)")
+    coach_batch_parser.add_argument("--from", dest="first", type=datetime.date.fromisoformat, help="First day (YYYY-MM-DD), instead of --weeks")
+    coach_batch_parser.add_argument("--to", dest="last", type=datetime.date.fromisoformat, help="Last day (YYYY-MM-DD, default: today)")
+    coach_batch_parser.set_defaults(handler=coach_batch_command)
+
+    commands.add_parser("status", help="Pending writes and last reconciliation (no network)").set_defaults(handler=status_command)
+
+    report_parser = commands.add_parser("report", help="Summarize a performance report (no network)")
+    report_parser.add_argument("file", nargs="?", help="Report file (default: the latest one)")
+    report_parser.set_defaults(handler=report_command)
+    return parser
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = build_parser().parse_args(argv)
+    if args.profile_startup:
+        return profile_startup([a for a in argv if a not in ("--profile-startup", "--profile")])
+    if args.profile:
+        import profiling
+        profiling.enable()
+    args.handler(args)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
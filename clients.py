@@ -0,0 +1,31 @@
+import threading
+from instrumentation import instrument
+from throttle import Adaptive, garmin_concurrency
+
+# The client libraries are imported here, on first use, so scripts and
+# commands that never talk to Garmin or Notion do not pay for them.
+
+def make_garmin(config):
+    """Logged-in, instrumented and adaptively limited Garmin Connect session"""
+    from garminconnect import Garmin
+
+    garmin = instrument(Garmin(config.get("GARMIN_EMAIL"), config.get("GARMIN_PASSWORD")), "garmin")
+    # Every stage of the account shares one adaptive limit on parallel calls
+    garmin = Adaptive(garmin, garmin_concurrency(config.get("GARMIN_EMAIL")))
+    garmin.login()
+    return garmin
+
+# One Notion client per token for the whole process, so every stage and
+# every job of a tenant reuses the same keep-alive connections
+_notion_clients = {}
+_notion_clients_lock = threading.Lock()
+
+def make_notion(config):
+    """Instrumented Notion client (shared by everything using the same token)"""
+    from notion_client import Client
+
+    token = config.get("NOTION_TOKEN")
+    with _notion_clients_lock:
+        if token not in _notion_clients:
+            _notion_clients[token] = Client(auth=token)
+        return instrument(_notion_clients[token], "notion")
@@ -0,0 +1,260 @@
+import os
+import json
+import hashlib
+import argparse
+import datetime
+import importlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import async_io
+from journal import Journal
+from pipeline import run_pipeline
+from sync_state import STATE_DIR, current_state_dir, use_state_dir
+from throttle import RateLimiter, Throttled
+from training_load import update_training_load
+from instrumentation import timed_stage
+
+coach = importlib.import_module("garmin-coach")
+
+# Coach reports for many (athlete, week) targets in one run, e.g. a season of
+# weekly reports or a whole squad:
+# 1. the activity, health and report windows of all targets are read with one
+#    query per database and token, all sent at once (async_io),
+# 2. the LLM requests run in parallel under a rate limit,
+# 3. the reports stream through a bounded queue into one journaled writer.
+
+# LLM requests per second and in flight at once, per API key
+LLM_RATE = float(os.getenv("COACH_LLM_RATE", 2.0))
+LLM_BURST = 4
+LLM_CONCURRENCY = int(os.getenv("COACH_LLM_CONCURRENCY", 4))
+# Finished reports waiting for the writer; a slow writer holds back the LLM requests
+WRITE_QUEUE_SIZE = 4
+
+def week_start(day):
+    return day - datetime.timedelta(days=day.weekday())
+
+def week_name(start):
+    year, week, _ = start.isocalendar()
+    return f"{year}-W{week:02d}"
+
+def report_name(start):
+    return f"Week Analysis: {week_name(start)}"
+
+def last_weeks(count, today=None):
+    """Mondays of the last `count` complete weeks, oldest first"""
+    current = week_start(today or datetime.date.today())
+    return [current - datetime.timedelta(weeks=i) for i in range(count, 0, -1)]
+
+def weeks_between(first, last):
+    """Mondays of the weeks from the day `first` to the day `last`"""
+    weeks = []
+    start = week_start(first)
+    while start <= last:
+        weeks.append(start)
+        start += datetime.timedelta(weeks=1)
+    return weeks
+
+def load_athletes(roster_path=None, names=None):
+    """
+    Athletes as {"name", "config", "state_dir"}: the tenants of a multi-tenant
+    roster (see multi-tenant-sync.py), or the environment as one athlete.
+    """
+    if not roster_path:
+        return [{"name": "default", "config": os.environ, "state_dir": current_state_dir()}]
+    roster = importlib.import_module("multi-tenant-sync").load_roster(roster_path)
+    return [
+        {"name": tenant['name'], "config": tenant, "state_dir": os.path.join(STATE_DIR, tenant['name'])}
+        for tenant in roster if not names or tenant['name'] in names
+    ]
+
+def _page_day(page):
+    date = (page['properties'].get('Date') or {}).get('date') or {}
+    return datetime.date.fromisoformat(date['start'][:10]) if date.get('start') else None
+
+def fetch_windows(targets):
+    """
+    Pages of the targets' weeks, grouped as {(token, database ID): {week start: [pages]}}.
+    Targets reading the same database with the same token share one query
+    covering all of their weeks; every query is sent at once.
+    """
+    spans, clients = {}, {}
+    for athlete, start in targets:
+        config = athlete['config']
+        for setting in ("NOTION_DB_ID", "NOTION_HEALTH_DB_ID", "NOTION_COACH_DB_ID"):
+            database_id = config.get(setting)
+            if not database_id:
+                continue
+            key = (config.get("NOTION_TOKEN"), database_id)
+            first, last = spans.get(key, (start, start))
+            spans[key] = (min(first, start), max(last, start))
+            clients[key] = athlete['notion']
+
+    keys = list(spans)
+    results = async_io.gather(*[
+        async_io.query_all(clients[key], database_id=key[1], filter={"and": [
+            {"property": "Date", "date": {"on_or_after": spans[key][0].isoformat()}},
+            {"property": "Date", "date": {"on_or_before": (spans[key][1] + datetime.timedelta(days=6)).isoformat()}},
+        ]})
+        for key in keys
+    ])
+    print(f"Read the windows of {len(targets)} reports with {len(keys)} queries")
+
+    windows = {}
+    for key, pages in zip(keys, results):
+        weeks = windows.setdefault(key, {})
+        for page in pages:
+            day = _page_day(page)
+            if day:
+                weeks.setdefault(week_start(day), []).append(page)
+    return windows
+
+def week_pages(windows, athlete, setting, start):
+    config = athlete['config']
+    return windows.get((config.get("NOTION_TOKEN"), config.get(setting)), {}).get(start, [])
+
+def log_text(pages, line):
+    lines = [line(page) for page in sorted(pages, key=_page_day)]
+    return "\n".join(l for l in lines if l)
+
+def training_load_rows(athlete):
+    """{day: [load, atl, ctl, tsb]} from the athlete's training load state, brought up to date once"""
+    activities_db_id = athlete['config'].get("NOTION_DB_ID")
+    if not activities_db_id:
+        return {}
+    try:
+        with use_state_dir(athlete['state_dir']):
+            return update_training_load(athlete['notion'], activities_db_id)['daily']
+    except Exception as e:
+        print(f"[{athlete['name']}] Could not compute training load: {e}")
+        return {}
+
+def build_jobs(targets, windows):
+    """One LLM job per target with data and without a report (a Coach page dated in its week) yet"""
+    loads = {}
+    jobs = []
+    for athlete, start in targets:
+        end = start + datetime.timedelta(days=6)
+        # Any Coach page dated in the week counts, including the scheduled coach's "Week Analysis: <date>"
+        if week_pages(windows, athlete, "NOTION_COACH_DB_ID", start):
+            continue
+
+        activity_text = log_text(week_pages(windows, athlete, "NOTION_DB_ID", start), coach.activity_line)
+        health_text = log_text(week_pages(windows, athlete, "NOTION_HEALTH_DB_ID", start), coach.health_line)
+        if athlete['name'] not in loads:
+            loads[athlete['name']] = training_load_rows(athlete)
+        daily = loads[athlete['name']]
+        load_text = coach.training_load_text([
+            {"date": day.isoformat(), "load": v[0], "atl": v[1], "ctl": v[2], "tsb": v[3]}
+            for day in (start + datetime.timedelta(days=i) for i in range(7))
+            if (v := daily.get(day.isoformat()))
+        ])
+        with use_state_dir(athlete['state_dir']):
+            intraday_text = coach.get_intraday_text(7, end=end)
+        if intraday_text:
+            health_text = f"{health_text}\nIntraday (from watch curves):\n{intraday_text}"
+        if activity_text or health_text:
+            jobs.append({
+                "athlete": athlete, "start": start, "texts": (activity_text, health_text, load_text),
+                "llm": llm_client(athlete['config']),
+            })
+    return jobs
+
+# Created while the jobs are built (single thread), shared by the LLM worker threads
+_llm_clients = {}
+
+def llm_client(config):
+    """Rate limited LLM client, one per API key (or one for the local stand-in)"""
+    key = (config.get("COACH_LLM"), config.get("OPENAI_API_KEY"))
+    if key not in _llm_clients:
+        _llm_clients[key] = Throttled(coach.make_llm_client(config), RateLimiter(LLM_RATE, LLM_BURST), "llm")
+    return _llm_clients[key]
+
+def ask(job):
+    start = job['start']
+    period = f"week {week_name(start)} ({start} to {start + datetime.timedelta(days=6)})"
+    try:
+        return job, coach.generate_coaching_insight(job['llm'], *job['texts'], period=period)
+    except Exception as e:
+        print(f"[{job['athlete']['name']}] {report_name(start)} failed: {e}")
+        return job, None
+
+def ask_all(jobs):
+    """Yields (job, insight JSON or None) as the LLM answers come in"""
+    with ThreadPoolExecutor(max_workers=LLM_CONCURRENCY, thread_name_prefix="llm") as pool:
+        for future in as_completed([pool.submit(ask, job) for job in jobs]):
+            yield future.result()
+
+def to_write(item):
+    job, insight = item
+    if not insight:
+        return None
+    start = job['start']
+    database_id = job['athlete']['config'].get("NOTION_COACH_DB_ID")
+    name = report_name(start)
+    date = {"start": start.isoformat(), "end": (start + datetime.timedelta(days=6)).isoformat()}
+    payload = {"parent": {"database_id": database_id}, "properties": coach.report_properties(json.loads(insight), name, date)}
+    digest = hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:16]
+    return job['athlete'], f"coach-report:{database_id}:{week_name(start)}:{digest}", payload, {
+        "database_id": database_id,
+        "filter": {"property": "Name", "title": {"equals": name}}
+    }
+
+def generate_reports(targets):
+    """Writes a coach report for each (athlete, week start) target that has none; returns {"written", "failed", "skipped"}"""
+    athletes = {athlete['name']: athlete for athlete, _ in targets}
+    journals = {}
+    for name, athlete in athletes.items():
+        with use_state_dir(athlete['state_dir']):
+            journals[name] = Journal()
+            recovered = journals[name].recover(athlete['notion'])
+        if recovered:
+            print(f"[{name}] Recovered {recovered} pending mutations from the last run")
+
+    jobs = build_jobs(targets, fetch_windows(targets))
+    print(f"Asking the AI Coach for {len(jobs)} reports ({len(targets) - len(jobs)} skipped)")
+    counts = {"written": 0, "failed": 0, "skipped": len(targets) - len(jobs)}
+
+    def write(item):
+        athlete, key, payload, lookup = item
+        try:
+            journals[athlete['name']].execute(athlete['notion'], key, "create", payload, lookup)
+            counts["written"] += 1
+            print(f"[{athlete['name']}] Saved {payload['properties']['Name']['title'][0]['text']['content']}")
+        except Exception as e:
+            counts["failed"] += 1
+            print(f"[{athlete['name']}] Error writing {key}: {e}")
+
+    run_pipeline(ask_all(jobs), [to_write], write, maxsize=WRITE_QUEUE_SIZE)
+    counts["failed"] += len(jobs) - counts["written"] - counts["failed"]
+    return counts
+
+def add_arguments(parser):
+    parser.add_argument("--roster", help="Tenant roster (see multi-tenant-sync.py); default: the environment as one athlete")
+    parser.add_argument("--athletes", help="Comma separated athlete names from the roster")
+    parser.add_argument("--weeks", type=int, default=4, help="The last N complete weeks (default 4)")
+    parser.add_argument("--from", dest="first", type=datetime.date.fromisoformat, help="First day (YYYY-MM-DD), instead of --weeks")
+    parser.add_argument("--to", dest="last", type=datetime.date.fromisoformat, help="Last day (YYYY-MM-DD, default: today)")
+
+def main(args=None):
+    from clients import make_notion
+    from throttle import notion_limiter
+
+    if args is None:
+        parser = argparse.ArgumentParser(description="Generate coach reports for several weeks and athletes at once")
+        add_arguments(parser)
+        args = parser.parse_args()
+
+    athletes = load_athletes(args.roster, args.athletes.split(",") if args.athletes else None)
+    for athlete in athletes:
+        token = athlete['config'].get("NOTION_TOKEN")
+        athlete['notion'] = Throttled(make_notion(athlete['config']), notion_limiter(token))
+    weeks = weeks_between(args.first, args.last or datetime.date.today()) if args.first else last_weeks(args.weeks)
+    targets = [(athlete, start) for athlete in athletes for start in weeks]
+
+    with timed_stage("coach-batch"):
+        counts = generate_reports(targets)
+    print(f"Coach reports: {counts['written']} written, {counts['skipped']} skipped, {counts['failed']} failed")
+    if counts["failed"]:
+        exit(1)
+
+if __name__ == '__main__':
+    main()
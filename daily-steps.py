@@ -1,8 +1,11 @@
 from datetime import date, timedelta
-from garminconnect import Garmin
-from notion_client import Client
 from dotenv import load_dotenv
 import os
+from instrumentation import instrument, timed_stage
+from pipeline import run_pipeline
+from throttle import GARMIN_MAX_CONCURRENCY
+import async_io
+import sys
 
 def get_all_daily_steps(garmin):
     """
@@ -67,41 +70,105 @@ def update_daily_steps(client, existing_steps, new_steps):
         
     client.pages.update(**update)
 
-def create_daily_steps(client, database_id, steps):
-    """
-    Create a new daily steps entry in the Notion database.
-    """
+def build_steps_properties(steps):
+    """Maps a Garmin daily steps entry to Notion page properties"""
     total_distance = steps.get('totalDistance')
     if total_distance is None:
         total_distance = 0
-    properties = {
+    return {
         "Activity Type": {"title": [{"text": {"content": "Walking"}}]},
         "Date": {"date": {"start": steps.get('calendarDate')}},
         "Total Steps": {"number": steps.get('totalSteps')},
         "Step Goal": {"number": steps.get('stepGoal')},
         "Total Distance (km)": {"number": round(total_distance / 1000, 2)}
     }
-    
+
+def create_daily_steps(client, database_id, steps):
+    """
+    Create a new daily steps entry in the Notion database.
+    """
     page = {
         "parent": {"database_id": database_id},
-        "properties": properties,
+        "properties": build_steps_properties(steps),
     }
     
     client.pages.create(**page)
 
-def main():
-    load_dotenv()
+# Garmin returns at most 28 days of daily steps per request
+BACKFILL_CHUNK_DAYS = 28
 
-    # Initialize Garmin and Notion clients using environment variables
-    garmin_email = os.getenv("GARMIN_EMAIL")
-    garmin_password = os.getenv("GARMIN_PASSWORD")
-    notion_token = os.getenv("NOTION_TOKEN")
-    database_id = os.getenv("NOTION_STEPS_DB_ID")
+def fetch_daily_steps_chunks(garmin, days):
+    """
+    Yields daily steps for the last `days` days (excl. today), one chunk per request.
+    Chunks are fetched in parallel windows, as fast as Garmin allows (see throttle.Adaptive).
+    """
+    end = date.today() - timedelta(days=1)
+    start = end - timedelta(days=days - 1)
+    ranges = []
+    while start <= end:
+        chunk_end = min(start + timedelta(days=BACKFILL_CHUNK_DAYS - 1), end)
+        ranges.append((start.isoformat(), chunk_end.isoformat()))
+        start = chunk_end + timedelta(days=1)
 
-    # Initialize Garmin client and login
-    garmin = Garmin(garmin_email, garmin_password)
-    garmin.login()
-    client = Client(auth=notion_token)
+    for window in range(0, len(ranges), GARMIN_MAX_CONCURRENCY):
+        yield from async_io.garmin_many(garmin, "get_daily_steps", ranges[window:window + GARMIN_MAX_CONCURRENCY])
+
+def existing_steps_by_date(client, database_id, first_date, last_date):
+    """
+    Get the Notion daily steps entries of a date range with one (paginated) query.
+    """
+    existing = {}
+    has_more = True
+    next_cursor = None
+    while has_more:
+        query = client.databases.query(
+            database_id=database_id,
+            filter={
+                "and": [
+                    {"property": "Date", "date": {"on_or_after": first_date}},
+                    {"property": "Date", "date": {"on_or_before": last_date}},
+                    {"property": "Activity Type", "title": {"equals": "Walking"}}
+                ]
+            },
+            start_cursor=next_cursor
+        )
+        for page in query['results']:
+            existing[page['properties']['Date']['date']['start'][:10]] = page
+        has_more = query['has_more']
+        next_cursor = query['next_cursor']
+    return existing
+
+def backfill_daily_steps(garmin, client, database_id, days):
+    """
+    Sync the last `days` days as a streaming pipeline (fetch chunk -> compare -> write),
+    so Garmin fetching overlaps with Notion writes and memory stays constant.
+    """
+    def plan_writes(chunk):
+        if not chunk:
+            return None
+        dates = [steps.get('calendarDate') for steps in chunk]
+        existing = existing_steps_by_date(client, database_id, min(dates), max(dates))
+        writes = []
+        for steps in chunk:
+            existing_steps = existing.get(steps.get('calendarDate'))
+            if existing_steps is None:
+                writes.append((None, steps))
+            elif steps_need_update(existing_steps, steps):
+                writes.append((existing_steps, steps))
+        return writes or None
+
+    def write(writes):
+        for existing_steps, steps in writes:
+            if existing_steps:
+                update_daily_steps(client, existing_steps, steps)
+            else:
+                create_daily_steps(client, database_id, steps)
+        print(f"Synced {len(writes)} days up to {writes[-1][1].get('calendarDate')}")
+
+    run_pipeline(fetch_daily_steps_chunks(garmin, days), [plan_writes], write)
+
+def run(garmin, client, config):
+    database_id = config.get("NOTION_STEPS_DB_ID")
 
     daily_steps = get_all_daily_steps(garmin)
     for steps in daily_steps:
@@ -113,5 +180,29 @@ def main():
         else:
             create_daily_steps(client, database_id, steps)
 
+def main():
+    from garminconnect import Garmin
+    from notion_client import Client
+
+    load_dotenv()
+
+    # Initialize Garmin and Notion clients using environment variables
+    garmin_email = os.getenv("GARMIN_EMAIL")
+    garmin_password = os.getenv("GARMIN_PASSWORD")
+    notion_token = os.getenv("NOTION_TOKEN")
+
+    # Initialize Garmin client and login
+    garmin = instrument(Garmin(garmin_email, garmin_password), "garmin")
+    garmin.login()
+    client = instrument(Client(auth=notion_token), "notion")
+
+    with timed_stage("steps"):
+        if "--backfill" in sys.argv:
+            # python daily-steps.py --backfill 365
+            days = int(sys.argv[sys.argv.index("--backfill") + 1])
+            backfill_daily_steps(garmin, client, os.getenv("NOTION_STEPS_DB_ID"), days)
+        else:
+            run(garmin, client, os.environ)
+
 if __name__ == '__main__':
     main()
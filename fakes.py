@@ -0,0 +1,381 @@
+"""
+Local stand-ins for Garmin Connect, the Notion API and the OpenAI client.
+They return data shaped like the real responses, so every stage can run
+offline (see benchmark.py).
+"""
+import json
+import time
+import uuid
+import random
+import datetime
+import threading
+from types import SimpleNamespace
+from notion_query import matches, query_response
+
+ACTIVITY_TYPES = ["running", "cycling", "walking", "trail_running", "swimming"]
+PR_TYPE_IDS = [1, 2, 3, 4, 7, 8, 9, 10, 12, 13, 14, 15]
+
+class FakeAPIError(Exception):
+    """Mirrors the attributes of notion_client.APIResponseError"""
+
+    def __init__(self, status, code, message, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+
+# --- GARMIN ---
+
+class FakeGarmin:
+    """
+    Synthetic Garmin Connect account with `scale` activities and `scale` days of daily data.
+    With `max_concurrency` set it answers 429 to calls above that many in flight.
+    """
+
+    def __init__(self, scale=100, seed=42, today=None, latency=0.0, max_concurrency=None):
+        self.scale = scale
+        self.latency = latency
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.lock = threading.Lock()
+        self.today = today or datetime.date.today()
+        rng = random.Random(seed)
+
+        self.activities = []
+        for i in range(scale):
+            start = datetime.datetime.combine(self.today, datetime.time(7)) - datetime.timedelta(hours=i * 20)
+            sport = ACTIVITY_TYPES[rng.randrange(len(ACTIVITY_TYPES))]
+            duration = rng.uniform(1200, 7200)
+            speed = {"cycling": 8.0, "swimming": 0.8, "walking": 1.4}.get(sport, 3.0) * rng.uniform(0.8, 1.2)
+            self.activities.append({
+                "activityId": 10_000_000 + scale - i,
+                "activityName": f"{sport.replace('_', ' ').title()} {i}",
+                "startTimeLocal": start.strftime("%Y-%m-%d %H:%M:%S"),
+                "activityType": {"typeKey": sport},
+                "distance": round(duration * speed, 1),
+                "duration": round(duration, 1),
+                "averageHR": rng.randint(110, 170),
+                "deviceId": 3_000_000,
+                "gear": {"gearPk": 500 + i % 5},
+            })
+        self.activity_index = {a['activityId']: a for a in self.activities}
+        self.days = [self.today - datetime.timedelta(days=i) for i in range(scale)]
+        self.rng = rng
+
+    def _call(self):
+        with self.lock:
+            self.in_flight += 1
+            overloaded = self.max_concurrency and self.in_flight > self.max_concurrency
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if overloaded:
+                raise FakeAPIError(429, "too_many_requests", "Too many requests", retry_after=self.latency)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def login(self):
+        self._call()
+
+    def get_activities(self, start=0, limit=20):
+        self._call()
+        return self.activities[start:start + limit]
+
+    def get_activities_by_date(self, startdate, enddate=None, activitytype=None):
+        self._call()
+        enddate = enddate or self.today.isoformat()
+        return [
+            a for a in self.activities
+            if startdate <= a['startTimeLocal'][:10] <= enddate
+            and (activitytype is None or a['activityType']['typeKey'] == activitytype)
+        ]
+
+    def get_activity_details(self, activity_id, maxchart=2000, maxpoly=4000):
+        self._call()
+        activity = self.activity_index.get(int(activity_id))
+        if activity is None:
+            return {}
+        rng = random.Random(activity_id)
+        samples = min(maxchart, int(activity['duration'] // 10))
+        step = activity['duration'] / samples
+        speed = activity['distance'] / activity['duration']
+        rows = []
+        distance = 0.0
+        for i in range(samples):
+            distance += step * speed * rng.uniform(0.8, 1.2)
+            rows.append({"metrics": [i * step, distance, rng.uniform(150, 300), rng.randint(110, 180)]})
+        return {
+            "metricDescriptors": [
+                {"metricsIndex": 0, "key": "sumElapsedDuration"},
+                {"metricsIndex": 1, "key": "sumDistance"},
+                {"metricsIndex": 2, "key": "directPower"},
+                {"metricsIndex": 3, "key": "directHeartRate"},
+            ],
+            "activityDetailMetrics": rows,
+        }
+
+    def get_personal_record(self):
+        self._call()
+        return [
+            {
+                "typeId": type_id,
+                "activityType": "running" if type_id < 7 else None,
+                "value": 200.0 * type_id,
+                "prStartTimeGmtFormatted": self.days[min(type_id, len(self.days) - 1)].isoformat(),
+            }
+            for type_id in PR_TYPE_IDS
+        ]
+
+    def get_daily_steps(self, start, end):
+        self._call()
+        day = datetime.date.fromisoformat(start)
+        last = datetime.date.fromisoformat(end)
+        result = []
+        while day <= last:
+            rng = random.Random(day.toordinal())
+            steps = rng.randint(2000, 20000)
+            result.append({
+                "calendarDate": day.isoformat(),
+                "totalSteps": steps,
+                "stepGoal": 10000,
+                "totalDistance": steps * 0.75,
+            })
+            day += datetime.timedelta(days=1)
+        return result
+
+    def get_sleep_data(self, cdate):
+        self._call()
+        rng = random.Random(f"sleep-{cdate}")
+        night = datetime.datetime.fromisoformat(cdate) - datetime.timedelta(hours=1, minutes=rng.randint(0, 90))
+        start_ms = int(night.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000)
+
+        # Sleep levels: 0 deep, 1 light, 2 REM, 3 awake
+        levels = []
+        cursor = start_ms
+        for _ in range(rng.randint(12, 24)):
+            length = rng.randint(5, 60) * 60_000
+            levels.append({
+                "startGMT": _gmt(cursor),
+                "endGMT": _gmt(cursor + length),
+                "activityLevel": float(rng.choice([0, 1, 1, 2, 3])),
+            })
+            cursor += length
+        end_ms = cursor
+
+        seconds = {0: 0, 1: 0, 2: 0, 3: 0}
+        for level in levels:
+            length = (_ms(level['endGMT']) - _ms(level['startGMT'])) // 1000
+            seconds[int(level['activityLevel'])] += length
+
+        return {
+            "dailySleepDTO": {
+                "calendarDate": cdate,
+                "sleepStartTimestampGMT": start_ms,
+                "sleepEndTimestampGMT": end_ms,
+                "deepSleepSeconds": seconds[0],
+                "lightSleepSeconds": seconds[1],
+                "remSleepSeconds": seconds[2],
+                "awakeSleepSeconds": seconds[3],
+            },
+            "sleepLevels": levels,
+            "sleepMovement": [
+                {"startGMT": _gmt(t), "endGMT": _gmt(t + 60_000), "activityLevel": rng.random() * 3}
+                for t in range(start_ms, end_ms, 60_000)
+            ],
+            "sleepHeartRate": [{"value": rng.randint(45, 70), "startGMT": t} for t in range(start_ms, end_ms, 120_000)],
+            "wellnessEpochSPO2DataDTOList": [
+                {"epochTimestamp": _gmt(t), "spo2Reading": rng.randint(90, 99)}
+                for t in range(start_ms, end_ms, 60_000)
+            ],
+            "restingHeartRate": rng.randint(45, 60),
+        }
+
+    def get_heart_rates(self, cdate):
+        self._call()
+        rng = random.Random(f"hr-{cdate}")
+        start_ms = _ms(f"{cdate}T00:00:00")
+        return {
+            "calendarDate": cdate,
+            "startTimestampGMT": _gmt(start_ms),
+            "heartRateValues": [
+                [t, None if rng.random() < 0.05 else rng.randint(50, 150)]
+                for t in range(start_ms, start_ms + 86_400_000, 120_000)
+            ],
+        }
+
+    def get_stress_data(self, cdate):
+        self._call()
+        rng = random.Random(f"stress-{cdate}")
+        start_ms = _ms(f"{cdate}T00:00:00")
+        level = rng.randint(40, 90)
+        body_battery = []
+        for t in range(start_ms, start_ms + 86_400_000, 180_000):
+            level = min(100, max(5, level + rng.choice([-1, -1, 0, 1])))
+            body_battery.append([t, "MEASURED", level, 2.0])
+        return {
+            "calendarDate": cdate,
+            "startTimestampGMT": _gmt(start_ms),
+            # -1 / -2: not enough data / too active to measure
+            "stressValuesArray": [
+                [t, rng.choice([-1, -2]) if rng.random() < 0.1 else rng.randint(0, 100)]
+                for t in range(start_ms, start_ms + 86_400_000, 180_000)
+            ],
+            "bodyBatteryValuesArray": body_battery,
+        }
+
+    def get_user_summary(self, cdate):
+        self._call()
+        rng = random.Random(f"summary-{cdate}")
+        return {
+            "calendarDate": cdate,
+            "hrvStatus": {"lastNightAvg": rng.randint(40, 90)},
+            "bodyBatteryHighestValue": rng.randint(60, 100),
+            "bodyBatteryLowestValue": rng.randint(5, 40),
+            "averageStressLevel": rng.randint(15, 50),
+            "restingHeartRate": rng.randint(45, 60),
+        }
+
+def _gmt(ms):
+    return datetime.datetime.fromtimestamp(ms / 1000, datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.0")
+
+def _ms(gmt):
+    return int(datetime.datetime.fromisoformat(gmt).replace(tzinfo=datetime.timezone.utc).timestamp() * 1000)
+
+# --- NOTION ---
+
+def _read_property(value):
+    """Converts a property as written to the API into the shape the API returns"""
+    for kind in ("title", "rich_text"):
+        if kind in value:
+            return {"type": kind, kind: [
+                {"type": "text", "text": item.get("text", {}), "plain_text": item.get("text", {}).get("content", "")}
+                for item in value[kind]
+            ]}
+    kind = next(iter(value))
+    return {"type": kind, kind: value[kind]}
+
+def _dashed(notion_id):
+    """The API answers with dashed IDs, whichever form it was given (e.g. copied from a URL)"""
+    try:
+        return str(uuid.UUID(notion_id))
+    except (TypeError, ValueError, AttributeError):
+        return notion_id
+
+class FakeNotion:
+    """
+    In-memory Notion API: databases.query (filters, sorts, pagination, has_more,
+    filter_properties), pages.create/update/retrieve and blocks.children.append.
+    With `rate_limit` set (requests per second) it answers 429 like the real API.
+    """
+
+    def __init__(self, rate_limit=None, burst=3, latency=0.0):
+        self.page_store = {}
+        self.block_store = {}
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.tokens = float(burst)
+        self.burst = burst
+        self.updated = time.monotonic()
+        self.clock = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        self.lock = threading.Lock()
+
+        # Same API surface as notion_client.Client
+        self.databases = SimpleNamespace(query=self._query)
+        self.pages = SimpleNamespace(create=self._create, update=self._update, retrieve=self._retrieve)
+        self.blocks = SimpleNamespace(children=SimpleNamespace(append=self._append, list=self._list_children))
+
+    def _request(self):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            if self.rate_limit:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate_limit)
+                self.updated = now
+                if self.tokens < 1:
+                    raise FakeAPIError(429, "rate_limited", "Rate limited", retry_after=round(1 / self.rate_limit, 3))
+                self.tokens -= 1
+            self.clock += datetime.timedelta(seconds=1)
+            return self.clock.isoformat().replace("+00:00", ".000Z")
+
+    def _query(self, database_id, filter=None, sorts=None, start_cursor=None, page_size=100, filter_properties=None, **kwargs):
+        self._request()
+        with self.lock:
+            candidates = list(self.page_store.values())
+        database_id = _dashed(database_id)
+        results = [
+            p for p in candidates
+            if p['parent'].get('database_id') == database_id and not p['archived'] and matches(p, filter)
+        ]
+        return json.loads(json.dumps(query_response(results, sorts, start_cursor, page_size, filter_properties)))
+
+    def _create(self, parent, properties, icon=None, cover=None, children=None, **kwargs):
+        now = self._request()
+        page = {
+            "object": "page",
+            "id": str(uuid.uuid4()),
+            "created_time": now,
+            "last_edited_time": now,
+            "archived": False,
+            "parent": {**parent, "database_id": _dashed(parent['database_id'])} if 'database_id' in parent else parent,
+            "icon": icon,
+            "cover": cover,
+            "properties": {k: _read_property(v) for k, v in properties.items()},
+        }
+        with self.lock:
+            self.page_store[page['id']] = page
+            if children:
+                self.block_store[page['id']] = list(children)
+        return json.loads(json.dumps(page))
+
+    def _update(self, page_id, properties=None, icon=None, cover=None, archived=None, **kwargs):
+        now = self._request()
+        page = self.page_store.get(page_id)
+        if page is None:
+            raise FakeAPIError(404, "object_not_found", f"Could not find page with ID: {page_id}")
+        page['properties'].update({k: _read_property(v) for k, v in (properties or {}).items()})
+        if icon is not None:
+            page['icon'] = icon
+        if cover is not None:
+            page['cover'] = cover
+        if archived is not None:
+            page['archived'] = archived
+        page['last_edited_time'] = now
+        return json.loads(json.dumps(page))
+
+    def _retrieve(self, page_id, **kwargs):
+        self._request()
+        page = self.page_store.get(page_id)
+        if page is None:
+            raise FakeAPIError(404, "object_not_found", f"Could not find page with ID: {page_id}")
+        return json.loads(json.dumps(page))
+
+    def _append(self, block_id, children, **kwargs):
+        self._request()
+        self.block_store.setdefault(block_id, []).extend(children)
+        return {"object": "list", "results": children}
+
+    def _list_children(self, block_id, **kwargs):
+        self._request()
+        return {"object": "list", "results": self.block_store.get(block_id, []), "has_more": False, "next_cursor": None}
+
+# --- LLM ---
+
+class FakeLLM:
+    """Offline stand-in for the OpenAI client used by the coach"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        prompt = messages[-1]['content']
+        content = json.dumps({
+            "summary": f"Offline analysis of {prompt.count('- ')} log lines.",
+            "score": "Moderate",
+            "action": "Keep the easy days easy.",
+        })
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
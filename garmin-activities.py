@@ -1,86 +1,204 @@
 import os
+import sys
 import datetime
-from garminconnect import Garmin
-from notion_client import Client
-
-# Initialize Client
-try:
-    garmin = Garmin(os.getenv("GARMIN_EMAIL"), os.getenv("GARMIN_PASSWORD"))
-    garmin.login()
-    notion = Client(auth=os.getenv("NOTION_TOKEN"))
-except Exception as e:
-    print(f"Auth Error: {e}")
-    exit(1)
-
-DATABASE_ID = os.getenv("NOTION_DB_ID")
-
-def activity_exists(activity_id):
-    """Checks if activity already exists in Notion to avoid duplicates"""
-    query = notion.databases.query(
-        database_id=DATABASE_ID,
-        filter={
+import importlib
+import async_io
+from journal import Journal
+from write_planner import WritePlanner
+from pipeline import run_pipeline
+from instrumentation import instrument, timed_stage
+
+gear_script = importlib.import_module("garmin-gear")
+
+def activity_query(database_id, activity_id):
+    """Query that finds an activity's page by its Garmin ID"""
+    return {
+        "database_id": database_id,
+        "filter": {
             "property": "Activity ID", # Ensure you have this Text column!
             "rich_text": {"equals": str(activity_id)}
         }
-    )
-    return len(query['results']) > 0
+    }
+
+def build_activity_properties(activity):
+    """Maps a Garmin activity summary to Notion page properties"""
+    activity_id = activity['activityId']
+    name = activity['activityName']
+    start_time = activity['startTimeLocal'] # '2023-01-01 10:00:00'
 
-def sync_activities():
+    # --- DATA EXTRACTION ---
+    # Metric conversions (Garmin uses meters and seconds)
+    distance_km = round(activity['distance'] / 1000, 2)
+    duration_sec = activity['duration']
+    
+    # Heart Rate (The new part!)
+    avg_hr = activity.get('averageHR') # Returns None if missing
+    
+    # Sport Type mapping (Simple version)
+    sport_type = activity['activityType']['typeKey'] # e.g., 'running', 'cycling'
+
+    # --- NOTION PROPERTIES ---
+
+    properties = {
+        # Change "Name" to "Activity Name" (or whatever yours is called)
+        "Activity Name": {"title": [{"text": {"content": name}}]},
+        
+        "Date": {"date": {"start": start_time}},
+        "Distance (km)": {"number": distance_km},
+        
+        # Change "Time" to "Duration"
+        "Duration": {"number": duration_sec},
+        
+        "Activity ID": {"rich_text": [{"text": {"content": str(activity_id)}}]},
+        
+        # Change "Type" to "Sport"
+        "Sport": {"select": {"name": sport_type}},
+        
+        "Avg HR": {"number": avg_hr} if avg_hr else None
+    }
+
+    # Remove None values to be safe
+    properties = {k: v for k, v in properties.items() if v is not None}
+    return properties
+
+def sync_activities(garmin, notion, database_id, planner=None, gear_db_id=None):
     print("Checking for new activities...")
     # Fetch last 10 activities
     activities = garmin.get_activities(0, 10)
+    gear_map = None
+
+    # Duplicate checks for all of them at once
+    existing = async_io.query_many(notion, [activity_query(database_id, a['activityId']) for a in activities])
 
-    for activity in activities:
+    for activity, found in zip(activities, existing):
         activity_id = activity['activityId']
         name = activity['activityName']
-        start_time = activity['startTimeLocal'] # '2023-01-01 10:00:00'
         
         # Check duplication
-        if activity_exists(activity_id):
+        if found['results']:
             print(f"Skipping existing activity: {name}")
             continue
 
         print(f"Syncing new activity: {name}")
 
-        # --- DATA EXTRACTION ---
-        # Metric conversions (Garmin uses meters and seconds)
-        distance_km = round(activity['distance'] / 1000, 2)
-        duration_sec = activity['duration']
-        
-        # Heart Rate (The new part!)
-        avg_hr = activity.get('averageHR') # Returns None if missing
-        
-        # Sport Type mapping (Simple version)
-        sport_type = activity['activityType']['typeKey'] # e.g., 'running', 'cycling'
+        properties = build_activity_properties(activity)
+        if not planner:
+            notion.pages.create(parent={"database_id": database_id}, properties=properties)
+            print("Done!")
+            continue
 
-        # --- SEND TO NOTION ---
-    
-        properties = {
-            # Change "Name" to "Activity Name" (or whatever yours is called)
-            "Activity Name": {"title": [{"text": {"content": name}}]},
-            
-            "Date": {"date": {"start": start_time}},
-            "Distance (km)": {"number": distance_km},
-            
-            # Change "Time" to "Duration"
-            "Duration": {"number": duration_sec},
-            
-            "Activity ID": {"rich_text": [{"text": {"content": str(activity_id)}}]},
-            
-            # Change "Type" to "Sport"
-            "Sport": {"select": {"name": sport_type}},
-            
-            "Avg HR": {"number": avg_hr} if avg_hr else None
-        }
+        page = planner.create(f"activity-create:{database_id}:{activity_id}", database_id, properties,
+                              lookup=activity_query(database_id, activity_id))
+
+        # Link the gear in the same request instead of a second update from garmin-gear.py
+        if gear_db_id:
+            if gear_map is None:
+                gear_map = gear_script.get_gear_mapping(notion, gear_db_id)
+            gear_id = gear_script.activity_gear_id(activity)
+            if gear_id in gear_map:
+                planner.update(page, gear_script.gear_relation(gear_map[gear_id]))
+        print("Done!")
+
+# --- BACKFILL ---
 
-        # Remove None values to be safe
-        properties = {k: v for k, v in properties.items() if v is not None}
+BACKFILL_PAGE_SIZE = 100
 
-        notion.pages.create(
-            parent={"database_id": DATABASE_ID},
-            properties=properties
+def fetch_activity_pages(garmin, page_size=BACKFILL_PAGE_SIZE):
+    """Yields the whole activity history one Garmin page at a time (newest first)"""
+    start = 0
+    while True:
+        page = garmin.get_activities(start, page_size)
+        if not page:
+            return
+        yield page
+        start += page_size
+
+def existing_activity_ids(notion, database_id, activity_ids):
+    """One (paginated) Notion query per batch instead of one query per activity"""
+    existing = set()
+    has_more = True
+    next_cursor = None
+    while has_more:
+        resp = notion.databases.query(
+            database_id=database_id,
+            filter={"or": [
+                {"property": "Activity ID", "rich_text": {"equals": str(a_id)}}
+                for a_id in activity_ids
+            ]},
+            start_cursor=next_cursor
         )
-        print("Done!")
+        for page in resp['results']:
+            rich_text = page['properties']['Activity ID']['rich_text']
+            if rich_text:
+                existing.add(rich_text[0]['plain_text'])
+        has_more = resp['has_more']
+        next_cursor = resp['next_cursor']
+    return existing
+
+def backfill_activities(garmin, notion, database_id):
+    """
+    Syncs the full history as a streaming pipeline:
+    fetch page -> build properties -> drop existing -> write.
+    Only a couple of pages are in memory at any time, and Garmin fetching
+    overlaps with Notion writes. Creates are journaled like sync_activities'.
+    """
+    journal = Journal()
+    recovered = journal.recover(notion)
+    if recovered:
+        print(f"Recovered {recovered} pending mutations from the last run")
+    counts = {"created": 0, "failed": 0}
+    # Activity IDs already passed on: Garmin's offset pages shift when an activity is
+    # uploaded during the backfill, so one can arrive twice before its page is written
+    seen = set()
+
+    def to_properties(page):
+        return [(str(a['activityId']), a['activityName'], build_activity_properties(a)) for a in page]
+
+    def drop_existing(batch):
+        batch = [item for item in batch if item[0] not in seen]
+        seen.update(a_id for a_id, _, _ in batch)
+        if not batch:
+            return None
+        existing = existing_activity_ids(notion, database_id, [a_id for a_id, _, _ in batch])
+        new = [item for item in batch if item[0] not in existing]
+        return new or None
+
+    def write(batch):
+        planner = WritePlanner()
+        for a_id, name, properties in batch:
+            planner.create(f"activity-create:{database_id}:{a_id}", database_id, properties,
+                           lookup=activity_query(database_id, a_id))
+            print(f"Syncing: {name}")
+        failed = planner.flush(notion, journal)
+        counts["created"] += len(batch) - failed
+        counts["failed"] += failed
+
+    run_pipeline(fetch_activity_pages(garmin), [to_properties, drop_existing], write)
+    print(f"Backfill done, {counts['created']} activities created, {counts['failed']} failed.")
+
+def run(garmin, notion, config):
+    journal = Journal()
+    journal.recover(notion)
+    planner = WritePlanner()
+    sync_activities(garmin, notion, config.get("NOTION_DB_ID"), planner, config.get("NOTION_GEAR_DB_ID"))
+    planner.flush(notion, journal)
 
 if __name__ == "__main__":
-    sync_activities()
+    # Client libraries are only imported when the script runs on its own
+    from garminconnect import Garmin
+    from notion_client import Client
+
+    # Initialize Client
+    try:
+        garmin = instrument(Garmin(os.getenv("GARMIN_EMAIL"), os.getenv("GARMIN_PASSWORD")), "garmin")
+        garmin.login()
+        notion = instrument(Client(auth=os.getenv("NOTION_TOKEN")), "notion")
+    except Exception as e:
+        print(f"Auth Error: {e}")
+        exit(1)
+
+    with timed_stage("activities"):
+        if "--backfill" in sys.argv:
+            backfill_activities(garmin, notion, os.getenv("NOTION_DB_ID"))
+        else:
+            run(garmin, notion, os.environ)
@@ -2,19 +2,13 @@ import os
 import datetime
 import json
 import urllib.parse
-from notion_client import Client
+import numpy as np
+import intraday
+import snapshot
+from training_load import get_training_load
+from instrumentation import instrument, timed_stage
 
-# --- CONFIGURATION ---
-try:
-    notion = Client(auth=os.getenv("NOTION_TOKEN"))
-except Exception as e:
-    print(f"Auth Error: {e}")
-    exit(1)
-
-ACTIVITIES_DB_ID = os.getenv("NOTION_DB_ID")
-COACH_DB_ID = os.getenv("NOTION_COACH_DB_ID")
-
-def get_last_30_days_data():
+def get_last_30_days_data(notion, activities_db_id):
     """Fetch Date, Distance, and Heart Rate for the last 30 days"""
     today = datetime.date.today()
     thirty_days_ago = (today - datetime.timedelta(days=30)).isoformat()
@@ -22,7 +16,7 @@ def get_last_30_days_data():
     print(f"Fetching data since {thirty_days_ago}...")
 
     query = notion.databases.query(
-        database_id=ACTIVITIES_DB_ID,
+        database_id=activities_db_id,
         filter={
             "property": "Date",
             "date": {"on_or_after": thirty_days_ago}
@@ -38,7 +32,7 @@ def get_last_30_days_data():
         props = page['properties']
         try:
             # EXTRACT DATA (Adjust property names if yours differ)
-            date_str = props['Date']['date']['start'] # YYYY-MM-DD
+            date_str = props['Date']['date']['start'][:10] # YYYY-MM-DD (activities store a date-time)
             
             dist_key = "Distance" if "Distance" in props else "Distance (km)"
             dist = props[dist_key]['number']
@@ -116,12 +110,85 @@ def generate_quickchart_url(dates, distances, heart_rates):
     # QuickChart base URL
     return f"https://quickchart.io/chart?c={encoded_config}&w=600&h=300"
 
-def append_chart_to_latest_report(chart_url):
+def generate_training_load_chart_url(load_rows):
+    """Constructs the QuickChart URL for the Fitness / Fatigue / Form lines"""
+    labels = [datetime.date.fromisoformat(r['date']).strftime("%b %d") for r in load_rows]
+
+    chart_config = {
+        "type": "line",
+        "data": {
+            "labels": labels,
+            "datasets": [
+                {"label": "Fitness (CTL)", "borderColor": "#36a2eb", "fill": False, "data": [r['ctl'] for r in load_rows]},
+                {"label": "Fatigue (ATL)", "borderColor": "#ff6384", "fill": False, "data": [r['atl'] for r in load_rows]},
+                {"label": "Form (TSB)", "borderColor": "#4bc0c0", "borderDash": [5, 5], "fill": False, "data": [r['tsb'] for r in load_rows]}
+            ]
+        },
+        "options": {
+            "title": {
+                "display": True,
+                "text": "Fitness / Fatigue / Form (Last 30 Days)"
+            }
+        }
+    }
+
+    json_str = json.dumps(chart_config)
+    encoded_config = urllib.parse.quote(json_str)
+    return f"https://quickchart.io/chart?c={encoded_config}&w=600&h=300"
+
+# Hours per point of the intraday chart; keeps the QuickChart URL short enough for Notion
+INTRADAY_CHART_HOURS = 4
+
+def generate_intraday_chart_url(days=7):
+    """Stress and Body Battery from the local intraday store's hourly rollups, or None without data"""
+    end = datetime.date.today()
+    start = end - datetime.timedelta(days=days - 1)
+    times, stress = intraday.query("stress", "hourly", start, end)
+    _, battery = intraday.query("body_battery", "hourly", start, end)
+    if len(times) == 0:
+        return None
+
+    def points(hourly):
+        blocks = hourly.reshape(-1, INTRADAY_CHART_HOURS)
+        filled = ~np.isnan(blocks)
+        counts = filled.sum(axis=1)
+        means = np.where(filled, blocks, 0).sum(axis=1) / np.maximum(counts, 1)
+        return [round(float(v)) if n else None for v, n in zip(means, counts)]
+
+    # Weekday label at midnight only
+    starts = times[::INTRADAY_CHART_HOURS]
+    labels = [
+        datetime.date.fromisoformat(str(t)[:10]).strftime("%a") if str(t)[11:13] == "00" else ""
+        for t in starts
+    ]
+
+    chart_config = {
+        "type": "line",
+        "data": {
+            "labels": labels,
+            "datasets": [
+                {"label": "Body Battery", "borderColor": "#4bc0c0", "fill": False, "pointRadius": 0, "data": points(battery['mean'])},
+                {"label": "Stress", "borderColor": "#ff9f40", "fill": False, "pointRadius": 0, "data": points(stress['mean'])}
+            ]
+        },
+        "options": {
+            "title": {
+                "display": True,
+                "text": f"Stress & Body Battery (Last {days} Days)"
+            }
+        }
+    }
+
+    json_str = json.dumps(chart_config, separators=(",", ":"))
+    encoded_config = urllib.parse.quote(json_str)
+    return f"https://quickchart.io/chart?c={encoded_config}&w=600&h=300"
+
+def append_chart_to_latest_report(notion, coach_db_id, chart_url, extra_chart_urls=()):
     print("Finding latest Coach Report...")
     
     # Find the most recent report
     query = notion.databases.query(
-        database_id=COACH_DB_ID,
+        database_id=coach_db_id,
         sorts=[{"property": "Date", "direction": "descending"}],
         page_size=1
     )
@@ -155,12 +222,17 @@ def append_chart_to_latest_report(chart_url):
                     }
                 }
             }
+        ] + [
+            {"object": "block", "type": "image", "image": {"type": "external", "external": {"url": url}}}
+            for url in extra_chart_urls
         ]
     )
     print("Chart attached successfully!")
 
-if __name__ == "__main__":
-    d, dist, hr = get_last_30_days_data()
+def run(garmin, notion, config):
+    notion = snapshot.reader(notion, config, ["activities", "coach"])
+    activities_db_id = config.get("NOTION_DB_ID")
+    d, dist, hr = get_last_30_days_data(notion, activities_db_id)
     
     if not d:
         print("No data found to chart.")
@@ -168,4 +240,28 @@ if __name__ == "__main__":
         url = generate_quickchart_url(d, dist, hr)
         # Note: QuickChart URLs can be long. If too long, Notion might reject. 
         # But for 30 days of data, it is usually safe.
-        append_chart_to_latest_report(url)
+        extra_urls = []
+        try:
+            load_rows = get_training_load(notion, activities_db_id, days=30)
+            if load_rows:
+                extra_urls.append(generate_training_load_chart_url(load_rows))
+        except Exception as e:
+            print(f"Could not compute training load: {e}")
+        intraday_url = generate_intraday_chart_url()
+        if intraday_url:
+            extra_urls.append(intraday_url)
+        append_chart_to_latest_report(notion, config.get("NOTION_COACH_DB_ID"), url, extra_urls)
+
+if __name__ == "__main__":
+    # Client libraries are only imported when the script runs on its own
+    from notion_client import Client
+
+    # --- CONFIGURATION ---
+    try:
+        notion = instrument(Client(auth=os.getenv("NOTION_TOKEN")), "notion")
+    except Exception as e:
+        print(f"Auth Error: {e}")
+        exit(1)
+
+    with timed_stage("charts"):
+        run(None, notion, os.environ)
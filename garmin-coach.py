@@ -1,25 +1,43 @@
 import os
 import datetime
 import json
-from notion_client import Client
-from openai import OpenAI
+import numpy as np
+import intraday
+import snapshot
+from training_load import get_training_load
+from instrumentation import instrument, timed_stage
 
-# --- INITIALIZATION ---
-try:
-    notion = Client(auth=os.getenv("NOTION_TOKEN"))
-    # FIX: .strip() removes hidden newlines that cause the Protocol Error
-    api_key = os.getenv("OPENAI_API_KEY", "").strip()
-    client = OpenAI(api_key=api_key)
-except Exception as e:
-    print(f"Auth Error: {e}")
-    exit(1)
-
-# Database IDs
-ACTIVITIES_DB_ID = os.getenv("NOTION_DB_ID")
-HEALTH_DB_ID = os.getenv("NOTION_HEALTH_DB_ID")
-COACH_DB_ID = os.getenv("NOTION_COACH_DB_ID")
-
-def get_last_7_days_data():
+def activity_line(page):
+    """One training log line for an Activities page, or None if fields are missing"""
+    props = page['properties']
+    try:
+        # ADJUST THESE KEYS if your Notion column names are different!
+        name_key = "Name" if "Name" in props else "Activity Name"
+        name = props[name_key]['title'][0]['plain_text']
+        
+        date = props['Date']['date']['start']
+        
+        dist_key = "Distance" if "Distance" in props else "Distance (km)"
+        dist = props[dist_key]['number']
+        
+        return f"- {date}: {name} ({dist}km)"
+    except Exception as e:
+        # Silently skip missing data rows to prevent crashes
+        return None
+
+def health_line(page):
+    """One recovery log line for a Health page, or None if fields are missing"""
+    props = page['properties']
+    try:
+        date = props['Date']['date']['start']
+        hrv = props.get('HRV (ms)', {}).get('number', 'N/A')
+        bb_max = props.get('Body Battery Max', {}).get('number', 'N/A')
+        stress = props.get('Stress Avg', {}).get('number', 'N/A')
+        return f"- {date}: HRV {hrv}, Body Batt Max {bb_max}, Stress {stress}"
+    except:
+        return None
+
+def get_last_7_days_data(notion, activities_db_id, health_db_id):
     today = datetime.date.today()
     seven_days_ago = (today - datetime.timedelta(days=7)).isoformat()
     
@@ -27,62 +45,74 @@ def get_last_7_days_data():
 
     # --- 1. Fetch Training Data ---
     activities_query = notion.databases.query(
-        database_id=ACTIVITIES_DB_ID,
+        database_id=activities_db_id,
         filter={
             "property": "Date",
             "date": {"on_or_after": seven_days_ago}
         }
     )
     
-    activity_log = []
-    for page in activities_query['results']:
-        props = page['properties']
-        try:
-            # ADJUST THESE KEYS if your Notion column names are different!
-            name_key = "Name" if "Name" in props else "Activity Name"
-            name = props[name_key]['title'][0]['plain_text']
-            
-            date = props['Date']['date']['start']
-            
-            dist_key = "Distance" if "Distance" in props else "Distance (km)"
-            dist = props[dist_key]['number']
-            
-            activity_log.append(f"- {date}: {name} ({dist}km)")
-        except Exception as e:
-            # Silently skip missing data rows to prevent crashes
-            pass
+    activity_log = [line for line in map(activity_line, activities_query['results']) if line]
 
     # --- 2. Fetch Health Data ---
     health_log = []
-    if HEALTH_DB_ID:
+    if health_db_id:
         health_query = notion.databases.query(
-            database_id=HEALTH_DB_ID,
+            database_id=health_db_id,
             filter={
                 "property": "Date",
                 "date": {"on_or_after": seven_days_ago}
             }
         )
-        for page in health_query['results']:
-            props = page['properties']
-            try:
-                date = props['Date']['date']['start']
-                hrv = props.get('HRV (ms)', {}).get('number', 'N/A')
-                bb_max = props.get('Body Battery Max', {}).get('number', 'N/A')
-                stress = props.get('Stress Avg', {}).get('number', 'N/A')
-                health_log.append(f"- {date}: HRV {hrv}, Body Batt Max {bb_max}, Stress {stress}")
-            except:
-                pass
+        health_log = [line for line in map(health_line, health_query['results']) if line]
 
     return "\n".join(activity_log), "\n".join(health_log)
 
-def generate_coaching_insight(activity_text, health_text):
+def get_training_load_text(notion, activities_db_id):
+    """Last 7 days of fitness (CTL), fatigue (ATL) and form (TSB)"""
+    try:
+        rows = get_training_load(notion, activities_db_id, days=7)
+    except Exception as e:
+        print(f"Could not compute training load: {e}")
+        return ""
+    return training_load_text(rows)
+
+def training_load_text(rows):
+    return "\n".join(
+        f"- {r['date']}: Load {r['load']}, Fitness (CTL) {r['ctl']}, Fatigue (ATL) {r['atl']}, Form (TSB) {r['tsb']}"
+        for r in rows
+    )
+
+def get_intraday_text(days=7, end=None):
+    """Daily heart rate, stress and Body Battery from the local intraday store"""
+    end = end or datetime.date.today()
+    start = end - datetime.timedelta(days=days - 1)
+    times, heart = intraday.query("heart_rate", "daily", start, end)
+    _, stress = intraday.query("stress", "daily", start, end)
+    _, battery = intraday.query("body_battery", "daily", start, end)
+    hourly_times, hourly_stress = intraday.query("stress", "hourly", start, end)
+
+    lines = []
+    for i, day in enumerate(times):
+        date = str(day)[:10]
+        # Hours with a high average stress level (Garmin: 51-100 is high)
+        in_day = (hourly_times >= day) & (hourly_times < day + np.timedelta64(1, "D"))
+        stressed_hours = int(np.sum(hourly_stress['mean'][in_day] > 50))
+        lines.append(
+            f"- {date}: HR avg {heart['mean'][i]:.0f} (min {heart['min'][i]:.0f}, max {heart['max'][i]:.0f}), "
+            f"Stress avg {stress['mean'][i]:.0f} ({stressed_hours}h high), "
+            f"Body Batt {battery['min'][i]:.0f}-{battery['max'][i]:.0f}"
+        )
+    return "\n".join(lines)
+
+def generate_coaching_insight(client, activity_text, health_text, load_text="", period="last 7 days"):
     print("Asking the AI Coach...")
     
     if not activity_text and not health_text:
         return None
 
     prompt = f"""
-    You are an elite endurance sports coach. Analyze my last 7 days.
+    You are an elite endurance sports coach. Analyze my {period}.
     
     TRAINING LOG:
     {activity_text}
@@ -90,6 +120,9 @@ def generate_coaching_insight(activity_text, health_text):
     HEALTH/RECOVERY LOG:
     {health_text}
     
+    TRAINING LOAD (TRIMP-based ATL/CTL/TSB):
+    {load_text}
+    
     Task:
     1. 'summary': 2 sentences on volume/intensity vs recovery.
     2. 'score': Choose exactly one: 'Good', 'Moderate', or 'Poor'.
@@ -106,7 +139,17 @@ def generate_coaching_insight(activity_text, health_text):
     
     return response.choices[0].message.content
 
-def save_report(insight_json):
+def report_properties(data, name, date):
+    """Coach DB properties of a report; `date` is a Notion date value ({"start": ..., "end": ...})"""
+    return {
+        "Name": {"title": [{"text": {"content": name}}]},
+        "Date": {"date": date},
+        "Summary": {"rich_text": [{"text": {"content": data.get('summary', '')}}]},
+        "Recovery Score": {"select": {"name": data.get('score', 'Moderate')}},
+        "Action Item": {"rich_text": [{"text": {"content": data.get('action', '')}}]}
+    }
+
+def save_report(notion, coach_db_id, insight_json):
     if not insight_json:
         print("No data to report.")
         return
@@ -117,20 +160,47 @@ def save_report(insight_json):
     print(f"Saving Report: {data.get('score', 'No Score')}")
     
     notion.pages.create(
-        parent={"database_id": COACH_DB_ID},
-        properties={
-            "Name": {"title": [{"text": {"content": f"Week Analysis: {today_iso}"}}]},
-            "Date": {"date": {"start": today_iso}},
-            "Summary": {"rich_text": [{"text": {"content": data.get('summary', '')}}]},
-            "Recovery Score": {"select": {"name": data.get('score', 'Moderate')}},
-            "Action Item": {"rich_text": [{"text": {"content": data.get('action', '')}}]}
-        }
+        parent={"database_id": coach_db_id},
+        properties=report_properties(data, f"Week Analysis: {today_iso}", {"start": today_iso})
     )
     print("Report saved to Notion successfully!")
 
-if __name__ == "__main__":
-    act_text, health_text = get_last_7_days_data()
+def make_llm_client(config):
+    """OpenAI client, or the offline stand-in from fakes.py when COACH_LLM=local"""
+    if config.get("COACH_LLM") == "local":
+        from fakes import FakeLLM
+        return instrument(FakeLLM(), "llm")
+    from openai import OpenAI
+
+    # FIX: .strip() removes hidden newlines that cause the Protocol Error
+    api_key = (config.get("OPENAI_API_KEY") or "").strip()
+    return instrument(OpenAI(api_key=api_key), "openai")
+
+def run(garmin, notion, config):
+    client = make_llm_client(config)
+    notion = snapshot.reader(notion, config, ["activities", "health", "coach"])
+
+    activities_db_id = config.get("NOTION_DB_ID")
+    act_text, health_text = get_last_7_days_data(notion, activities_db_id, config.get("NOTION_HEALTH_DB_ID"))
+    load_text = get_training_load_text(notion, activities_db_id)
+    intraday_text = get_intraday_text()
+    if intraday_text:
+        health_text = f"{health_text}\nIntraday (from watch curves):\n{intraday_text}"
     print(f"Data gathered. {len(act_text)} chars of training data.")
     
-    insight = generate_coaching_insight(act_text, health_text)
-    save_report(insight)
+    insight = generate_coaching_insight(client, act_text, health_text, load_text)
+    save_report(notion, config.get("NOTION_COACH_DB_ID"), insight)
+
+if __name__ == "__main__":
+    # Client libraries are only imported when the script runs on its own
+    from notion_client import Client
+
+    # --- INITIALIZATION ---
+    try:
+        notion = instrument(Client(auth=os.getenv("NOTION_TOKEN")), "notion")
+    except Exception as e:
+        print(f"Auth Error: {e}")
+        exit(1)
+
+    with timed_stage("coach"):
+        run(None, notion, os.environ)
@@ -1,123 +1,109 @@
 import os
 import datetime
-from garminconnect import Garmin
-from notion_client import Client
-
-# --- SETUP ---
-try:
-    garmin = Garmin(os.getenv("GARMIN_EMAIL"), os.getenv("GARMIN_PASSWORD"))
-    garmin.login()
-    notion = Client(auth=os.getenv("NOTION_TOKEN"))
-except Exception as e:
-    print(f"Auth Error: {e}")
-    exit(1)
-
-ACTIVITIES_DB_ID = os.getenv("NOTION_DB_ID")
-GEAR_DB_ID = os.getenv("NOTION_GEAR_DB_ID")
+import async_io
+import snapshot
+from instrumentation import instrument, timed_stage
 
 # --- HELPERS ---
 
-def get_gear_mapping():
-    """
-    Returns a dict: {'Garmin_Gear_ID_String': 'Notion_Page_ID'}
-    Scans the Gear Garage DB to know which Notion page corresponds to which Garmin gear.
-    """
+def gear_mapping(pages):
+    """{'Garmin_Gear_ID_String': 'Notion_Page_ID'} from the pages of the Gear Garage DB"""
     mapping = {}
-    has_more = True
-    next_cursor = None
-
-    while has_more:
-        resp = notion.databases.query(
-            database_id=GEAR_DB_ID,
-            start_cursor=next_cursor
-        )
-        for page in resp['results']:
-            # Assumes you have a Text property named 'Garmin ID' in your Gear DB
-            try:
-                g_id_list = page['properties']['Garmin ID']['rich_text']
-                if g_id_list:
-                    g_id = g_id_list[0]['plain_text']
-                    mapping[g_id] = page['id']
-            except KeyError:
-                continue # Skip if property missing
-        
-        has_more = resp['has_more']
-        next_cursor = resp['next_cursor']
-    
+    for page in pages:
+        # Assumes you have a Text property named 'Garmin ID' in your Gear DB
+        try:
+            g_id_list = page['properties']['Garmin ID']['rich_text']
+            if g_id_list:
+                g_id = g_id_list[0]['plain_text']
+                mapping[g_id] = page['id']
+        except KeyError:
+            continue # Skip if property missing
     return mapping
 
-def find_activity_page(activity_date, activity_name):
+def get_gear_mapping(notion, gear_db_id):
     """
-    Finds the Notion Page ID for a specific run in the Activities DB.
-    Matches primarily on Date to avoid duplicates.
+    Returns a dict: {'Garmin_Gear_ID_String': 'Notion_Page_ID'}
+    Scans the Gear Garage DB to know which Notion page corresponds to which Garmin gear.
     """
-    # Format date to match Notion (YYYY-MM-DD) if needed
-    # Garmin API returns timestamps, usually we need just the date part for matching
-    # Adjust logic here if your Notion 'Date' includes time.
-    
-    query = notion.databases.query(
-        database_id=ACTIVITIES_DB_ID,
-        filter={
+    return gear_mapping(async_io.run(async_io.query_all(notion, database_id=gear_db_id)))
+
+def activity_page_query(activities_db_id, activity_date, activity_name):
+    """Query that finds an activity's page in the Activities DB by date and name"""
+    return {
+        "database_id": activities_db_id,
+        "filter": {
             "and": [
                 {
                     "property": "Date",
                     "date": {"equals": activity_date[:10]} # Match YYYY-MM-DD
                 },
                 {
-                    "property": "Name", # or whatever your Title property is called
+                    "property": "Activity Name", # the title written by garmin-activities.py; adjust if yours differs
                     "title": {"contains": activity_name}
                 }
             ]
         }
-    )
+    }
+
+def activity_gear_id(activity):
+    """Garmin gear ID of an activity as a string ('None' if it has none)"""
+    # safely get gear ID
+    # Note: Garmin API structure varies by activity type. 
+    # Sometimes it is just 'deviceId', sometimes deeper.
+    # This approach tries standard locations.
+    gear_id = str(activity.get('deviceId')) 
     
-    if query['results']:
-        return query['results'][0]['id']
-    return None
+    # If deviceId is the watch ID (common confusion), we need the 'gear' dict
+    # Check if 'gear' key exists (usually for shoes)
+    if 'gear' in activity:
+         gear_id = str(activity['gear']['gearPk'])
+    return gear_id
+
+def gear_relation(notion_gear_id):
+    # Assumes the relation property in Activities DB is named "Gear"
+    return {"Gear": {"relation": [{"id": notion_gear_id}]}}
 
 # --- MAIN SYNC ---
 
-def sync_gear():
+def sync_gear(garmin, notion, activities_db_id, gear_db_id):
     print("Mapping Notion Gear...")
-    gear_map = get_gear_mapping()
+    # The gear pages and the last 10 activities are fetched at the same time
+    gear_pages, activities = async_io.gather(
+        async_io.query_all(notion, database_id=gear_db_id),
+        async_io.garmin_call(garmin, "get_activities", 0, 10)
+    )
+    gear_map = gear_mapping(gear_pages)
     print(f"Found {len(gear_map)} shoes/bikes in Notion.")
 
-    # Get last 10 activities
-    activities = garmin.get_activities(0, 10)
+    # Find the activities with known gear in Notion, all at once
+    # ('startTimeLocal' looks like '2023-10-27 18:00:00')
+    mapped = [a for a in activities if activity_gear_id(a) in gear_map]
+    responses = async_io.query_many(notion, [
+        activity_page_query(activities_db_id, a['startTimeLocal'], a['activityName']) for a in mapped
+    ])
+    activity_pages = {id(a): (resp['results'][0] if resp['results'] else None) for a, resp in zip(mapped, responses)}
 
     for activity in activities:
         name = activity['activityName']
-        start_time = activity['startTimeLocal'] # '2023-10-27 18:00:00'
-        
-        # safely get gear ID
-        # Note: Garmin API structure varies by activity type. 
-        # Sometimes it is just 'deviceId', sometimes deeper.
-        # This approach tries standard locations.
-        gear_id = str(activity.get('deviceId')) 
         
-        # If deviceId is the watch ID (common confusion), we need the 'gear' dict
-        # Check if 'gear' key exists (usually for shoes)
-        if 'gear' in activity:
-             gear_id = str(activity['gear']['gearPk'])
+        gear_id = activity_gear_id(activity)
 
         if gear_id in gear_map:
             notion_gear_id = gear_map[gear_id]
+            activity_page = activity_pages[id(activity)]
             
-            # Find the activity in Notion
-            activity_page_id = find_activity_page(start_time, name)
-            
-            if activity_page_id:
+            if activity_page:
+                # Already linked, e.g. by garmin-activities.py when it created the page
+                linked = activity_page.get('properties', {}).get('Gear', {}).get('relation', [])
+                if any(rel['id'] == notion_gear_id for rel in linked):
+                    continue
+
                 print(f"Linking '{name}' to Gear ID {gear_id}...")
                 
                 # Update the Relation Property in the Activity Row
-                # Assumes the relation property in Activities DB is named "Gear"
                 notion.pages.update(
-                    page_id=activity_page_id,
-                    properties={
-                        "Gear": {
-                            "relation": [{"id": notion_gear_id}]
-                        }
-                    }
+                    page_id=activity_page['id'],
+                    properties=gear_relation(notion_gear_id)
                 )
             else:
                 print(f"Skipping: Could not find activity '{name}' in Notion.")
@@ -126,5 +112,23 @@ def sync_gear():
             if gear_id and gear_id != "None":
                 print(f"Unmapped Gear found! ID: {gear_id} (Name: {name})")
 
+def run(garmin, notion, config):
+    notion = snapshot.reader(notion, config, ["activities", "gear"])
+    sync_gear(garmin, notion, config.get("NOTION_DB_ID"), config.get("NOTION_GEAR_DB_ID"))
+
 if __name__ == "__main__":
-    sync_gear()
+    # Client libraries are only imported when the script runs on its own
+    from garminconnect import Garmin
+    from notion_client import Client
+
+    # --- SETUP ---
+    try:
+        garmin = instrument(Garmin(os.getenv("GARMIN_EMAIL"), os.getenv("GARMIN_PASSWORD")), "garmin")
+        garmin.login()
+        notion = instrument(Client(auth=os.getenv("NOTION_TOKEN")), "notion")
+    except Exception as e:
+        print(f"Auth Error: {e}")
+        exit(1)
+
+    with timed_stage("gear"):
+        run(garmin, notion, os.environ)
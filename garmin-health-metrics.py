@@ -1,30 +1,10 @@
 import os
 import datetime
-from garminconnect import Garmin
-from notion_client import Client
+from instrumentation import instrument, timed_stage
+from intraday import sync_intraday
 
-# Initialize Notion and Garmin clients
-try:
-    notion = Client(auth=os.getenv("NOTION_TOKEN"))
-    print("Notion client initialized")
-except Exception as e:
-    print(f"Error initializing Notion client: {e}")
-    exit(1)
-
-try:
-    garmin = Garmin(os.getenv("GARMIN_EMAIL"), os.getenv("GARMIN_PASSWORD"))
-    garmin.login()
-    print("Garmin login successful")
-except Exception as e:
-    print(f"Error logging in to Garmin: {e}")
-    exit(1)
-
-# Configuration
-health_db_id = os.getenv("NOTION_HEALTH_DB_ID")
-today = datetime.date.today()
-today_iso = today.isoformat()
-
-def sync_health_metrics():
+def sync_health_metrics(garmin, notion, health_db_id):
+    today_iso = datetime.date.today().isoformat()
     print(f"Fetching health data for {today_iso}...")
     
     try:
@@ -90,5 +70,35 @@ def sync_health_metrics():
     except Exception as e:
         print(f"Error syncing health metrics: {e}")
 
+def run(garmin, notion, config):
+    sync_health_metrics(garmin, notion, config.get("NOTION_HEALTH_DB_ID"))
+
+    # Keep the full-resolution curves locally; Notion only gets the daily values above
+    try:
+        sync_intraday(garmin, days=int(config.get("INTRADAY_DAYS", 2)))
+    except Exception as e:
+        print(f"Error storing intraday data: {e}")
+
 if __name__ == "__main__":
-    sync_health_metrics()
+    # Client libraries are only imported when the script runs on its own
+    from garminconnect import Garmin
+    from notion_client import Client
+
+    # Initialize Notion and Garmin clients
+    try:
+        notion = instrument(Client(auth=os.getenv("NOTION_TOKEN")), "notion")
+        print("Notion client initialized")
+    except Exception as e:
+        print(f"Error initializing Notion client: {e}")
+        exit(1)
+
+    try:
+        garmin = instrument(Garmin(os.getenv("GARMIN_EMAIL"), os.getenv("GARMIN_PASSWORD")), "garmin")
+        garmin.login()
+        print("Garmin login successful")
+    except Exception as e:
+        print(f"Error logging in to Garmin: {e}")
+        exit(1)
+
+    with timed_stage("health"):
+        run(garmin, notion, os.environ)
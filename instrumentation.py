@@ -0,0 +1,202 @@
+import os
+import json
+import time
+import atexit
+import threading
+import contextlib
+import datetime
+from profiling import profiled
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: reports are merged without a lock
+    fcntl = None
+
+# Each run (e.g. one GitHub Actions run executing several scripts) merges its
+# metrics into one report file: sync-reports/<run id>.json
+REPORT_DIR = os.getenv("SYNC_REPORT_DIR", "sync-reports")
+RUN_ID = os.getenv("SYNC_RUN_ID") or os.getenv("GITHUB_RUN_ID") or datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+
+# Latency histogram bucket upper bounds, in milliseconds
+LATENCY_BUCKETS_MS = [50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf")]
+
+# Attribute values that are data, not API namespaces, and must not be wrapped
+PLAIN_TYPES = (str, bytes, int, float, bool, type(None), dict, list, tuple, set)
+
+def bucket_label(bound):
+    return "+Inf" if bound == float("inf") else f"le_{int(bound)}ms"
+
+def payload_size(value):
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+def new_call_stats():
+    return {
+        "count": 0,
+        "errors": 0,
+        "rate_limited": 0,
+        "retries": 0,
+        "total_ms": 0.0,
+        "max_ms": 0.0,
+        "request_bytes": 0,
+        "response_bytes": 0,
+        "latency_histogram": {bucket_label(b): 0 for b in LATENCY_BUCKETS_MS},
+    }
+
+class Metrics:
+    """Thread-safe counters for API calls and stages"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.stages = {}
+
+    def record_call(self, name, elapsed_ms, request_bytes, response_bytes, error=None):
+        with self.lock:
+            stats = self.calls.setdefault(name, new_call_stats())
+            stats["count"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            stats["request_bytes"] += request_bytes
+            stats["response_bytes"] += response_bytes
+            for bound in LATENCY_BUCKETS_MS:
+                if elapsed_ms <= bound:
+                    stats["latency_histogram"][bucket_label(bound)] += 1
+                    break
+            if error is not None:
+                stats["errors"] += 1
+                if getattr(error, "status", None) == 429 or str(getattr(error, "code", "")) == "rate_limited":
+                    stats["rate_limited"] += 1
+
+    def record_retry(self, name):
+        with self.lock:
+            self.calls.setdefault(name, new_call_stats())["retries"] += 1
+
+    def record_stage(self, name, elapsed_s, error=None):
+        with self.lock:
+            stats = self.stages.setdefault(name, {"runs": 0, "errors": 0, "total_s": 0.0})
+            stats["runs"] += 1
+            stats["total_s"] += elapsed_s
+            if error is not None:
+                stats["errors"] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return json.loads(json.dumps({"calls": self.calls, "stages": self.stages}))
+
+metrics = Metrics()
+
+@contextlib.contextmanager
+def collect_metrics(registry):
+    """Sends all metrics recorded inside the block to `registry` instead of the run report"""
+    global metrics
+    previous, metrics = metrics, registry
+    try:
+        yield registry
+    finally:
+        metrics = previous
+
+class Instrumented:
+    """
+    Wraps a client so every method call is timed and counted under
+    "<service>.<attribute path>", e.g. "notion.databases.query" or "garmin.get_activities".
+    """
+
+    def __init__(self, target, name, registry=None):
+        self._target = target
+        self._name = name
+        self._metrics = registry or metrics
+
+    def __getattr__(self, attr_name):
+        attr = getattr(self._target, attr_name)
+        name = f"{self._name}.{attr_name}"
+        if isinstance(attr, PLAIN_TYPES):
+            return attr
+        if not callable(attr):
+            return Instrumented(attr, name, self._metrics)
+
+        def call(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception as e:
+                self._metrics.record_call(name, (time.perf_counter() - started) * 1000, payload_size(kwargs), 0, e)
+                raise
+            self._metrics.record_call(name, (time.perf_counter() - started) * 1000, payload_size(kwargs), payload_size(result))
+            return result
+        return call
+
+def instrument(client, service):
+    """Instruments a client and makes sure the run report is written at exit"""
+    _register_report()
+    return Instrumented(client, service)
+
+@contextlib.contextmanager
+def timed_stage(name):
+    """Times a sync stage (activities, prs, steps, ...) for the run report; profiles it with --profile"""
+    _register_report()
+    started = time.perf_counter()
+    try:
+        with profiled(name):
+            yield
+    except BaseException as e:
+        metrics.record_stage(name, time.perf_counter() - started, e)
+        raise
+    metrics.record_stage(name, time.perf_counter() - started)
+
+def merge_reports(existing, new):
+    """Adds the counters of `new` into `existing` (several scripts share one run report)"""
+    for section in ("calls", "stages"):
+        target = existing.setdefault(section, {})
+        for name, stats in new.get(section, {}).items():
+            if name not in target:
+                target[name] = stats
+                continue
+            for key, value in stats.items():
+                if key == "latency_histogram":
+                    for bucket, count in value.items():
+                        target[name][key][bucket] = target[name][key].get(bucket, 0) + count
+                elif key == "max_ms":
+                    target[name][key] = max(target[name][key], value)
+                else:
+                    target[name][key] = target[name].get(key, 0) + value
+    return existing
+
+def write_report(path=None):
+    """Merges this process's metrics into the run report and returns its path"""
+    path = path or os.path.join(REPORT_DIR, f"{RUN_ID}.json")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Processes running at the same time with the same run ID (e.g. several sync-worker.py) share the report
+    with open(f"{path}.lock", "w") as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        report = {"run_id": RUN_ID, "calls": {}, "stages": {}}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                report = json.load(f)
+        report = merge_reports(report, metrics.snapshot())
+        report["updated"] = datetime.datetime.now().isoformat(timespec="seconds")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    return path
+
+_registered = False
+_registered_lock = threading.Lock()
+
+def _register_report():
+    global _registered
+    with _registered_lock:
+        if not _registered:
+            atexit.register(_write_report_at_exit)
+            _registered = True
+
+def _write_report_at_exit():
+    if not metrics.calls and not metrics.stages:
+        return
+    try:
+        print(f"Performance report written to {write_report()}")
+    except Exception as e:
+        print(f"Could not write performance report: {e}")
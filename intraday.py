@@ -0,0 +1,169 @@
+import os
+import argparse
+import datetime
+import numpy as np
+import async_io
+from sync_state import state_path
+
+# Intraday heart rate, stress and Body Battery curves, one compressed .npz per day:
+#   <series>_t       uint32 seconds since local midnight
+#   <series>_v       uint8 values (missing / unmeasurable samples are dropped)
+#   <series>_<res>   float32 rollup, rows mean / min / max (NaN where a bin is empty)
+# Rollups are computed once at ingestion, so reading a month of hourly values
+# never touches the raw samples (npz members are loaded on access).
+
+SERIES = ("heart_rate", "stress", "body_battery")
+RESOLUTIONS = {"5min": 300, "hourly": 3600, "daily": 86400}
+STATS = ("mean", "min", "max")
+DAY_SECONDS = 86400
+
+# Days older than this are final on Garmin's side and never fetched again
+FINAL_AFTER_DAYS = 1
+# Days of raw responses held in memory at once while fetching
+FETCH_WINDOW_DAYS = 31
+
+def store_dir():
+    path = state_path("intraday")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def day_path(cdate):
+    return os.path.join(store_dir(), f"{cdate}.npz")
+
+def _gmt_ms(value):
+    return int(datetime.datetime.fromisoformat(value[:19]).replace(tzinfo=datetime.timezone.utc).timestamp() * 1000)
+
+def _day_start_ms(response, cdate):
+    """Local midnight of the day in GMT milliseconds, as Garmin reports it"""
+    start = (response or {}).get('startTimestampGMT')
+    return _gmt_ms(start) if start else _gmt_ms(f"{cdate}T00:00:00")
+
+def _samples(rows, day_start_ms, value_index=1):
+    """[[timestamp ms, ..., value], ...] -> (seconds since midnight, values), valid samples only"""
+    rows = [r for r in rows or [] if r and r[value_index] is not None]
+    if not rows:
+        return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint8)
+    data = np.array([(r[0], r[value_index]) for r in rows], dtype=np.int64)
+    seconds = (data[:, 0] - day_start_ms) // 1000
+    # Garmin uses negative values for "no data" / "too active to measure"
+    keep = (data[:, 1] >= 0) & (seconds >= 0) & (seconds < DAY_SECONDS + 3600)
+    return seconds[keep].astype(np.uint32), np.clip(data[keep, 1], 0, 255).astype(np.uint8)
+
+def rollup(seconds, values, bin_seconds):
+    """Mean / min / max per bin of a day, as a (3, bins) float32 array"""
+    bins = DAY_SECONDS // bin_seconds
+    result = np.full((3, bins), np.nan, dtype=np.float32)
+    if len(values) == 0:
+        return result
+    index = np.minimum(seconds // bin_seconds, bins - 1).astype(np.int64)
+    values = values.astype(np.float64)
+    counts = np.bincount(index, minlength=bins)
+    filled = counts > 0
+    sums = np.bincount(index, weights=values, minlength=bins)
+    mins = np.full(bins, np.inf)
+    maxs = np.full(bins, -np.inf)
+    np.minimum.at(mins, index, values)
+    np.maximum.at(maxs, index, values)
+    result[0, filled] = sums[filled] / counts[filled]
+    result[1, filled] = mins[filled]
+    result[2, filled] = maxs[filled]
+    return result
+
+def parse_day(cdate, heart, stress):
+    """Raw samples of one day from its heart rate and stress responses: {series: (seconds, values)}"""
+    heart = heart or {}
+    stress = stress or {}
+    return {
+        "heart_rate": _samples(heart.get('heartRateValues'), _day_start_ms(heart, cdate)),
+        "stress": _samples(stress.get('stressValuesArray'), _day_start_ms(stress, cdate)),
+        # [timestamp, status, level, version]
+        "body_battery": _samples(stress.get('bodyBatteryValuesArray'), _day_start_ms(stress, cdate), value_index=2),
+    }
+
+def save_day(cdate, day):
+    arrays = {}
+    for series, (seconds, values) in day.items():
+        arrays[f"{series}_t"] = seconds
+        arrays[f"{series}_v"] = values
+        for resolution, bin_seconds in RESOLUTIONS.items():
+            arrays[f"{series}_{resolution}"] = rollup(seconds, values, bin_seconds)
+    path = day_path(cdate)
+    tmp_path = f"{path}.tmp.npz"
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+def fetch_day(garmin, cdate):
+    return parse_day(cdate, garmin.get_heart_rates(cdate), garmin.get_stress_data(cdate))
+
+def ingest_day(garmin, cdate):
+    day = fetch_day(garmin, cdate)
+    save_day(cdate, day)
+    return sum(len(values) for _, values in day.values())
+
+def sync_intraday(garmin, days=2, today=None):
+    """Stores the last `days` days; final days that are already stored are skipped"""
+    today = today or datetime.date.today()
+    final_before = today - datetime.timedelta(days=FINAL_AFTER_DAYS)
+    wanted = []
+    for offset in range(days - 1, -1, -1):
+        day = today - datetime.timedelta(days=offset)
+        if day < final_before and os.path.exists(day_path(day.isoformat())):
+            continue
+        wanted.append(day.isoformat())
+
+    # Days are fetched in parallel windows, as fast as Garmin allows (see throttle.Adaptive)
+    for window in range(0, len(wanted), FETCH_WINDOW_DAYS):
+        dates = [(cdate,) for cdate in wanted[window:window + FETCH_WINDOW_DAYS]]
+        hearts = async_io.garmin_many(garmin, "get_heart_rates", dates)
+        stresses = async_io.garmin_many(garmin, "get_stress_data", dates)
+        for (cdate,), heart, stress in zip(dates, hearts, stresses):
+            day = parse_day(cdate, heart, stress)
+            save_day(cdate, day)
+            print(f"Stored {sum(len(values) for _, values in day.values())} intraday samples for {cdate}")
+    return len(wanted)
+
+def query(series, resolution, start, end):
+    """
+    Rollup of `series` at `resolution` ("5min", "hourly", "daily") for the days
+    start..end (dates, inclusive). Returns (times as datetime64[s] local,
+    {"mean": array, "min": array, "max": array}); days without data are skipped.
+    """
+    times, parts = [], []
+    bin_seconds = RESOLUTIONS[resolution]
+    day = start
+    while day <= end:
+        path = day_path(day.isoformat())
+        if os.path.exists(path):
+            with np.load(path) as stored:
+                values = stored[f"{series}_{resolution}"].reshape(3, -1)
+            midnight = np.datetime64(day.isoformat(), "s")
+            times.append(midnight + np.arange(values.shape[1]) * np.timedelta64(bin_seconds, "s"))
+            parts.append(values)
+        day += datetime.timedelta(days=1)
+
+    if not parts:
+        return np.zeros(0, dtype="datetime64[s]"), {stat: np.zeros(0, dtype=np.float32) for stat in STATS}
+    values = np.concatenate(parts, axis=1)
+    return np.concatenate(times), dict(zip(STATS, values))
+
+def raw(series, cdate):
+    """Raw samples of one day as (datetime64[s] local, values)"""
+    path = day_path(cdate)
+    if not os.path.exists(path):
+        return np.zeros(0, dtype="datetime64[s]"), np.zeros(0, dtype=np.uint8)
+    with np.load(path) as stored:
+        seconds, values = stored[f"{series}_t"], stored[f"{series}_v"]
+    return np.datetime64(cdate, "s") + seconds.astype("timedelta64[s]"), values
+
+def main():
+    from clients import make_garmin
+
+    parser = argparse.ArgumentParser(description="Store intraday heart rate, stress and Body Battery curves locally")
+    parser.add_argument("--days", type=int, default=2, help="How many days back to store")
+    args = parser.parse_args()
+
+    garmin = make_garmin(os.environ)
+    print(f"Stored {sync_intraday(garmin, args.days)} days in {store_dir()}")
+
+if __name__ == '__main__':
+    main()
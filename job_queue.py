@@ -0,0 +1,125 @@
+import os
+import time
+import sqlite3
+
+# Shared queue database. Any worker that can open this file can pull jobs;
+# for several hosts put it on a filesystem with working file locks.
+QUEUE_PATH = os.getenv("SYNC_QUEUE_PATH", "sync-queue.sqlite")
+
+LEASE_SECONDS = 300
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_key TEXT PRIMARY KEY,
+    tenant TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    shard TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    last_error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, priority, created);
+"""
+
+class JobQueue:
+    """
+    SQLite work queue for sync stages.
+
+    - job_key makes enqueueing idempotent (tenant:stage:run_key).
+    - A claimed job is leased to one worker until lease_expires; an expired
+      lease makes the job claimable again, unless it has already been
+      claimed MAX_ATTEMPTS times (its worker keeps dying): then it fails.
+    - shard is the Notion database the stage writes to: a job is only handed
+      out while no live lease holds the same shard, so two workers never
+      write to the same database at the same moment.
+    """
+
+    def __init__(self, path=QUEUE_PATH):
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    def enqueue(self, tenant, stage, shard, run_key, priority=0):
+        """Adds a job; returns False if a job with the same key already exists"""
+        now = time.time()
+        cursor = self.db.execute(
+            "INSERT OR IGNORE INTO jobs (job_key, tenant, stage, shard, priority, created, updated) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (f"{tenant}:{stage}:{run_key}", tenant, stage, shard, priority, now, now)
+        )
+        return cursor.rowcount == 1
+
+    def claim(self, worker_id, lease_seconds=LEASE_SECONDS):
+        """Leases the next runnable job to `worker_id`, or returns None"""
+        now = time.time()
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            # fail() never runs for a job that kills its worker (OOM, SIGKILL), so its attempts end here
+            self.db.execute(
+                "UPDATE jobs SET status = 'failed', lease_expires = NULL, last_error = ?, updated = ? "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (f"lease expired after {MAX_ATTEMPTS} attempts", now, now, MAX_ATTEMPTS)
+            )
+            row = self.db.execute(
+                """
+                SELECT * FROM jobs
+                WHERE (status = 'queued' OR (status = 'leased' AND lease_expires < :now))
+                  AND shard NOT IN (
+                      SELECT shard FROM jobs WHERE status = 'leased' AND lease_expires >= :now
+                  )
+                ORDER BY priority, created
+                LIMIT 1
+                """,
+                {"now": now}
+            ).fetchone()
+            if row is None:
+                self.db.execute("COMMIT")
+                return None
+            self.db.execute(
+                "UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated = ? WHERE job_key = ?",
+                (worker_id, now + lease_seconds, now, row['job_key'])
+            )
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        return dict(row)
+
+    def renew(self, job_key, worker_id, lease_seconds=LEASE_SECONDS):
+        """Extends a lease; returns False if the lease was lost to another worker"""
+        cursor = self.db.execute(
+            "UPDATE jobs SET lease_expires = ?, updated = ? "
+            "WHERE job_key = ? AND lease_owner = ? AND status = 'leased'",
+            (time.time() + lease_seconds, time.time(), job_key, worker_id)
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job_key, worker_id):
+        self.db.execute(
+            "UPDATE jobs SET status = 'done', lease_expires = NULL, updated = ? "
+            "WHERE job_key = ? AND lease_owner = ?",
+            (time.time(), job_key, worker_id)
+        )
+
+    def fail(self, job_key, worker_id, error):
+        """Requeues the job, or marks it failed after MAX_ATTEMPTS"""
+        self.db.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+            "lease_expires = NULL, last_error = ?, updated = ? "
+            "WHERE job_key = ? AND lease_owner = ?",
+            (MAX_ATTEMPTS, str(error), time.time(), job_key, worker_id)
+        )
+
+    def counts(self):
+        """Number of jobs per status"""
+        rows = self.db.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row['status']: row['n'] for row in rows}
@@ -0,0 +1,130 @@
+import json
+import time
+import sqlite3
+from sync_state import state_path
+from throttle import is_overloaded
+
+# Committed and failed entries are kept this long for inspection (cli.py status)
+RETENTION_SECONDS = 30 * 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS mutations (
+    key TEXT PRIMARY KEY,
+    op TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    lookup TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    page_id TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+class Journal:
+    """
+    Write-ahead journal for Notion mutations.
+
+    Every mutation is logged with an idempotency key before it is sent and
+    marked committed once Notion accepted it. After a crash, recover() replays
+    the pending entries only:
+    - updates are simply sent again (they are idempotent),
+    - creates first run their `lookup` query (database_id + filter) so a page
+      that was created just before the crash is not created twice.
+    Logging a key that was already committed (or failed) records a new intent:
+    the entry is pending again, so a later identical mutation is still sent.
+    An entry that fails for good during recovery is marked failed with its
+    error instead of blocking every later run.
+    """
+
+    def __init__(self, path=None):
+        self.db = sqlite3.connect(path or state_path("notion-journal.sqlite"), isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+        # Journals created before entries could fail have no error column
+        if "error" not in {row['name'] for row in self.db.execute("PRAGMA table_info(mutations)")}:
+            self.db.execute("ALTER TABLE mutations ADD COLUMN error TEXT")
+
+    def log(self, key, op, payload, lookup=None):
+        """Records an intended mutation; returns False if the same key is already pending"""
+        now = time.time()
+        cursor = self.db.execute(
+            "INSERT INTO mutations (key, op, payload, lookup, created, updated) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET op = excluded.op, payload = excluded.payload, lookup = excluded.lookup, "
+            "status = 'pending', page_id = NULL, error = NULL, created = excluded.created, updated = excluded.updated "
+            "WHERE status != 'pending'",
+            (key, op, json.dumps(payload), json.dumps(lookup) if lookup else None, now, now)
+        )
+        return cursor.rowcount == 1
+
+    def send(self, notion, key):
+        """Sends a logged mutation unless it is already committed; returns the page ID"""
+        row = self.db.execute("SELECT * FROM mutations WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(f"No journal entry for {key}")
+        if row['status'] == 'committed':
+            return row['page_id']
+
+        payload = json.loads(row['payload'])
+        if row['op'] == 'create':
+            result = notion.pages.create(**payload)
+        elif row['op'] == 'update':
+            result = notion.pages.update(**payload)
+        else:
+            raise ValueError(f"Unknown journal operation: {row['op']}")
+        self.commit(key, result.get('id') if isinstance(result, dict) else None)
+        return result.get('id') if isinstance(result, dict) else None
+
+    def execute(self, notion, key, op, payload, lookup=None):
+        """log() + send() for a single mutation"""
+        self.log(key, op, payload, lookup)
+        return self.send(notion, key)
+
+    def commit(self, key, page_id=None):
+        self.db.execute(
+            "UPDATE mutations SET status = 'committed', page_id = ?, updated = ? WHERE key = ?",
+            (page_id, time.time(), key)
+        )
+
+    def fail(self, key, error):
+        self.db.execute(
+            "UPDATE mutations SET status = 'failed', error = ?, updated = ? WHERE key = ?",
+            (str(error), time.time(), key)
+        )
+
+    def pending(self):
+        return self.db.execute("SELECT * FROM mutations WHERE status = 'pending' ORDER BY created").fetchall()
+
+    def failed(self):
+        return self.db.execute("SELECT * FROM mutations WHERE status = 'failed' ORDER BY updated").fetchall()
+
+    def recover(self, notion):
+        """Replays or skips pending entries from an interrupted run; returns how many were handled"""
+        handled = 0
+        for row in self.pending():
+            try:
+                if row['op'] == 'create' and row['lookup']:
+                    lookup = json.loads(row['lookup'])
+                    found = notion.databases.query(database_id=lookup['database_id'], filter=lookup['filter'])
+                    if found['results']:
+                        print(f"Recovered: {row['key']} was already applied")
+                        self.commit(row['key'], found['results'][0]['id'])
+                        handled += 1
+                        continue
+                print(f"Recovered: replaying {row['key']}")
+                self.send(notion, row['key'])
+            except Exception as e:
+                if is_overloaded(e):
+                    # Notion is busy, not the entry broken: stays pending for the next run
+                    print(f"Recovery of {row['key']} postponed: {e}")
+                    continue
+                # E.g. an update of a page that was archived or deleted since
+                print(f"Recovery of {row['key']} failed, giving up on it: {e}")
+                self.fail(row['key'], e)
+            handled += 1
+
+        self.db.execute(
+            "DELETE FROM mutations WHERE status IN ('committed', 'failed') AND updated < ?",
+            (time.time() - RETENTION_SECONDS,)
+        )
+        return handled
@@ -0,0 +1,87 @@
+import os
+import sys
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from clients import make_garmin, make_notion
+from stages import enabled_stages, load_stage, needs_garmin
+from sync_state import STATE_DIR, use_state_dir
+from throttle import Throttled, notion_limiter
+from instrumentation import timed_stage
+
+def load_roster(path):
+    """
+    Reads the tenant roster: a JSON list of objects with a "name" plus the same
+    settings the scripts read from the environment (GARMIN_EMAIL, NOTION_TOKEN,
+    NOTION_DB_ID, ...) and an optional "stages" list.
+    Values written as "env:SOME_SECRET" are read from the environment instead.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        roster = json.load(f)
+
+    tenants = []
+    for entry in roster:
+        config = {}
+        for key, value in entry.items():
+            if isinstance(value, str) and value.startswith("env:"):
+                value = os.getenv(value[4:])
+            config[key] = value
+        tenants.append(config)
+    return tenants
+
+def sync_tenant(tenant):
+    """Runs every enabled stage for one tenant with its own Garmin session and state folder"""
+    name = tenant['name']
+    stages = enabled_stages(tenant, tenant.get('stages'))
+    results = {}
+
+    with use_state_dir(os.path.join(STATE_DIR, name)):
+        garmin = None
+        if any(needs_garmin(stage) for stage in stages):
+            garmin = make_garmin(tenant)
+
+        notion = Throttled(make_notion(tenant), notion_limiter(tenant.get("NOTION_TOKEN")))
+
+        for stage in stages:
+            started = time.monotonic()
+            try:
+                with timed_stage(stage):
+                    load_stage(stage)(garmin, notion, tenant)
+                results[stage] = "ok"
+            except Exception as e:
+                results[stage] = f"error: {e}"
+                print(f"[{name}] Stage {stage} failed: {e}")
+            print(f"[{name}] {stage} finished in {time.monotonic() - started:.1f}s")
+
+    return results
+
+def sync_all(tenants, max_workers=None):
+    """Syncs all tenants concurrently; one slow tenant never blocks the others"""
+    summary = {}
+    max_workers = max_workers or min(32, len(tenants)) or 1
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(sync_tenant, tenant): tenant['name'] for tenant in tenants}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                summary[name] = future.result()
+            except Exception as e:
+                # Usually a failed Garmin login
+                summary[name] = {"login": f"error: {e}"}
+                print(f"[{name}] Sync failed: {e}")
+    return summary
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    roster_path = args[0] if args else os.getenv("TENANTS_FILE", "tenants.json")
+    tenants = load_roster(roster_path)
+    concurrency = os.getenv("TENANT_CONCURRENCY")
+
+    summary = sync_all(tenants, int(concurrency) if concurrency else None)
+    print(json.dumps(summary, indent=2))
+
+    if any(r.startswith("error") for results in summary.values() for r in results.values()):
+        exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Evaluates Notion database queries (filters, sorts, pagination) against pages
+held locally, in the shape the API returns them. Used by the local Notion
+snapshot (snapshot.py) and the fake Notion API (fakes.py).
+"""
+
+def plain_value(prop):
+    """Comparable value of a page property: text, date start, select name, number, ..."""
+    if prop is None:
+        return None
+    kind = prop['type']
+    value = prop.get(kind)
+    if kind in ("title", "rich_text"):
+        return "".join(item.get('plain_text') or item.get('text', {}).get('content', "") for item in value or [])
+    if kind == "date":
+        return value['start'] if value else None
+    if kind in ("select", "status"):
+        return value['name'] if value else None
+    return value
+
+def compare(actual, condition):
+    op, expected = next(iter(condition.items()))
+    if op == "is_empty":
+        return actual in (None, "", [])
+    if op == "is_not_empty":
+        return actual not in (None, "", [])
+    if actual is None:
+        return op == "does_not_equal"
+    if isinstance(expected, str) and len(expected) == 10 and isinstance(actual, str):
+        # Date-only filters compare calendar days
+        actual = actual[:10]
+    if op == "equals":
+        return actual == expected
+    if op == "does_not_equal":
+        return actual != expected
+    if op == "contains":
+        return expected in actual
+    if op in ("on_or_after", "greater_than_or_equal_to"):
+        return actual >= expected
+    if op in ("after", "greater_than"):
+        return actual > expected
+    if op in ("before", "less_than"):
+        return actual < expected
+    if op in ("on_or_before", "less_than_or_equal_to"):
+        return actual <= expected
+    raise ValueError(f"Unsupported filter operator: {op}")
+
+def matches(page, flt):
+    if not flt:
+        return True
+    if "and" in flt:
+        return all(matches(page, f) for f in flt["and"])
+    if "or" in flt:
+        return any(matches(page, f) for f in flt["or"])
+    if "timestamp" in flt:
+        return compare(page[flt["timestamp"]], flt[flt["timestamp"]])
+    condition = next(v for k, v in flt.items() if k not in ("property", "type"))
+    return compare(plain_value(page['properties'].get(flt['property'])), condition)
+
+def sort_pages(pages, sorts=None):
+    """Pages in the order of databases.query `sorts` (a new list)"""
+    results = list(pages)
+    for sort in reversed(sorts or []):
+        if "timestamp" in sort:
+            key = lambda p, s=sort: p[s['timestamp']]
+        else:
+            key = lambda p, s=sort: plain_value(p['properties'].get(s['property'])) or ""
+        results.sort(key=key, reverse=sort.get('direction') == "descending")
+    return results
+
+def query_response(pages, sorts=None, start_cursor=None, page_size=100, filter_properties=None):
+    """Sorts already filtered pages and returns one page of results like databases.query"""
+    return page_response(sort_pages(pages, sorts), start_cursor, page_size, filter_properties)
+
+def page_response(results, start_cursor=None, page_size=100, filter_properties=None):
+    """One page of already filtered and sorted results, like databases.query returns it"""
+    start = int(start_cursor or 0)
+    page_size = min(page_size or 100, 100)
+    chunk = results[start:start + page_size]
+    if filter_properties:
+        chunk = [dict(p, properties={k: v for k, v in p['properties'].items() if k in filter_properties}) for p in chunk]
+    has_more = start + page_size < len(results)
+    return {
+        "object": "list",
+        "results": chunk,
+        "has_more": has_more,
+        "next_cursor": str(start + page_size) if has_more else None,
+    }
@@ -0,0 +1,246 @@
+import os
+import json
+import hashlib
+import datetime
+import numpy as np
+import snapshot
+from journal import Journal
+from write_planner import WritePlanner
+from sync_state import load_state, save_state
+from instrumentation import instrument, timed_stage
+
+# Weekly (ISO week) and monthly totals of the synced daily steps and
+# activities, computed from the local Notion snapshot (snapshot.py) and
+# written as one summary page per period to the Rollups database.
+
+STATE_NAME = "rollups"
+PERIODS = ("Week", "Month")
+
+def to_days(dates):
+    """'YYYY-MM-DD...' strings -> datetime64[D] (None -> NaT)"""
+    return np.array([d[:10] if d else "NaT" for d in dates], dtype="datetime64[D]")
+
+def number_column(values):
+    return np.array([v if isinstance(v, (int, float)) else np.nan for v in values], dtype=np.float64)
+
+def period_starts(days, period):
+    """First day of each day's ISO week (Monday) or calendar month"""
+    if period == "Week":
+        # 1970-01-01 was a Thursday, so Monday is 3 days earlier
+        return days - (days.astype(np.int64) + 3) % 7
+    return days.astype("datetime64[M]").astype("datetime64[D]")
+
+def period_end(start, period):
+    if period == "Week":
+        return start + np.timedelta64(6, "D")
+    return (start.astype("datetime64[M]") + 1).astype("datetime64[D]") - np.timedelta64(1, "D")
+
+def period_name(start, period):
+    day = start.astype(datetime.date)
+    if period == "Week":
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    return day.strftime("%Y-%m")
+
+def group_sums(keys, values):
+    """Sums of `values` (NaN counts as 0) per unique key: (unique keys, sums)"""
+    unique, index = np.unique(keys, return_inverse=True)
+    return unique, np.bincount(index, weights=np.nan_to_num(values), minlength=len(unique))
+
+def load_steps(snap, database_id):
+    rows = snap.values(database_id, ["Date", "Total Steps", "Step Goal", "Total Distance (km)"]) if database_id else []
+    return {
+        "ids": [r[0] for r in rows],
+        "days": to_days([r[2] for r in rows]),
+        "edited": [r[1] for r in rows],
+        "steps": number_column([r[3] for r in rows]),
+        "goal": number_column([r[4] for r in rows]),
+        "distance": number_column([r[5] for r in rows]),
+    }
+
+def load_activities(snap, database_id):
+    rows = snap.values(database_id, ["Date", "Distance (km)", "Duration", "Sport"]) if database_id else []
+    return {
+        "ids": [r[0] for r in rows],
+        "days": to_days([r[2] for r in rows]),
+        "edited": [r[1] for r in rows],
+        "distance": number_column([r[3] for r in rows]),
+        "hours": number_column([r[4] for r in rows]) / 3600,
+        "sport": np.array([r[5] or "other" for r in rows], dtype=object),
+    }
+
+def empty_totals():
+    return {
+        "steps": 0, "step_days": 0, "goal_days": 0, "step_distance": 0.0,
+        "activities": 0, "distance": 0.0, "hours": 0.0, "sports": {},
+    }
+
+def aggregate(steps, activities, period):
+    """{period start (datetime64[D]): totals} for every period with data"""
+    totals = {}
+
+    def period_totals(start):
+        if start not in totals:
+            totals[start] = empty_totals()
+        return totals[start]
+
+    valid = ~np.isnat(steps["days"])
+    starts = period_starts(steps["days"][valid], period)
+    goal_hit = (steps["goal"][valid] > 0) & (steps["steps"][valid] >= steps["goal"][valid])
+    unique, step_sums = group_sums(starts, steps["steps"][valid])
+    _, day_counts = group_sums(starts, np.ones(len(starts)))
+    _, goal_counts = group_sums(starts, goal_hit.astype(np.float64))
+    _, step_distance = group_sums(starts, steps["distance"][valid])
+    for i, start in enumerate(unique):
+        t = period_totals(start)
+        t["steps"], t["step_days"], t["goal_days"] = int(step_sums[i]), int(day_counts[i]), int(goal_counts[i])
+        t["step_distance"] = float(step_distance[i])
+
+    valid = ~np.isnat(activities["days"])
+    starts = period_starts(activities["days"][valid], period)
+    sports = activities["sport"][valid]
+    keys = np.array([f"{s}|{sport}" for s, sport in zip(starts.astype(str), sports)])
+    unique, distances = group_sums(keys, activities["distance"][valid])
+    _, hours = group_sums(keys, activities["hours"][valid])
+    _, counts = group_sums(keys, np.ones(len(keys)))
+    for key, distance, duration, count in zip(unique, distances, hours, counts):
+        start, sport = key.split("|", 1)
+        t = period_totals(np.datetime64(start, "D"))
+        t["activities"] += int(count)
+        t["distance"] += float(distance)
+        t["hours"] += float(duration)
+        t["sports"][sport] = (float(distance), float(duration), int(count))
+    return totals
+
+def row_periods(data):
+    """{page ID: [week start, month start]} of the rows with a date, kept in state for the next run"""
+    valid = ~np.isnat(data["days"])
+    ids = [page_id for page_id, keep in zip(data["ids"], valid) if keep]
+    starts = [period_starts(data["days"][valid], period).astype(str).tolist() for period in PERIODS]
+    return {page_id: list(row) for page_id, *row in zip(ids, *starts)}
+
+def touched_starts(data, cursor, period, previous):
+    """
+    Periods with a row edited since `cursor` (all periods on the first run),
+    and the periods rows were in last run (`previous`, see row_periods) if they
+    have since moved to another period or been deleted or archived
+    """
+    # Notion rounds last_edited_time to the minute, so rows of the cursor's minute count too
+    edited = np.array([cursor is None or e >= cursor for e in data["edited"]], dtype=bool)
+    edited &= ~np.isnat(data["days"])
+    touched = set(period_starts(data["days"][edited], period).tolist())
+
+    current = row_periods(data)
+    index = PERIODS.index(period)
+    for page_id, starts in previous.items():
+        if current.get(page_id) != starts:
+            touched.add(datetime.date.fromisoformat(starts[index]))
+    return touched
+
+def rollup_properties(start, period, t):
+    sports = ", ".join(
+        f"{sport.replace('_', ' ')} {distance:.1f} km / {hours:.1f} h ({count}x)"
+        for sport, (distance, hours, count) in sorted(t["sports"].items(), key=lambda item: -item[1][1])
+    )
+    return {
+        "Period": {"title": [{"text": {"content": period_name(start, period)}}]},
+        "Type": {"select": {"name": period}},
+        "Date": {"date": {"start": str(start), "end": str(period_end(start, period))}},
+        "Steps": {"number": t["steps"]},
+        "Avg Daily Steps": {"number": round(t["steps"] / t["step_days"]) if t["step_days"] else None},
+        "Step Goal Hit Rate": {"number": round(t["goal_days"] / t["step_days"], 3) if t["step_days"] else None},
+        "Step Distance (km)": {"number": round(t["step_distance"], 2)},
+        "Activities": {"number": t["activities"]},
+        "Distance (km)": {"number": round(t["distance"], 2)},
+        "Duration (h)": {"number": round(t["hours"], 2)},
+        "Sport Volume": {"rich_text": [{"text": {"content": sports}}]},
+    }
+
+def sync_rollups(notion, config):
+    database_id = config.get("NOTION_ROLLUPS_DB_ID")
+    steps_db_id = config.get("NOTION_STEPS_DB_ID")
+    activities_db_id = config.get("NOTION_DB_ID")
+    if not database_id:
+        print("NOTION_ROLLUPS_DB_ID is not set, skipping rollups.")
+        return
+
+    # Bring the local copy of the source databases up to date
+    snap = snapshot.Snapshot()
+    exported = snap.export_all(notion, config, ["steps", "activities", "rollups"])
+    notion = snapshot.SnapshotReader(notion, snap, {db_id: name for name, db_id in exported.items()})
+
+    journal = Journal()
+    recovered = journal.recover(notion)
+    if recovered:
+        print(f"Recovered {recovered} pending mutations from the last run")
+
+    state = load_state(STATE_NAME, {"cursor": {}, "digests": {}, "periods": {}})
+    # States saved before rows' periods were kept have none; their moved rows are missed once
+    previous = state.get("periods", {})
+    steps = load_steps(snap, steps_db_id)
+    activities = load_activities(snap, activities_db_id)
+    # Rolling up empty sources would zero every period the rows were in last run
+    missing = snap.empty_after_export("steps", steps_db_id, steps["ids"])
+    missing |= snap.empty_after_export("activities", activities_db_id, activities["ids"])
+    if missing:
+        return
+
+    planner = WritePlanner()
+    # {period name: page ID} of the summary pages already in Notion
+    pages = {row[2]: row[0] for row in snap.values(database_id, ["Period"]) if row[2]}
+    digests = dict(state["digests"])
+    changed = 0
+    for period in PERIODS:
+        touched = touched_starts(steps, state["cursor"].get("steps"), period, previous.get("steps", {}))
+        touched |= touched_starts(activities, state["cursor"].get("activities"), period, previous.get("activities", {}))
+        if not touched:
+            continue
+        totals = aggregate(steps, activities, period)
+        for start in sorted(touched):
+            start = np.datetime64(start, "D")
+            # A period whose last row moved away or was deleted rolls up to zero
+            properties = rollup_properties(start, period, totals.get(start) or empty_totals())
+            name = period_name(start, period)
+            digest = hashlib.sha1(json.dumps(properties, sort_keys=True).encode()).hexdigest()[:16]
+            if digests.get(name) == digest and name in pages:
+                continue
+            digests[name] = digest
+            if name in pages:
+                planner.update(pages[name], properties)
+            else:
+                planner.create(f"rollup-create:{database_id}:{name}", database_id, properties, lookup={
+                    "database_id": database_id,
+                    "filter": {"property": "Period", "title": {"equals": name}}
+                })
+            changed += 1
+            print(f"Rolled up {period.lower()} {name}")
+
+    failed = planner.flush(notion, journal)
+    if failed:
+        # Keep the old cursors so the next run recomputes the same periods
+        print(f"{failed} rollup pages were not written")
+        return
+
+    save_state(STATE_NAME, {
+        "cursor": {
+            "steps": max(steps["edited"], default=state["cursor"].get("steps")),
+            "activities": max(activities["edited"], default=state["cursor"].get("activities")),
+        },
+        "digests": digests,
+        "periods": {"steps": row_periods(steps), "activities": row_periods(activities)},
+    })
+    if not changed:
+        print("All rollups are up to date.")
+
+def run(garmin, notion, config):
+    sync_rollups(notion, config)
+
+def main():
+    from notion_client import Client
+
+    notion = instrument(Client(auth=os.getenv("NOTION_TOKEN")), "notion")
+    with timed_stage("rollups"):
+        run(None, notion, os.environ)
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,9 @@
 from datetime import date, datetime
-from garminconnect import Garmin
-from notion_client import Client
+import async_io
+from journal import Journal
+from write_planner import WritePlanner
 import os
+from instrumentation import instrument, timed_stage
 
 def get_icon_for_record(activity_name):
     icon_map = {
@@ -156,31 +158,19 @@ def replace_activity_name_by_typeId(typeId):
     }
     return typeId_name_map.get(typeId, "Unnamed Activity")
 
-def get_existing_record(client, database_id, activity_name):
-    query = client.databases.query(
-        database_id=database_id,
-        filter={
+def existing_record_query(database_id, activity_name):
+    """Query that finds the current PR page of a record"""
+    return {
+        "database_id": database_id,
+        "filter": {
             "and": [
                 {"property": "Record", "title": {"equals": activity_name}},
                 {"property": "PR", "checkbox": {"equals": True}}
             ]
         }
-    )
-    return query['results'][0] if query['results'] else None
-
-def get_record_by_date_and_name(client, database_id, activity_date, activity_name):
-    query = client.databases.query(
-        database_id=database_id,
-        filter={
-            "and": [
-                {"property": "Record", "title": {"equals": activity_name}},
-                {"property": "Date", "date": {"equals": activity_date}}
-            ]
-        }
-    )
-    return query['results'][0] if query['results'] else None
+    }
 
-def update_record(client, page_id, activity_date, value, pace, activity_name, is_pr=True):
+def record_properties(activity_date, value, pace, is_pr=True):
     properties = {
         "Date": {"date": {"start": activity_date}},
         "PR": {"checkbox": is_pr}
@@ -192,9 +182,29 @@ def update_record(client, page_id, activity_date, value, pace, activity_name, is
     if pace:
         properties["Pace"] = {"rich_text": [{"text": {"content": pace}}]}
 
+    return properties
+
+def record_lookup(database_id, activity_date, activity_name):
+    """Query that finds a record page again, used by the journal after a crash"""
+    return {
+        "database_id": database_id,
+        "filter": {
+            "and": [
+                {"property": "Record", "title": {"equals": activity_name}},
+                {"property": "Date", "date": {"equals": activity_date}}
+            ]
+        }
+    }
+
+def update_record(client, page_id, activity_date, value, pace, activity_name, is_pr=True, planner=None):
+    properties = record_properties(activity_date, value, pace, is_pr)
     icon = get_icon_for_record(activity_name)
     cover = get_cover_for_record(activity_name)
 
+    if planner:
+        planner.update(page_id, properties, icon, cover)
+        return
+
     try:
         client.pages.update(
             page_id=page_id,
@@ -206,24 +216,19 @@ def update_record(client, page_id, activity_date, value, pace, activity_name, is
     except Exception as e:
         print(f"Error updating record: {e}")
 
-def write_new_record(client, database_id, activity_date, activity_type, activity_name, typeId, value, pace):
-    properties = {
-        "Date": {"date": {"start": activity_date}},
-        "Activity Type": {"select": {"name": activity_type}},
-        "Record": {"title": [{"text": {"content": activity_name}}]},
-        "typeId": {"number": typeId},
-        "PR": {"checkbox": True}
-    }
-    
-    if value:
-        properties["Value"] = {"rich_text": [{"text": {"content": value}}]}
-    
-    if pace:
-        properties["Pace"] = {"rich_text": [{"text": {"content": pace}}]}
-    
+def write_new_record(client, database_id, activity_date, activity_type, activity_name, typeId, value, pace, planner=None):
+    properties = record_properties(activity_date, value, pace)
+    properties["Activity Type"] = {"select": {"name": activity_type}}
+    properties["Record"] = {"title": [{"text": {"content": activity_name}}]}
+    properties["typeId"] = {"number": typeId}
     icon = get_icon_for_record(activity_name)
     cover = get_cover_for_record(activity_name)
 
+    if planner:
+        key = f"pr-create:{database_id}:{activity_name}:{activity_date}"
+        planner.create(key, database_id, properties, icon, cover, record_lookup(database_id, activity_date, activity_name))
+        return
+
     try:
         client.pages.create(
             parent={"database_id": database_id},
@@ -234,32 +239,40 @@ def write_new_record(client, database_id, activity_date, activity_type, activity
     except Exception as e:
         print(f"Error writing new record: {e}")
 
-def main():
-    garmin_email = os.getenv("GARMIN_EMAIL")
-    garmin_password = os.getenv("GARMIN_PASSWORD")
-    notion_token = os.getenv("NOTION_TOKEN")
-    database_id = os.getenv("NOTION_PR_DB_ID")
+def run(garmin, client, config):
+    database_id = config.get("NOTION_PR_DB_ID")
 
-    garmin = Garmin(garmin_email, garmin_password)
-    garmin.login()
+    # Finish whatever an interrupted run left pending before looking at Notion
+    journal = Journal()
+    recovered = journal.recover(client)
+    if recovered:
+        print(f"Recovered {recovered} pending mutations from the last run")
 
-    client = Client(auth=notion_token)
+    # All writes are planned first and sent at the end, one request per page
+    planner = WritePlanner()
 
     records = garmin.get_personal_record()
     filtered_records = [record for record in records if record.get('typeId') != 16]
 
+    # Both lookups of every record at once; nothing is written before the flush
+    lookups = []
     for record in filtered_records:
+        activity_name = replace_activity_name_by_typeId(record.get('typeId'))
+        lookups.append(existing_record_query(database_id, activity_name))
+        lookups.append(record_lookup(database_id, record.get('prStartTimeGmtFormatted'), activity_name))
+    found = [resp['results'][0] if resp['results'] else None for resp in async_io.query_many(client, lookups)]
+
+    for index, record in enumerate(filtered_records):
         activity_date = record.get('prStartTimeGmtFormatted')
         activity_type = format_activity_type(record.get('activityType'))
         activity_name = replace_activity_name_by_typeId(record.get('typeId'))
         typeId = record.get('typeId', 0)
         value, pace = format_garmin_value(record.get('value', 0), activity_type, typeId)
 
-        existing_pr_record = get_existing_record(client, database_id, activity_name)
-        existing_date_record = get_record_by_date_and_name(client, database_id, activity_date, activity_name)
+        existing_pr_record, existing_date_record = found[2 * index], found[2 * index + 1]
 
         if existing_date_record:
-            update_record(client, existing_date_record['id'], activity_date, value, pace, activity_name, True)
+            update_record(client, existing_date_record['id'], activity_date, value, pace, activity_name, True, planner)
             print(f"Updated existing record: {activity_type} - {activity_name}")
         elif existing_pr_record:
             # Add error handling here
@@ -269,25 +282,45 @@ def main():
                     existing_date = date_prop['date']['start']
                     
                     if activity_date > existing_date:
-                        update_record(client, existing_pr_record['id'], existing_date, None, None, activity_name, False)
+                        # The flush journals the archive and the new PR together, so a crash
+                        # after the archive still creates the new PR on the next run
+                        update_record(client, existing_pr_record['id'], existing_date, None, None, activity_name, False, planner)
                         print(f"Archived old record: {activity_type} - {activity_name}")
                         
-                        write_new_record(client, database_id, activity_date, activity_type, activity_name, typeId, value, pace)
+                        write_new_record(client, database_id, activity_date, activity_type, activity_name, typeId, value, pace, planner)
                         print(f"Created new PR record: {activity_type} - {activity_name}")
                     else:
                         print(f"No update needed: {activity_type} - {activity_name}")
                 else:
                     # Handle case where date is missing or improperly formatted
                     print(f"Warning: Record {activity_name} has invalid date format - updating anyway")
-                    update_record(client, existing_pr_record['id'], activity_date, value, pace, activity_name, True)
+                    update_record(client, existing_pr_record['id'], activity_date, value, pace, activity_name, True, planner)
             except (KeyError, TypeError) as e:
                 print(f"Error processing record {activity_name}: {e}")
                 print(f"Record data: {existing_pr_record['properties']}")
                 # Fallback - create new record if we can't process the existing one properly
-                write_new_record(client, database_id, activity_date, activity_type, activity_name, typeId, value, pace)
+                write_new_record(client, database_id, activity_date, activity_type, activity_name, typeId, value, pace, planner)
         else:
-            write_new_record(client, database_id, activity_date, activity_type, activity_name, typeId, value, pace)
+            write_new_record(client, database_id, activity_date, activity_type, activity_name, typeId, value, pace, planner)
             print(f"Successfully written new record: {activity_type} - {activity_name}")
 
+    planner.flush(client, journal)
+
+def main():
+    from garminconnect import Garmin
+    from notion_client import Client
+
+    garmin_email = os.getenv("GARMIN_EMAIL")
+    garmin_password = os.getenv("GARMIN_PASSWORD")
+    notion_token = os.getenv("NOTION_TOKEN")
+
+    garmin = instrument(Garmin(garmin_email, garmin_password), "garmin")
+    garmin.login()
+
+    client = instrument(Client(auth=notion_token), "notion")
+
+    with timed_stage("prs"):
+        run(garmin, client, os.environ)
+
 if __name__ == '__main__':
     main()
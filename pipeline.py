@@ -0,0 +1,89 @@
+import queue
+import threading
+
+# Items in flight between two stages. Small on purpose: memory stays constant
+# and a slow writer blocks the fetcher (backpressure).
+DEFAULT_QUEUE_SIZE = 2
+
+_DONE = object()
+
+def run_pipeline(source, stages, sink, maxsize=DEFAULT_QUEUE_SIZE):
+    """
+    Streams items from `source` (any iterable, e.g. a generator of Garmin pages)
+    through `stages` (callables item -> item, or None to drop the item) into
+    `sink` (callable, runs in the calling thread).
+
+    The source and every stage run in their own thread, connected by bounded
+    queues, so fetching overlaps with transforming and writing. The first
+    error in any stage stops the pipeline and is re-raised here.
+    """
+    stop = threading.Event()
+    errors = []
+    queues = [queue.Queue(maxsize) for _ in range(len(stages) + 1)]
+
+    def put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(q):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def fail(error):
+        errors.append(error)
+        stop.set()
+
+    def produce():
+        try:
+            for item in source:
+                if not put(queues[0], item):
+                    return
+        except BaseException as e:
+            fail(e)
+        finally:
+            put(queues[0], _DONE)
+
+    def work(fn, in_queue, out_queue):
+        try:
+            while True:
+                item = get(in_queue)
+                if item is _DONE:
+                    break
+                result = fn(item)
+                if result is not None and not put(out_queue, result):
+                    return
+        except BaseException as e:
+            fail(e)
+        finally:
+            put(out_queue, _DONE)
+
+    threads = [threading.Thread(target=produce, daemon=True)]
+    for i, fn in enumerate(stages):
+        threads.append(threading.Thread(target=work, args=(fn, queues[i], queues[i + 1]), daemon=True))
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            item = get(queues[-1])
+            if item is _DONE:
+                break
+            sink(item)
+    except BaseException as e:
+        fail(e)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
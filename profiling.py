@@ -0,0 +1,147 @@
+import os
+import sys
+import threading
+import contextlib
+
+# Any script run with SYNC_PROFILE=1 profiles each of its stages; the --profile
+# options of cli.py, benchmark.py, reconcile.py and sync-worker.py call enable()
+ENABLED = bool(os.getenv("SYNC_PROFILE"))
+INTERVAL = float(os.getenv("SYNC_PROFILE_INTERVAL", 0.005))   # seconds between samples
+TOP_N = int(os.getenv("SYNC_PROFILE_TOP", 20))
+
+# Where a sample's time goes, decided by the innermost matching frame
+CATEGORIES = ["garmin I/O", "notion I/O", "llm I/O", "json", "compute", "rate limit", "waiting"]
+PACKAGE_CATEGORIES = [
+    ("json", "json"),
+    ("garminconnect", "garmin I/O"),
+    ("garth", "garmin I/O"),
+    ("notion_client", "notion I/O"),
+    ("openai", "llm I/O"),
+]
+SERVICE_CATEGORIES = {"garmin": "garmin I/O", "notion": "notion I/O", "llm": "llm I/O", "openai": "llm I/O"}
+# Leaf functions of threads that are blocked rather than working (pipeline queues, locks,
+# the event loop of async_io.py; its select() counts as notion I/O while requests are in flight)
+WAITING = {("threading.py", "wait"), ("queue.py", "get"), ("queue.py", "put"), ("threading.py", "join"), ("selectors.py", "select")}
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+def _packages_of(code):
+    """Folder names on the path of a frame's file, e.g. {"site-packages", "notion_client", ...}"""
+    return set(code.co_filename.replace("\\", "/").split("/")[:-1])
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def classify(stack):
+    """Category of one sample; `stack` is a list of frames, innermost first"""
+    leaf = stack[0].f_code
+    if (os.path.basename(leaf.co_filename), leaf.co_name) in WAITING:
+        return "waiting"
+    if leaf.co_filename.endswith("throttle.py"):
+        # Sleeping in the token bucket or backing off after a 429
+        return "rate limit"
+    for frame in stack:
+        # Calls through instrumentation.Instrumented carry the service name
+        if frame.f_code.co_name == "call" and frame.f_code.co_filename.endswith("instrumentation.py"):
+            service = str(frame.f_locals.get("name", "")).split(".")[0]
+            if service in SERVICE_CATEGORIES:
+                return SERVICE_CATEGORIES[service]
+        packages = _packages_of(frame.f_code)
+        for package, category in PACKAGE_CATEGORIES:
+            if package in packages:
+                return category
+    return "compute"
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every thread (except its own) at a fixed interval.
+    Cheap enough to leave on for a whole run, and it sees time spent waiting
+    on the network, which a deterministic profiler attributes poorly.
+    """
+
+    def __init__(self, interval=INTERVAL):
+        self.interval = interval
+        self.stacks = {}        # "root;...;leaf" -> samples
+        self.categories = dict.fromkeys(CATEGORIES, 0)
+        self.leaves = {}        # innermost function -> samples
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame)
+                frame = frame.f_back
+            category = classify(stack)
+            # The async_io loop blocks in select() both when idle and when awaiting Notion responses
+            async_io = sys.modules.get("async_io")
+            if category == "waiting" and async_io and async_io.waiting_on_notion(thread_id):
+                category = "notion I/O"
+            self.categories[category] += 1
+            collapsed = ";".join(_frame_label(f) for f in reversed(stack))
+            self.stacks[collapsed] = self.stacks.get(collapsed, 0) + 1
+            if category != "waiting":
+                leaf = _frame_label(stack[0])
+                self.leaves[leaf] = self.leaves.get(leaf, 0) + 1
+            self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write_collapsed(self, path):
+        """Folded stacks, one "frame;frame;frame count" per line (flamegraph.pl, speedscope)"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+    def summary(self, top_n=TOP_N):
+        working = sum(count for category, count in self.categories.items() if category != "waiting")
+        lines = [f"{self.samples} samples every {self.interval * 1000:.0f}ms, {working} while working"]
+        for category in CATEGORIES:
+            count = self.categories[category]
+            share = count / working * 100 if working and category != "waiting" else 0
+            lines.append(f"  {category:<12} {count * self.interval:>8.2f}s" + (f"  {share:5.1f}%" if category != "waiting" else ""))
+        lines.append(f"Top {top_n} functions (self time while working):")
+        for leaf, count in sorted(self.leaves.items(), key=lambda item: -item[1])[:top_n]:
+            lines.append(f"  {count * self.interval:>8.2f}s  {leaf}")
+        return "\n".join(lines)
+
+@contextlib.contextmanager
+def profiled(name):
+    """Profiles the block when profiling is enabled; writes <report dir>/profiles/<run id>-<name>.*"""
+    if not ENABLED:
+        yield None
+        return
+
+    from instrumentation import REPORT_DIR, RUN_ID
+
+    profiler = SamplingProfiler()
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        base = os.path.join(REPORT_DIR, "profiles", f"{RUN_ID}-{name}")
+        profiler.write_collapsed(base + ".collapsed")
+        summary = profiler.summary()
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(summary + "\n")
+        print(f"Profile of {name}:\n{summary}\nFlame graph input: {base}.collapsed")
@@ -0,0 +1,391 @@
+import os
+import json
+import hashlib
+import argparse
+import datetime
+import importlib
+import async_io
+import profiling
+from clients import make_garmin, make_notion
+from instrumentation import timed_stage
+from journal import Journal
+from sync_state import load_state, save_state
+from write_planner import WritePlanner
+
+activities_script = importlib.import_module("garmin-activities")
+steps_script = importlib.import_module("daily-steps")
+sleep_script = importlib.import_module("sleep-data")
+
+# Sleep nights older than this are final on Garmin's side and kept in the local archive
+SLEEP_FINAL_AFTER_DAYS = 3
+# Sleep nights fetched at once; the archive is saved after each window
+SLEEP_FETCH_WINDOW_NIGHTS = 31
+# A month is final once it ended this many days ago. Final months found in sync are
+# only checked again when their Notion pages change, and all of them every
+# RECONCILE_FULL_DAYS days (edits in Garmin, pages deleted in Notion).
+MONTH_FINAL_AFTER_DAYS = 7
+FULL_CHECK_DAYS = float(os.getenv("RECONCILE_FULL_DAYS", 30))
+
+# --- NOTION PROPERTY READERS ---
+
+def _text(prop):
+    kind = prop.get('type') or ('title' if 'title' in prop else 'rich_text')
+    return "".join(item.get('plain_text') or item.get('text', {}).get('content', "") for item in prop.get(kind) or [])
+
+def _number(value):
+    """Numbers compared on both sides, so 3600 and 3600.0 get the same digest"""
+    return round(float(value), 2) if value is not None else None
+
+def _prop_number(prop):
+    return _number(prop.get('number')) if prop else None
+
+def _prop_date(prop):
+    date = prop.get('date') if prop else None
+    return date['start'][:10] if date and date.get('start') else None
+
+# --- DOMAINS ---
+# Each domain returns entries as {key: (date, fingerprint, garmin data or None)}.
+# The fingerprint holds the fields the sync writes, read the same way on both sides.
+
+def garmin_activities(garmin, first, last):
+    entries = {}
+    for activity in garmin.get_activities_by_date(first.isoformat(), last.isoformat()):
+        entries[str(activity['activityId'])] = (activity['startTimeLocal'][:10], (
+            activity['activityName'],
+            activity['activityType']['typeKey'],
+            _number(round(activity['distance'] / 1000, 2)),
+            _number(activity['duration']),
+        ), activity)
+    return entries
+
+def notion_activity(page):
+    props = page['properties']
+    return _text(props.get('Activity ID', {})), _prop_date(props.get('Date')), (
+        _text(props.get('Activity Name', {})),
+        (props.get('Sport', {}).get('select') or {}).get('name'),
+        _prop_number(props.get('Distance (km)')),
+        _prop_number(props.get('Duration')),
+    )
+
+def repair_activity(planner, garmin, database_id, key, activity, page_id):
+    properties = activities_script.build_activity_properties(activity)
+    if page_id:
+        planner.update(page_id, properties)
+    else:
+        planner.create(f"activity-create:{database_id}:{key}", database_id, properties, lookup={
+            "database_id": database_id,
+            "filter": {"property": "Activity ID", "rich_text": {"equals": key}}
+        })
+
+def garmin_steps(garmin, first, last):
+    entries = {}
+    start = first
+    while start <= last:
+        chunk_end = min(start + datetime.timedelta(days=steps_script.BACKFILL_CHUNK_DAYS - 1), last)
+        for steps in garmin.get_daily_steps(start.isoformat(), chunk_end.isoformat()):
+            properties = steps_script.build_steps_properties(steps)
+            entries[steps['calendarDate']] = (steps['calendarDate'], (
+                _number(properties["Total Steps"]["number"]),
+                _number(properties["Step Goal"]["number"]),
+                _number(properties["Total Distance (km)"]["number"]),
+            ), steps)
+        start = chunk_end + datetime.timedelta(days=1)
+    return entries
+
+def notion_steps(page):
+    props = page['properties']
+    date = _prop_date(props.get('Date'))
+    return date, date, (
+        _prop_number(props.get('Total Steps')),
+        _prop_number(props.get('Step Goal')),
+        _prop_number(props.get('Total Distance (km)')),
+    )
+
+def repair_steps(planner, garmin, database_id, key, steps, page_id):
+    properties = steps_script.build_steps_properties(steps)
+    if page_id:
+        planner.update(page_id, properties)
+    else:
+        planner.create(f"steps-create:{database_id}:{key}", database_id, properties, lookup={
+            "database_id": database_id,
+            "filter": {"property": "Date", "date": {"equals": key}}
+        })
+
+def sleep_fingerprint(properties):
+    return (_number(properties["Total Sleep (h)"]["number"]), _number(properties["Resting HR"]["number"]))
+
+def garmin_sleep(garmin, first, last):
+    """
+    Garmin has no range endpoint for sleep, so fingerprints of final nights are
+    kept in a local archive and only new nights are fetched, a window at a time.
+    Only nights that are not final keep their response; a repair fetches the others again.
+    """
+    archive = load_state("reconcile_sleep", {})
+    final_before = (datetime.date.today() - datetime.timedelta(days=SLEEP_FINAL_AFTER_DAYS)).isoformat()
+    entries = {}
+    missing = []
+    day = first
+    while day <= last:
+        date = day.isoformat()
+        day += datetime.timedelta(days=1)
+        if date in archive:
+            if archive[date] is not None:
+                entries[date] = (date, tuple(archive[date]), None)
+        else:
+            missing.append(date)
+
+    # New nights are fetched in parallel windows, as fast as Garmin allows (see throttle.Adaptive);
+    # saving after each window keeps the nights fetched so far if a later window fails
+    for window in range(0, len(missing), SLEEP_FETCH_WINDOW_NIGHTS):
+        dates = missing[window:window + SLEEP_FETCH_WINDOW_NIGHTS]
+        for date, data in zip(dates, async_io.garmin_many(garmin, "get_sleep_data", [(date,) for date in dates])):
+            properties = sleep_script.build_sleep_properties(data or {})
+            fingerprint = sleep_fingerprint(properties) if properties else None
+            final = date < final_before
+            if fingerprint:
+                entries[date] = (date, fingerprint, None if final else data)
+            if final:
+                archive[date] = list(fingerprint) if fingerprint else None
+        save_state("reconcile_sleep", archive)
+    return entries
+
+def notion_sleep(page):
+    props = page['properties']
+    date = _prop_date(props.get('Long Date'))
+    return date, date, (_prop_number(props.get('Total Sleep (h)')), _prop_number(props.get('Resting HR')))
+
+def repair_sleep(planner, garmin, database_id, key, data, page_id):
+    # Archived nights only have a fingerprint, fetch the full night for the repair
+    properties = sleep_script.build_sleep_properties(data or garmin.get_sleep_data(key))
+    if not properties:
+        return
+    if page_id:
+        planner.update(page_id, properties, icon="😴")
+    else:
+        planner.create(f"sleep-create:{database_id}:{key}", database_id, properties, icon="😴", lookup={
+            "database_id": database_id,
+            "filter": {"property": "Long Date", "date": {"equals": key}}
+        })
+
+# name -> (database setting, date property, Notion properties to read, garmin entries, notion entry, repair)
+DOMAINS = {
+    "activities": ("NOTION_DB_ID", "Date", ["Activity ID", "Activity Name", "Date", "Sport", "Distance (km)", "Duration"],
+                   garmin_activities, notion_activity, repair_activity),
+    "sleep": ("NOTION_SLEEP_DB_ID", "Long Date", ["Long Date", "Total Sleep (h)", "Resting HR"],
+              garmin_sleep, notion_sleep, repair_sleep),
+    "steps": ("NOTION_STEPS_DB_ID", "Date", ["Date", "Total Steps", "Step Goal", "Total Distance (km)"],
+              garmin_steps, notion_steps, repair_steps),
+}
+
+# --- RECONCILIATION ---
+
+def scan_notion(notion, database_id, date_property, properties, first, last, read_entry):
+    """
+    Reads a date range of a database with a paginated query that only returns the
+    needed properties; returns ({key: (date, fingerprint, page ID)}, duplicate page IDs).
+    """
+    entries = {}
+    duplicates = []
+    has_more = True
+    next_cursor = None
+    while has_more:
+        query = notion.databases.query(
+            database_id=database_id,
+            filter={
+                "and": [
+                    {"property": date_property, "date": {"on_or_after": first.isoformat()}},
+                    {"property": date_property, "date": {"on_or_before": last.isoformat()}}
+                ]
+            },
+            filter_properties=properties,
+            start_cursor=next_cursor,
+            page_size=100
+        )
+        for page in query['results']:
+            key, date, fingerprint = read_entry(page)
+            if not key or not date:
+                continue
+            if key in entries:
+                duplicates.append(page['id'])
+                continue
+            entries[key] = (date, fingerprint, page['id'])
+        has_more = query['has_more']
+        next_cursor = query['next_cursor']
+    return entries, duplicates
+
+def bucket_digests(entries):
+    """One digest per month over the sorted (key, fingerprint) pairs of that month"""
+    buckets = {}
+    for key, (date, fingerprint, _) in entries.items():
+        buckets.setdefault(date[:7], []).append(json.dumps([key, fingerprint]))
+    return {
+        month: hashlib.sha1("\n".join(sorted(lines)).encode()).hexdigest()
+        for month, lines in buckets.items()
+    }
+
+def month_ranges(first, last):
+    """(first day, last day) of each month from `first` to `last`, clipped to both"""
+    ranges = []
+    start = first
+    while start <= last:
+        next_month = (start.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+        ranges.append((start, min(next_month - datetime.timedelta(days=1), last)))
+        start = next_month
+    return ranges
+
+def edited_months(notion, database_id, date_property, first, last, since):
+    """Months (YYYY-MM) of the range with a page edited since `since`; the query returns only the dates"""
+    pages = async_io.run(async_io.query_all(notion, database_id=database_id, filter={
+        "and": [
+            {"property": date_property, "date": {"on_or_after": first.isoformat()}},
+            {"property": date_property, "date": {"on_or_before": last.isoformat()}},
+            {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": since}},
+        ]
+    }, filter_properties=[date_property]))
+    return {date[:7] for page in pages if (date := _prop_date(page['properties'].get(date_property)))}
+
+def months_to_check(notion, database_id, date_property, first, last, state):
+    """
+    Month ranges that need both sides read: all of them on a full check, else the
+    months that are not final, not verified in sync yet or edited in Notion since
+    the last check. Returns (ranges, full check?)
+    """
+    ranges = month_ranges(first, last)
+    full_checked = state.get("full_checked")
+    age = datetime.datetime.now(datetime.timezone.utc) - datetime.datetime.fromisoformat(full_checked) if full_checked else None
+    if age is None or age > datetime.timedelta(days=FULL_CHECK_DAYS):
+        return ranges, True
+
+    final_before = datetime.date.today() - datetime.timedelta(days=MONTH_FINAL_AFTER_DAYS)
+    verified = state.get("verified", {})
+    edited = edited_months(notion, database_id, date_property, first, last, state["checked"])
+    return [
+        (start, end) for start, end in ranges
+        if end >= final_before or start.isoformat()[:7] not in verified or start.isoformat()[:7] in edited
+    ], False
+
+def reconcile_domain(name, garmin, notion, database_id, first, last, planner=None, state=None):
+    """
+    Compares month digests and repairs (if a planner is given) only the entries of
+    differing months. `state` (updated in place) remembers the final months found
+    in sync, which are skipped while their Notion pages stay unchanged.
+    """
+    _, date_property, properties, garmin_entries, read_entry, repair = DOMAINS[name]
+    state = {} if state is None else state
+    # Notion rounds last_edited_time down to the minute
+    started = datetime.datetime.now(datetime.timezone.utc).replace(second=0, microsecond=0).isoformat()
+    ranges, full = months_to_check(notion, database_id, date_property, first, last, state)
+
+    # Both sides are read a month at a time, and only for the months to check
+    garmin_side, notion_side, duplicates = {}, {}, []
+    for start, end in ranges:
+        garmin_side.update(garmin_entries(garmin, start, end))
+        month_notion, month_duplicates = scan_notion(notion, database_id, date_property, properties, start, end, read_entry)
+        notion_side.update(month_notion)
+        duplicates += month_duplicates
+    garmin_digests = bucket_digests(garmin_side)
+    notion_digests = bucket_digests(notion_side)
+
+    months = [start.isoformat()[:7] for start, _ in month_ranges(first, last)]
+    checked = [start.isoformat()[:7] for start, _ in ranges]
+    differing = [m for m in checked if garmin_digests.get(m) != notion_digests.get(m)]
+    verified = state.setdefault("verified", {})
+    for month in checked:
+        if month in differing:
+            verified.pop(month, None)
+        else:
+            verified[month] = garmin_digests.get(month)
+    state["checked"] = started
+    if full:
+        state["full_checked"] = started
+    print(f"{name}: {len(months) - len(differing)}/{len(months)} months in sync "
+          f"({len(months) - len(checked)} final months skipped, unchanged since verified), "
+          f"{len(garmin_side)} in Garmin, {len(notion_side)} in Notion")
+
+    stats = {"months": len(months), "checked_months": len(checked), "differing_months": differing,
+             "missing": 0, "different": 0, "only_in_notion": 0, "duplicates": len(duplicates)}
+    for month in differing:
+        month_garmin = {k: v for k, v in garmin_side.items() if v[0][:7] == month}
+        month_notion = {k: v for k, v in notion_side.items() if v[0][:7] == month}
+        for key, (_, fingerprint, data) in sorted(month_garmin.items()):
+            existing = month_notion.get(key)
+            if existing is None:
+                stats["missing"] += 1
+                print(f"  {month} missing in Notion: {key}")
+            elif existing[1] != fingerprint:
+                stats["different"] += 1
+                print(f"  {month} differs: {key}")
+            else:
+                continue
+            if planner is not None:
+                repair(planner, garmin, database_id, key, data, existing[2] if existing else None)
+        for key in sorted(set(month_notion) - set(month_garmin)):
+            stats["only_in_notion"] += 1
+            print(f"  {month} only in Notion (left as is): {key}")
+
+    if duplicates:
+        print(f"  {len(duplicates)} duplicate pages in Notion (left as is)")
+    return stats
+
+def reconcile(garmin, notion, config, domains=None, months=12, repair=True):
+    """Checks the last `months` months (up to yesterday) of each domain; returns stats per domain"""
+    last = datetime.date.today() - datetime.timedelta(days=1)
+    first = last.replace(day=1)
+    for _ in range(months - 1):
+        first = (first - datetime.timedelta(days=1)).replace(day=1)
+
+    journal = planner = None
+    if repair:
+        journal = Journal()
+        journal.recover(notion)
+        planner = WritePlanner()
+
+    # {"<domain>:<database ID>": {"verified": {month: digest}, "checked", "full_checked"}}
+    month_state = load_state("reconcile_months", {})
+    results = {}
+    for name in domains or list(DOMAINS):
+        database_id = config.get(DOMAINS[name][0])
+        if not database_id:
+            print(f"{name}: {DOMAINS[name][0]} not set, skipping")
+            continue
+        results[name] = reconcile_domain(name, garmin, notion, database_id, first, last, planner,
+                                         month_state.setdefault(f"{name}:{database_id}", {}))
+
+    if planner is not None:
+        planner.flush(notion, journal)
+    save_state("reconcile_months", month_state)
+
+    # Read by `python cli.py status` without touching Garmin or Notion
+    save_state("reconcile_status", {
+        "checked": datetime.datetime.now().isoformat(timespec="seconds"),
+        "months": months,
+        "repaired": repair,
+        "domains": results,
+    })
+    return results
+
+def run(garmin, notion, config):
+    reconcile(garmin, notion, config, months=int(config.get("RECONCILE_MONTHS", 12)))
+
+def add_arguments(parser):
+    parser.add_argument("--months", type=int, default=12, help="How many months back to check")
+    parser.add_argument("--domains", default=",".join(DOMAINS), help="Comma separated: " + ", ".join(DOMAINS))
+    parser.add_argument("--dry-run", action="store_true", help="Only report differences")
+    parser.add_argument("--profile", action="store_true", help="Profile the run (see profiling.py)")
+
+def main(args=None):
+    if args is None:
+        parser = argparse.ArgumentParser(description="Find and repair drift between Garmin and Notion, month by month")
+        add_arguments(parser)
+        args = parser.parse_args()
+    if args.profile:
+        profiling.enable()
+
+    garmin = make_garmin(os.environ)
+    notion = make_notion(os.environ)
+
+    with timed_stage("reconcile"):
+        reconcile(garmin, notion, os.environ, [d for d in args.domains.split(",") if d], args.months, not args.dry_run)
+
+if __name__ == '__main__':
+    main()
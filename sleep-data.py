@@ -1,17 +1,12 @@
 from datetime import datetime
-from garminconnect import Garmin
-from notion_client import Client
-from dotenv import load_dotenv, dotenv_values
+from dotenv import load_dotenv
 import pytz
 import os
+from instrumentation import instrument, timed_stage
 
 # Constants
 local_tz = pytz.timezone("America/New_York")
 
-# Load environment variables
-load_dotenv()
-CONFIG = dotenv_values()
-
 def get_sleep_data(garmin):
     today = datetime.today().date()
     return garmin.get_sleep_data(today.isoformat())
@@ -43,10 +38,11 @@ def sleep_data_exists(client, database_id, sleep_date):
     results = query.get('results', [])
     return results[0] if results else None  # Ensure it returns None instead of causing IndexError
 
-def create_sleep_data(client, database_id, sleep_data, skip_zero_sleep=True):
+def build_sleep_properties(sleep_data, skip_zero_sleep=True):
+    """Maps Garmin sleep data to Notion page properties, or None if there is nothing to write"""
     daily_sleep = sleep_data.get('dailySleepDTO', {})
     if not daily_sleep:
-        return
+        return None
     
     sleep_date = daily_sleep.get('calendarDate', "Unknown Date")
     total_sleep = sum(
@@ -56,7 +52,7 @@ def create_sleep_data(client, database_id, sleep_data, skip_zero_sleep=True):
     
     if skip_zero_sleep and total_sleep == 0:
         print(f"Skipping sleep data for {sleep_date} as total sleep is 0")
-        return
+        return None
 
     properties = {
         "Date": {"title": [{"text": {"content": format_date_for_name(sleep_date)}}]},
@@ -75,29 +71,44 @@ def create_sleep_data(client, database_id, sleep_data, skip_zero_sleep=True):
         "Awake Time": {"rich_text": [{"text": {"content": format_duration(daily_sleep.get('awakeSleepSeconds', 0))}}]},
         "Resting HR": {"number": sleep_data.get('restingHeartRate', 0)}
     }
-    
+    return properties
+
+def create_sleep_data(client, database_id, sleep_data, skip_zero_sleep=True):
+    properties = build_sleep_properties(sleep_data, skip_zero_sleep)
+    if not properties:
+        return
+
+    sleep_date = properties["Long Date"]["date"]["start"]
     client.pages.create(parent={"database_id": database_id}, properties=properties, icon={"emoji": "😴"})
     print(f"Created sleep entry for: {sleep_date}")
 
+def run(garmin, client, config):
+    database_id = config.get("NOTION_SLEEP_DB_ID")
+
+    data = get_sleep_data(garmin)
+    if data:
+        sleep_date = data.get('dailySleepDTO', {}).get('calendarDate')
+        if sleep_date and not sleep_data_exists(client, database_id, sleep_date):
+            create_sleep_data(client, database_id, data, skip_zero_sleep=True)
+
 def main():
+    from garminconnect import Garmin
+    from notion_client import Client
+
     load_dotenv()
 
     # Initialize Garmin and Notion clients using environment variables
     garmin_email = os.getenv("GARMIN_EMAIL")
     garmin_password = os.getenv("GARMIN_PASSWORD")
     notion_token = os.getenv("NOTION_TOKEN")
-    database_id = os.getenv("NOTION_SLEEP_DB_ID")
 
     # Initialize Garmin client and login
-    garmin = Garmin(garmin_email, garmin_password)
+    garmin = instrument(Garmin(garmin_email, garmin_password), "garmin")
     garmin.login()
-    client = Client(auth=notion_token)
+    client = instrument(Client(auth=notion_token), "notion")
 
-    data = get_sleep_data(garmin)
-    if data:
-        sleep_date = data.get('dailySleepDTO', {}).get('calendarDate')
-        if sleep_date and not sleep_data_exists(client, database_id, sleep_date):
-            create_sleep_data(client, database_id, data, skip_zero_sleep=True)
+    with timed_stage("sleep"):
+        run(garmin, client, os.environ)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,249 @@
+import os
+import argparse
+import datetime
+import numpy as np
+import async_io
+import snapshot
+from journal import Journal
+from write_planner import WritePlanner
+from sync_state import state_path
+from instrumentation import timed_stage
+
+# Per-night sleep timelines, one compressed .npz per night in .sync-state/sleep/:
+#   start_ms, local_offset_s   sleep start (GMT ms) and local time offset
+#   levels_start/_end/_v       sleep level segments (seconds from start; 0 deep, 1 light, 2 REM, 3 awake)
+#   movement_t/_v, hr_t/_v, spo2_t/_v   series during the night (seconds from start)
+# The sleep-quality metrics are computed over every stored night at once and
+# written to the existing pages of the Sleep database.
+
+AWAKE = 3
+# Nights older than this are final on Garmin's side and never fetched again
+FINAL_AFTER_DAYS = 1
+# Nights of raw responses held in memory at once while fetching
+FETCH_WINDOW_NIGHTS = 31
+# Bedtime variability is the standard deviation over this many nights,
+# computed once at least BEDTIME_MIN_NIGHTS of them have data
+BEDTIME_WINDOW_NIGHTS = 7
+BEDTIME_MIN_NIGHTS = 3
+
+METRICS = [
+    "Sleep Onset (min)",
+    "Wake Episodes",
+    "Awake After Onset (min)",
+    "Longest Wake (min)",
+    "Stage Transitions",
+    "Bedtime Variability (min)",
+]
+
+def store_dir():
+    path = state_path("sleep")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def night_path(cdate):
+    return os.path.join(store_dir(), f"{cdate}.npz")
+
+def _ms(value):
+    """GMT timestamp in ms from Garmin's epoch ms or '2024-01-01T23:10:00.0' strings"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    return int(np.datetime64(value[:19], "s").astype(np.int64)) * 1000
+
+def _series(rows, start_ms, time_key, value_key, dtype):
+    rows = [r for r in rows or [] if r.get(value_key) is not None and r.get(time_key) is not None]
+    seconds = np.array([(_ms(r[time_key]) - start_ms) // 1000 for r in rows], dtype=np.int64)
+    values = np.array([r[value_key] for r in rows], dtype=np.float64)
+    keep = seconds >= 0
+    return seconds[keep].astype(np.uint32), values[keep].astype(dtype)
+
+def parse_night(sleep_data):
+    """Arrays to store for one night's get_sleep_data response (empty when there was no sleep)"""
+    daily = (sleep_data or {}).get('dailySleepDTO') or {}
+    start_ms = daily.get('sleepStartTimestampGMT')
+    if not start_ms:
+        return {"start_ms": np.int64(0), "local_offset_s": np.int32(0)}
+
+    local = daily.get('sleepStartTimestampLocal') or start_ms
+    levels = [l for l in sleep_data.get('sleepLevels') or [] if l.get('activityLevel') is not None]
+    arrays = {
+        "start_ms": np.int64(start_ms),
+        "local_offset_s": np.int32((local - start_ms) // 1000),
+        "levels_start": np.array([max(0, (_ms(l['startGMT']) - start_ms) // 1000) for l in levels], dtype=np.uint32),
+        "levels_end": np.array([max(0, (_ms(l['endGMT']) - start_ms) // 1000) for l in levels], dtype=np.uint32),
+        "levels_v": np.array([round(l['activityLevel']) for l in levels], dtype=np.uint8),
+    }
+    arrays["movement_t"], arrays["movement_v"] = _series(sleep_data.get('sleepMovement'), start_ms, 'startGMT', 'activityLevel', np.float16)
+    arrays["hr_t"], arrays["hr_v"] = _series(sleep_data.get('sleepHeartRate'), start_ms, 'startGMT', 'value', np.uint8)
+    arrays["spo2_t"], arrays["spo2_v"] = _series(sleep_data.get('wellnessEpochSPO2DataDTOList'), start_ms, 'epochTimestamp', 'spo2Reading', np.uint8)
+    return arrays
+
+def save_night(cdate, arrays):
+    path = night_path(cdate)
+    tmp_path = f"{path}.tmp.npz"
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+def sync_nights(garmin, days=3, today=None):
+    """Stores the last `days` nights; final nights that are already stored are skipped"""
+    today = today or datetime.date.today()
+    final_before = today - datetime.timedelta(days=FINAL_AFTER_DAYS)
+    wanted = []
+    for offset in range(days - 1, -1, -1):
+        day = today - datetime.timedelta(days=offset)
+        if day < final_before and os.path.exists(night_path(day.isoformat())):
+            continue
+        wanted.append(day.isoformat())
+
+    # Nights are fetched in parallel windows, as fast as Garmin allows (see throttle.Adaptive)
+    for window in range(0, len(wanted), FETCH_WINDOW_NIGHTS):
+        dates = wanted[window:window + FETCH_WINDOW_NIGHTS]
+        for cdate, data in zip(dates, async_io.garmin_many(garmin, "get_sleep_data", [(d,) for d in dates])):
+            save_night(cdate, parse_night(data))
+    if wanted:
+        print(f"Stored {len(wanted)} sleep timelines in {store_dir()}")
+    return len(wanted)
+
+def load_nights():
+    """Every stored night with sleep, concatenated: (dates, start_ms, local_offset_s, levels per night, start, end, level)"""
+    dates, starts, offsets, counts, seg_start, seg_end, seg_level = [], [], [], [], [], [], []
+    for name in sorted(os.listdir(store_dir())):
+        if not name.endswith(".npz") or ".tmp" in name:
+            continue
+        with np.load(os.path.join(store_dir(), name)) as night:
+            if not night["start_ms"] or "levels_v" not in night.files or not len(night["levels_v"]):
+                continue
+            dates.append(name[:-4])
+            starts.append(int(night["start_ms"]))
+            offsets.append(int(night["local_offset_s"]))
+            order = np.argsort(night["levels_start"], kind="stable")
+            counts.append(len(order))
+            seg_start.append(night["levels_start"][order])
+            seg_end.append(night["levels_end"][order])
+            seg_level.append(night["levels_v"][order])
+
+    if not dates:
+        empty = np.zeros(0, dtype=np.int64)
+        return np.zeros(0, dtype="datetime64[D]"), empty, empty, empty, empty, empty, empty
+    return (
+        np.array(dates, dtype="datetime64[D]"), np.array(starts, dtype=np.int64), np.array(offsets, dtype=np.int64),
+        np.array(counts, dtype=np.int64), np.concatenate(seg_start).astype(np.int64),
+        np.concatenate(seg_end).astype(np.int64), np.concatenate(seg_level).astype(np.int64),
+    )
+
+def bedtime_variability(dates, bedtimes, window=BEDTIME_WINDOW_NIGHTS, min_nights=BEDTIME_MIN_NIGHTS):
+    """Standard deviation (min) of the bedtimes of the `window` calendar nights ending at each night"""
+    if not len(dates):
+        return np.zeros(0)
+    day_index = (dates - dates.min()).astype(np.int64)
+    calendar = np.full(day_index.max() + window, np.nan)
+    calendar[day_index + window - 1] = bedtimes
+    windows = np.lib.stride_tricks.sliding_window_view(calendar, window)[day_index]
+    present = np.sum(~np.isnan(windows), axis=1)
+    mean = np.nansum(windows, axis=1) / present
+    std = np.sqrt(np.nansum((windows - mean[:, None]) ** 2, axis=1) / present)
+    return np.where(present >= min_nights, std, np.nan)
+
+def compute_metrics(dates, starts, offsets, counts, seg_start, seg_end, seg_level):
+    """Sleep-quality metrics of every night at once: {metric: array with one value per night}"""
+    nights = len(dates)
+    night = np.repeat(np.arange(nights), counts)
+    position = np.arange(len(night))
+    duration = np.maximum(seg_end - seg_start, 0)
+
+    # First and last segment of each night in which the sleeper is asleep
+    asleep = position[seg_level != AWAKE]
+    first = np.full(nights, -1)
+    last = np.full(nights, -1)
+    sleeper, first_index = np.unique(night[asleep], return_index=True)
+    first[sleeper] = asleep[first_index]
+    sleeper, last_index = np.unique(night[asleep][::-1], return_index=True)
+    last[sleeper] = asleep[::-1][last_index]
+
+    onset = np.where(first >= 0, seg_start[first] / 60, np.nan)
+
+    # Awake segments between falling asleep and the final wake-up
+    waking = (seg_level == AWAKE) & (position > first[night]) & (position < last[night]) & (first[night] >= 0)
+    episodes = np.bincount(night[waking], minlength=nights)
+    awake_minutes = np.bincount(night[waking], weights=duration[waking], minlength=nights) / 60
+    longest = np.zeros(nights)
+    np.maximum.at(longest, night[waking], duration[waking] / 60)
+
+    changes = (seg_level[1:] != seg_level[:-1]) & (night[1:] == night[:-1])
+    transitions = np.bincount(night[1:][changes], minlength=nights)
+
+    # Local bedtime in minutes since noon, so 23:30 and 00:30 are an hour apart
+    local_minutes = (starts // 1000 + offsets) // 60
+    bedtimes = ((local_minutes - 720) % 1440).astype(np.float64)
+
+    return {
+        "Sleep Onset (min)": onset,
+        "Wake Episodes": episodes.astype(np.float64),
+        "Awake After Onset (min)": awake_minutes,
+        "Longest Wake (min)": longest,
+        "Stage Transitions": transitions.astype(np.float64),
+        "Bedtime Variability (min)": bedtime_variability(dates, bedtimes),
+    }
+
+def metric_properties(metrics, index):
+    return {
+        name: {"number": None if np.isnan(values[index]) else round(float(values[index]), 1)}
+        for name, values in metrics.items()
+    }
+
+def write_metrics(notion, config, dates, metrics):
+    """Updates the sleep pages whose metrics changed; nights without a page are skipped"""
+    database_id = config.get("NOTION_SLEEP_DB_ID")
+    snap = snapshot.Snapshot()
+    exported = snap.export_all(notion, config, ["sleep"])
+    notion = snapshot.SnapshotReader(notion, snap, {db_id: name for name, db_id in exported.items()})
+
+    journal = Journal()
+    recovered = journal.recover(notion)
+    if recovered:
+        print(f"Recovered {recovered} pending mutations from the last run")
+
+    # Long Date -> (page ID, current metric values)
+    rows = snap.values(database_id, ["Long Date", *METRICS])
+    if snap.empty_after_export("sleep", database_id, rows):
+        return 0
+    pages = {}
+    for row in rows:
+        if row[2]:
+            pages[row[2][:10]] = (row[0], tuple(row[3:]))
+
+    planner = WritePlanner()
+    missing = 0
+    for index, cdate in enumerate(dates.astype(str)):
+        if cdate not in pages:
+            missing += 1
+            continue
+        page_id, current = pages[cdate]
+        properties = metric_properties(metrics, index)
+        if tuple(p["number"] for p in properties.values()) != current:
+            planner.update(page_id, properties)
+    if missing:
+        print(f"{missing} stored nights have no page in the Sleep database")
+    return planner.flush(notion, journal)
+
+def sync_sleep_quality(garmin, notion, config, days=None):
+    sync_nights(garmin, days or int(config.get("SLEEP_TIMELINE_DAYS", 3)))
+    nights = load_nights()
+    metrics = compute_metrics(*nights)
+    print(f"Computed sleep-quality metrics for {len(nights[0])} nights")
+    return write_metrics(notion, config, nights[0], metrics)
+
+def run(garmin, notion, config):
+    sync_sleep_quality(garmin, notion, config)
+
+def main():
+    from clients import make_garmin, make_notion
+
+    parser = argparse.ArgumentParser(description="Store sleep timelines and write sleep-quality metrics to Notion")
+    parser.add_argument("--days", type=int, help="How many nights back to store (default: SLEEP_TIMELINE_DAYS or 3)")
+    args = parser.parse_args()
+
+    with timed_stage("sleep-quality"):
+        sync_sleep_quality(make_garmin(os.environ), make_notion(os.environ), os.environ, args.days)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+import os
+import json
+import sqlite3
+import argparse
+import datetime
+import threading
+import uuid
+import async_io
+from notion_query import matches, page_response, plain_value, sort_pages
+from sync_state import state_path
+
+# Incremental exports never see pages archived in Notion, so every database is
+# exported in full again after this many days (NOTION_SNAPSHOT_FULL_DAYS)
+FULL_EXPORT_DAYS = float(os.getenv("NOTION_SNAPSHOT_FULL_DAYS", 7))
+
+# Notion databases kept in the local snapshot: (name, setting)
+DATABASES = [
+    ("activities", "NOTION_DB_ID"),
+    ("prs", "NOTION_PR_DB_ID"),
+    ("best-efforts", "NOTION_BEST_EFFORTS_DB_ID"),
+    ("steps", "NOTION_STEPS_DB_ID"),
+    ("sleep", "NOTION_SLEEP_DB_ID"),
+    ("health", "NOTION_HEALTH_DB_ID"),
+    ("gear", "NOTION_GEAR_DB_ID"),
+    ("coach", "NOTION_COACH_DB_ID"),
+    ("rollups", "NOTION_ROLLUPS_DB_ID"),
+]
+
+def normalize_id(database_id):
+    """A Notion ID with dashes, as the API returns it (IDs copied from a URL have none)"""
+    try:
+        return str(uuid.UUID(database_id))
+    except (TypeError, ValueError, AttributeError):
+        return database_id
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    page_id TEXT PRIMARY KEY,
+    database_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    last_edited_time TEXT NOT NULL,
+    page TEXT NOT NULL,          -- the page as the API returns it
+    data TEXT NOT NULL           -- {property: plain value}, for json_extract() in ad-hoc SQL
+);
+CREATE INDEX IF NOT EXISTS pages_database ON pages (database_id);
+CREATE TABLE IF NOT EXISTS exports (
+    database_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    last_edited_time TEXT,
+    exported TEXT NOT NULL,
+    full_exported TEXT
+);
+"""
+
+class Snapshot:
+    """
+    Local SQLite copy of the Notion databases. Exports are incremental: only
+    pages edited since the newest last_edited_time already stored are fetched.
+    Pages archived in Notion are only dropped by a full export, which runs
+    every FULL_EXPORT_DAYS days (or with --full).
+
+    Queries parse the pages of a database once and keep them in memory until
+    the database changes; the pages of a paginated query are served from the
+    result of its first page.
+    """
+
+    def __init__(self, path=None):
+        # Shared with the worker threads async_io.py runs queries in
+        self.db = sqlite3.connect(path or os.getenv("NOTION_SNAPSHOT_PATH") or state_path("notion-snapshot.sqlite"), check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+        # Snapshots created before periodic full exports have no full_exported column
+        if "full_exported" not in {row['name'] for row in self.db.execute("PRAGMA table_info(exports)")}:
+            self.db.execute("ALTER TABLE exports ADD COLUMN full_exported TEXT")
+        self.lock = threading.Lock()
+        self.generations = {}     # database ID -> number of writes, invalidates the caches below
+        self.parsed = {}          # database ID -> (generation, live pages)
+        self.results = {}         # (database ID, query) -> (generation, matching sorted pages)
+        self.fetched = {}         # snapshot name -> live pages its last export fetched
+
+    def _changed(self, database_id):
+        self.generations[database_id] = self.generations.get(database_id, 0) + 1
+
+    def upsert(self, name, database_id, page):
+        """Stores a page under `database_id` (the exported database, not the page's parent as given)"""
+        database_id = normalize_id(database_id)
+        data = {key: plain_value(prop) for key, prop in page.get('properties', {}).items()}
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO pages (page_id, database_id, name, last_edited_time, page, data) VALUES (?, ?, ?, ?, ?, ?)",
+                (page['id'], database_id, name, page['last_edited_time'], json.dumps(page), json.dumps(data, default=str))
+            )
+            self._changed(database_id)
+
+    def needs_full_export(self, database_id):
+        """True if the database was never exported in full or not in the last FULL_EXPORT_DAYS days"""
+        database_id = normalize_id(database_id)
+        row = self.db.execute("SELECT full_exported FROM exports WHERE database_id = ?", (database_id,)).fetchone()
+        if row is None or not row['full_exported']:
+            return True
+        age = datetime.datetime.now() - datetime.datetime.fromisoformat(row['full_exported'])
+        return age > datetime.timedelta(days=FULL_EXPORT_DAYS)
+
+    def export_query(self, database_id, full=False):
+        """The databases.query fetching the pages changed since the last export"""
+        database_id = normalize_id(database_id)
+        row = self.db.execute("SELECT last_edited_time FROM exports WHERE database_id = ?", (database_id,)).fetchone()
+        since = None if full or row is None else row['last_edited_time']
+
+        query = {"database_id": database_id, "sorts": [{"timestamp": "last_edited_time", "direction": "ascending"}]}
+        if since:
+            # Notion rounds last_edited_time to the minute, so re-read the last minute
+            query["filter"] = {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": since}}
+        return query
+
+    def store(self, name, database_id, pages, full=False):
+        """Saves the pages of one export and moves the database's cursor; returns how many stored pages a full export dropped"""
+        database_id = normalize_id(database_id)
+        now = datetime.datetime.now().isoformat(timespec="seconds")
+        dropped = 0
+        self.fetched[name] = sum(1 for page in pages if not page.get('archived'))
+        with self.db:
+            if full:
+                kept = {page['id'] for page in pages}
+                stored = {row[0] for row in self.db.execute("SELECT page_id FROM pages WHERE database_id = ?", (database_id,))}
+                dropped = len(stored - kept)
+                with self.lock:
+                    self.db.execute("DELETE FROM pages WHERE database_id = ?", (database_id,))
+                    self._changed(database_id)
+            for page in pages:
+                self.upsert(name, database_id, page)
+            row = self.db.execute("SELECT MAX(last_edited_time) FROM pages WHERE database_id = ?", (database_id,)).fetchone()
+            previous = self.db.execute("SELECT full_exported FROM exports WHERE database_id = ?", (database_id,)).fetchone()
+            self.db.execute(
+                "INSERT OR REPLACE INTO exports (database_id, name, last_edited_time, exported, full_exported) VALUES (?, ?, ?, ?, ?)",
+                (database_id, name, row[0], now, now if full else previous and previous['full_exported'])
+            )
+        return dropped
+
+    def export_all(self, notion, config, names=None, full=False):
+        """Brings the configured databases up to date, all exported at once; returns {name: database ID}"""
+        targets = {}
+        for name, setting in DATABASES:
+            database_id = normalize_id(config.get(setting))
+            if database_id and (names is None or name in names) and database_id not in targets.values():
+                targets[name] = database_id
+
+        fulls = {database_id: full or self.needs_full_export(database_id) for database_id in targets.values()}
+        fetched = async_io.gather(*[
+            async_io.query_all(notion, **self.export_query(database_id, fulls[database_id])) for database_id in targets.values()
+        ])
+        for (name, database_id), pages in zip(targets.items(), fetched):
+            dropped = self.store(name, database_id, pages, fulls[database_id])
+            if fulls[database_id]:
+                print(f"Snapshot {name}: {len(pages)} pages exported, {dropped} archived pages dropped")
+            else:
+                print(f"Snapshot {name}: {len(pages)} pages updated")
+        return targets
+
+    def pages(self, database_id):
+        """Live (not archived) pages of a database, parsed once per change of the database"""
+        database_id = normalize_id(database_id)
+        with self.lock:
+            generation = self.generations.get(database_id, 0)
+            cached = self.parsed.get(database_id)
+            if cached and cached[0] == generation:
+                return cached[1]
+            rows = self.db.execute("SELECT page FROM pages WHERE database_id = ?", (database_id,)).fetchall()
+            pages = [page for page in (json.loads(row['page']) for row in rows) if not page.get('archived')]
+            self.parsed[database_id] = (generation, pages)
+            return pages
+
+    def values(self, database_id, properties):
+        """
+        Plain values of `properties` for every live page, as rows of
+        (page ID, last_edited_time, value, ...); reads no page JSON
+        """
+        database_id = normalize_id(database_id)
+        columns = "".join(f", json_extract(data, '$.\"{name}\"')" for name in properties)
+        with self.lock:
+            return self.db.execute(
+                f"SELECT page_id, last_edited_time{columns} FROM pages "
+                "WHERE database_id = ? AND NOT IFNULL(json_extract(page, '$.archived'), 0)", (database_id,)
+            ).fetchall()
+
+    def empty_after_export(self, name, database_id, rows):
+        """
+        True, with a warning, if `rows` read from a database are empty although
+        its export this run fetched live pages (they were stored under another ID)
+        """
+        if rows or not self.fetched.get(name):
+            return False
+        print(f"WARNING: the {name} export fetched {self.fetched[name]} pages, but none are stored under "
+              f"database {database_id}. Check the database ID setting; nothing is computed from {name}.")
+        return True
+
+    def query(self, database_id, filter=None, sorts=None, start_cursor=None, page_size=100, filter_properties=None, **kwargs):
+        """databases.query answered from the snapshot; later pages of the same query reuse the first page's result"""
+        database_id = normalize_id(database_id)
+        key = (database_id, json.dumps([filter, sorts], sort_keys=True, default=str))
+        generation = self.generations.get(database_id, 0)
+        cached = self.results.get(key)
+        if start_cursor and cached and cached[0] == generation:
+            results = cached[1]
+        else:
+            results = sort_pages([page for page in self.pages(database_id) if matches(page, filter)], sorts)
+            # Only results spanning several pages are asked for again (with a cursor)
+            self.results.pop(key, None)
+            if len(results) > min(page_size or 100, 100):
+                self.results[key] = (generation, results)
+        return page_response(results, start_cursor, page_size, filter_properties)
+
+class _Endpoint:
+    """A client endpoint (databases, pages) with some methods replaced"""
+
+    def __init__(self, endpoint, **methods):
+        self._endpoint = endpoint
+        self.__dict__.update(methods)
+
+    def __getattr__(self, attr_name):
+        return getattr(self._endpoint, attr_name)
+
+class SnapshotReader:
+    """
+    Notion client stand-in for read-heavy stages: databases.query is answered
+    from the snapshot for the exported databases, everything else goes to the
+    real client. Pages it creates or updates are written through to the
+    snapshot, so a later stage (e.g. charts after coach) sees them.
+    """
+
+    def __init__(self, notion, snapshot, names):
+        self._notion = notion
+        self._snapshot = snapshot
+        # database ID (with dashes) -> snapshot name
+        self._names = {normalize_id(database_id): name for database_id, name in names.items()}
+        self.databases = _Endpoint(notion.databases, query=self._query)
+        self.pages = _Endpoint(notion.pages, create=self._create, update=self._update)
+
+    def __getattr__(self, attr_name):
+        return getattr(self._notion, attr_name)
+
+    def _query(self, database_id, **kwargs):
+        if normalize_id(database_id) in self._names:
+            return self._snapshot.query(database_id, **kwargs)
+        return self._notion.databases.query(database_id=database_id, **kwargs)
+
+    def _write_through(self, page):
+        database_id = normalize_id((page or {}).get('parent', {}).get('database_id'))
+        name = self._names.get(database_id)
+        if name:
+            with self._snapshot.db:
+                self._snapshot.upsert(name, database_id, page)
+        return page
+
+    def _create(self, **kwargs):
+        return self._write_through(self._notion.pages.create(**kwargs))
+
+    def _update(self, **kwargs):
+        return self._write_through(self._notion.pages.update(**kwargs))
+
+def reader(notion, config, names):
+    """
+    Brings the named snapshot databases up to date (one query each when nothing
+    changed) and returns a client that reads them locally. Set NOTION_SNAPSHOT=off
+    to always query Notion directly.
+    """
+    if str(config.get("NOTION_SNAPSHOT", "on")).lower() in ("off", "0", "false"):
+        return notion
+    snapshot = Snapshot()
+    exported = snapshot.export_all(notion, config, names)
+    return SnapshotReader(notion, snapshot, {database_id: name for name, database_id in exported.items()})
+
+def add_arguments(parser):
+    parser.add_argument("--full", action="store_true", help="Re-export everything (drops pages archived in Notion)")
+    parser.add_argument("--sql", help="Query the snapshot instead of exporting, e.g. "
+                        "\"SELECT json_extract(data, '$.Date') FROM pages WHERE name = 'activities'\"")
+
+def main(args=None):
+    if args is None:
+        parser = argparse.ArgumentParser(description="Export the Notion databases into a local SQLite snapshot")
+        add_arguments(parser)
+        args = parser.parse_args()
+
+    snapshot = Snapshot()
+    if args.sql:
+        for row in snapshot.db.execute(args.sql):
+            print(tuple(row))
+        return
+
+    from clients import make_notion
+    snapshot.export_all(make_notion(os.environ), os.environ, full=args.full)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import importlib
+
+# Every sync stage, in the order a full run executes them.
+# (stage name, script module, Notion database setting the stage needs)
+STAGES = [
+    ("activities", "garmin-activities", "NOTION_DB_ID"),
+    ("prs", "personal-records", "NOTION_PR_DB_ID"),
+    ("best-efforts", "best-efforts", "NOTION_BEST_EFFORTS_DB_ID"),
+    ("steps", "daily-steps", "NOTION_STEPS_DB_ID"),
+    ("sleep", "sleep-data", "NOTION_SLEEP_DB_ID"),
+    ("sleep-quality", "sleep-quality", "NOTION_SLEEP_DB_ID"),
+    ("health", "garmin-health-metrics", "NOTION_HEALTH_DB_ID"),
+    ("rollups", "period-rollups", "NOTION_ROLLUPS_DB_ID"),
+    ("gear", "garmin-gear", "NOTION_GEAR_DB_ID"),
+    ("coach", "garmin-coach", "NOTION_COACH_DB_ID"),
+    ("charts", "garmin-charts", "NOTION_COACH_DB_ID"),
+]
+
+STAGE_NAMES = [name for name, _, _ in STAGES]
+
+# Stages that only read/write Notion and never need a Garmin session
+NOTION_ONLY_STAGES = {"rollups", "coach", "charts"}
+
+def needs_garmin(name):
+    return name not in NOTION_ONLY_STAGES
+
+# Stages that write to another database than the one that enables them
+# (gear links gear to pages in the Activities database)
+WRITES_TO = {
+    "gear": "NOTION_DB_ID",
+}
+
+def load_stage(name):
+    """Imports a stage script (scripts use dashes, so importlib is needed) and returns its run()"""
+    for stage_name, module_name, _ in STAGES:
+        if stage_name == name:
+            return importlib.import_module(module_name).run
+    raise KeyError(f"Unknown stage: {name}")
+
+def stage_database_setting(name):
+    for stage_name, _, setting in STAGES:
+        if stage_name == name:
+            return setting
+    raise KeyError(f"Unknown stage: {name}")
+
+def stage_write_database(name, config):
+    """Notion database ID the stage writes to"""
+    return config.get(WRITES_TO.get(name) or stage_database_setting(name))
+
+def enabled_stages(config, only=None):
+    """Stages whose database is configured, optionally limited to the `only` list"""
+    return [
+        name for name, _, setting in STAGES
+        if config.get(setting) and (only is None or name in only)
+    ]
@@ -0,0 +1,129 @@
+import os
+import time
+import random
+import signal
+import importlib
+from garminconnect import Garmin, GarminConnectAuthenticationError
+from notion_client import Client
+from instrumentation import instrument
+
+# Reuse the property mapping of the one-shot activities script
+activities_script = importlib.import_module("garmin-activities")
+
+# Polling configuration (seconds)
+POLL_INTERVAL = float(os.getenv("DAEMON_POLL_INTERVAL", 60))
+POLL_JITTER = 0.2          # +/- 20% so polls never line up with other clients
+MAX_BACKOFF = 15 * 60      # Never wait longer than 15 minutes after errors
+POLL_LIMIT = 20            # Most recent activities checked per poll
+
+def is_garmin_auth_error(error):
+    """True if the Garmin session was rejected (also when wrapped in another error)"""
+    while error is not None:
+        if isinstance(error, GarminConnectAuthenticationError):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+class SyncDaemon:
+    """
+    Keeps warm Garmin and Notion clients plus an in-memory index of the
+    Activity IDs already in Notion, and pushes only new activities.
+    """
+
+    def __init__(self, garmin_email, garmin_password, notion_token, database_id):
+        self.garmin_email = garmin_email
+        self.garmin_password = garmin_password
+        self.database_id = database_id
+        self.notion = instrument(Client(auth=notion_token), "notion")
+        self.garmin = None
+        self.known_ids = set()
+        self.failures = 0
+        self.running = True
+
+    def login(self):
+        self.garmin = instrument(Garmin(self.garmin_email, self.garmin_password), "garmin")
+        self.garmin.login()
+        print("Garmin login successful")
+
+    def load_index(self):
+        """One paginated scan of the Activities DB at startup; afterwards the index lives in memory"""
+        known_ids = set()
+        has_more = True
+        next_cursor = None
+        while has_more:
+            resp = self.notion.databases.query(
+                database_id=self.database_id,
+                start_cursor=next_cursor
+            )
+            for page in resp['results']:
+                rich_text = page['properties'].get('Activity ID', {}).get('rich_text', [])
+                if rich_text:
+                    known_ids.add(rich_text[0]['plain_text'])
+            has_more = resp['has_more']
+            next_cursor = resp['next_cursor']
+        self.known_ids = known_ids
+        print(f"Indexed {len(known_ids)} activities already in Notion.")
+
+    def poll(self):
+        """Fetches the latest activities and creates pages for the ones not yet indexed"""
+        activities = self.garmin.get_activities(0, POLL_LIMIT)
+        new_activities = [a for a in activities if str(a['activityId']) not in self.known_ids]
+
+        # Oldest first, so Notion receives them in chronological order
+        for activity in reversed(new_activities):
+            print(f"Syncing new activity: {activity['activityName']}")
+            self.notion.pages.create(
+                parent={"database_id": self.database_id},
+                properties=activities_script.build_activity_properties(activity)
+            )
+            self.known_ids.add(str(activity['activityId']))
+        return len(new_activities)
+
+    def next_delay(self):
+        """Jittered poll interval, doubled for every consecutive failure"""
+        delay = min(POLL_INTERVAL * (2 ** self.failures), MAX_BACKOFF)
+        return delay * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+
+    def stop(self, *_):
+        print("Stopping sync daemon...")
+        self.running = False
+
+    def run(self):
+        self.login()
+        self.load_index()
+
+        while self.running:
+            try:
+                synced = self.poll()
+                if synced:
+                    print(f"Synced {synced} new activities.")
+                self.failures = 0
+            except Exception as e:
+                self.failures += 1
+                print(f"Poll failed ({self.failures} in a row): {e}")
+                # Garmin sessions expire; only then log in again, as repeated
+                # logins for unrelated (e.g. Notion) errors risk an SSO lockout
+                if is_garmin_auth_error(e):
+                    try:
+                        self.login()
+                    except Exception as login_error:
+                        print(f"Garmin re-login failed: {login_error}")
+
+            # Sleep in short steps so a stop signal is handled promptly
+            wake_at = time.monotonic() + self.next_delay()
+            while self.running and time.monotonic() < wake_at:
+                time.sleep(max(0.0, min(1.0, wake_at - time.monotonic())))
+
+def main():
+    daemon = SyncDaemon(
+        os.getenv("GARMIN_EMAIL"),
+        os.getenv("GARMIN_PASSWORD"),
+        os.getenv("NOTION_TOKEN"),
+        os.getenv("NOTION_DB_ID")
+    )
+    signal.signal(signal.SIGTERM, daemon.stop)
+    signal.signal(signal.SIGINT, daemon.stop)
+    daemon.run()
+
+if __name__ == '__main__':
+    main()
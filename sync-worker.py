@@ -0,0 +1,157 @@
+import os
+import time
+import socket
+import argparse
+import datetime
+import importlib
+import threading
+import profiling
+from clients import make_garmin, make_notion
+from job_queue import JobQueue, LEASE_SECONDS
+from stages import STAGE_NAMES, enabled_stages, load_stage, needs_garmin, stage_write_database
+from sync_state import STATE_DIR, use_state_dir
+from throttle import Throttled, notion_limiter
+from instrumentation import PLAIN_TYPES, timed_stage
+
+load_roster = importlib.import_module("multi-tenant-sync").load_roster
+
+IDLE_POLL_SECONDS = 10
+
+def enqueue_jobs(queue, tenants, run_key):
+    """Adds one job per tenant and enabled stage; re-running with the same run_key adds nothing"""
+    added = 0
+    for tenant in tenants:
+        for stage in enabled_stages(tenant, tenant.get('stages')):
+            shard = stage_write_database(stage, tenant) or f"{tenant['name']}:{stage}"
+            if queue.enqueue(tenant['name'], stage, shard, run_key, priority=STAGE_NAMES.index(stage)):
+                added += 1
+    return added
+
+class LeaseLost(Exception):
+    """The job's lease expired or was taken over; the job must stop writing"""
+
+class Fenced:
+    """
+    Wraps a client so every API call first checks that the job still holds
+    its lease. Once the heartbeat loses it, the next call raises LeaseLost,
+    so a stage never keeps writing while another worker runs the same job.
+    """
+
+    def __init__(self, target, lost, job_key):
+        self._target = target
+        self._lost = lost
+        self._job_key = job_key
+
+    def __getattr__(self, attr_name):
+        attr = getattr(self._target, attr_name)
+        if isinstance(attr, PLAIN_TYPES):
+            return attr
+        if not callable(attr):
+            return Fenced(attr, self._lost, self._job_key)
+
+        def call(*args, **kwargs):
+            if self._lost.is_set():
+                raise LeaseLost(f"Lost lease on {self._job_key}")
+            return attr(*args, **kwargs)
+        return call
+
+class Worker:
+    """Pulls stage jobs from the queue and runs them with warm per-tenant clients"""
+
+    def __init__(self, queue, tenants, worker_id=None):
+        self.queue = queue
+        self.tenants = {tenant['name']: tenant for tenant in tenants}
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.garmin_sessions = {}
+
+    def clients_for(self, tenant, stage):
+        garmin = None
+        if needs_garmin(stage):
+            if tenant['name'] not in self.garmin_sessions:
+                self.garmin_sessions[tenant['name']] = make_garmin(tenant)
+            garmin = self.garmin_sessions[tenant['name']]
+        return garmin, Throttled(make_notion(tenant), notion_limiter(tenant.get("NOTION_TOKEN")))
+
+    def keep_lease(self, job_key, done, lost):
+        """Renews the lease while the job runs; sets `lost` if it cannot"""
+        # SQLite connections belong to one thread, so the heartbeat opens its own
+        queue = JobQueue(self.queue.path)
+        while not done.wait(LEASE_SECONDS / 3):
+            try:
+                renewed = queue.renew(job_key, self.worker_id)
+            except Exception as e:
+                print(f"Could not renew the lease on {job_key}: {e}")
+                renewed = False
+            if not renewed:
+                print(f"Lost lease on {job_key}, stopping the job")
+                lost.set()
+                return
+
+    def run_job(self, job):
+        tenant = self.tenants.get(job['tenant'])
+        if tenant is None:
+            raise KeyError(f"Tenant {job['tenant']} is not in the roster")
+
+        done, lost = threading.Event(), threading.Event()
+        heartbeat = threading.Thread(target=self.keep_lease, args=(job['job_key'], done, lost), daemon=True)
+        heartbeat.start()
+        try:
+            with use_state_dir(os.path.join(STATE_DIR, tenant['name'])):
+                garmin, notion = self.clients_for(tenant, job['stage'])
+                garmin = Fenced(garmin, lost, job['job_key']) if garmin else None
+                with timed_stage(job['stage']):
+                    load_stage(job['stage'])(garmin, Fenced(notion, lost, job['job_key']), tenant)
+        finally:
+            done.set()
+            heartbeat.join()
+        # Stages may swallow the error of a single write; the job still must not count as done
+        if lost.is_set():
+            raise LeaseLost(f"Lost lease on {job['job_key']}")
+
+    def work(self, forever=False):
+        processed = 0
+        while True:
+            job = self.queue.claim(self.worker_id)
+            if job is None:
+                if not forever:
+                    return processed
+                time.sleep(IDLE_POLL_SECONDS)
+                continue
+
+            print(f"[{self.worker_id}] Running {job['job_key']}")
+            try:
+                self.run_job(job)
+                self.queue.complete(job['job_key'], self.worker_id)
+            except LeaseLost as e:
+                # The job belongs to another worker (or is claimable again) now
+                print(f"[{self.worker_id}] {e}")
+            except Exception as e:
+                print(f"[{self.worker_id}] {job['job_key']} failed: {e}")
+                # A failed login should not be cached
+                self.garmin_sessions.pop(job['tenant'], None)
+                self.queue.fail(job['job_key'], self.worker_id, e)
+            processed += 1
+
+def main():
+    parser = argparse.ArgumentParser(description="Queue-based sync workers")
+    parser.add_argument("command", choices=["enqueue", "work", "status"])
+    parser.add_argument("--roster", default=os.getenv("TENANTS_FILE", "tenants.json"))
+    parser.add_argument("--run-key", default=datetime.datetime.now().strftime("%Y-%m-%dT%H"),
+                        help="Jobs with the same run key are only enqueued once (default: current hour)")
+    parser.add_argument("--forever", action="store_true", help="Keep polling when the queue is empty")
+    parser.add_argument("--profile", action="store_true", help="Profile each job's stage (see profiling.py)")
+    args = parser.parse_args()
+    if args.profile:
+        profiling.enable()
+
+    queue = JobQueue()
+    if args.command == "enqueue":
+        added = enqueue_jobs(queue, load_roster(args.roster), args.run_key)
+        print(f"Enqueued {added} jobs.")
+    elif args.command == "work":
+        processed = Worker(queue, load_roster(args.roster)).work(args.forever)
+        print(f"Processed {processed} jobs.")
+    print(queue.counts())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+import os
+import json
+import tempfile
+import contextlib
+import contextvars
+
+# Local state lives next to the scripts unless SYNC_STATE_DIR says otherwise.
+# In GitHub Actions, cache this folder between runs to keep incremental state.
+STATE_DIR = os.getenv("SYNC_STATE_DIR", ".sync-state")
+
+# Overridden per thread/task, e.g. one folder per tenant in multi-tenant-sync.py
+_state_dir = contextvars.ContextVar("state_dir", default=None)
+
+@contextlib.contextmanager
+def use_state_dir(path):
+    """Points load_state/save_state at another folder for the current thread or task"""
+    token = _state_dir.set(path)
+    try:
+        yield
+    finally:
+        _state_dir.reset(token)
+
+def current_state_dir():
+    return _state_dir.get() or STATE_DIR
+
+def state_path(name):
+    """Returns the path of a state file inside the state folder"""
+    state_dir = current_state_dir()
+    os.makedirs(state_dir, exist_ok=True)
+    return os.path.join(state_dir, name)
+
+def load_state(name, default=None):
+    """Loads a JSON state file, returning `default` if it does not exist yet"""
+    path = state_path(f"{name}.json")
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_state(name, data):
+    """
+    Writes a JSON state file atomically (temp file + rename), so a crash
+    mid-write never leaves a half-written state behind.
+    """
+    path = state_path(f"{name}.json")
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
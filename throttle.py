@@ -0,0 +1,228 @@
+import os
+import time
+import asyncio
+import random
+import datetime
+import threading
+import instrumentation
+from sync_state import current_state_dir, load_state, save_state, use_state_dir
+
+# Notion allows an average of 3 requests per second per integration token
+NOTION_RATE = 3.0
+NOTION_BURST = 3
+MAX_RETRIES = 5
+
+# Garmin Connect publishes no limits; parallel Garmin calls are adapted at runtime
+GARMIN_INITIAL_CONCURRENCY = 2
+GARMIN_MAX_CONCURRENCY = int(os.getenv("GARMIN_MAX_CONCURRENCY", 8))
+GARMIN_STATE = "garmin_concurrency"
+# How much longer the adaptive limit stays healthy before retrying the level that failed last
+PROBE_FACTOR = 8
+
+class RateLimiter:
+    """Thread-safe token bucket: `rate` requests per second with bursts up to `burst`"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _take(self):
+        """Takes a token if one is available; otherwise returns how long to wait for one"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """acquire() for coroutines: waits without blocking the event loop"""
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+_notion_limiters = {}
+_notion_limiters_lock = threading.Lock()
+
+def notion_limiter(token):
+    """One shared limiter per Notion integration token, whichever tenant uses it"""
+    with _notion_limiters_lock:
+        if token not in _notion_limiters:
+            _notion_limiters[token] = RateLimiter(NOTION_RATE, NOTION_BURST)
+        return _notion_limiters[token]
+
+def is_rate_limited(error):
+    """True for Notion 'rate_limited' / HTTP 429 errors (OpenAI errors carry the status as status_code)"""
+    status = getattr(error, "status", None) or getattr(error, "status_code", None)
+    return status == 429 or str(getattr(error, "code", "")) == "rate_limited"
+
+def retry_after(error, attempt):
+    """Seconds to wait before retrying: Retry-After header if present, else exponential backoff with jitter"""
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return min(2 ** attempt, 30) * random.uniform(0.5, 1.5)
+
+class Throttled:
+    """
+    Wraps a client (e.g. notion_client.Client) so every API call goes through
+    a rate limiter and is retried on 429. Attribute chains such as
+    `client.databases.query` or `client.blocks.children.append` are wrapped too.
+    """
+
+    def __init__(self, target, limiter, name="notion"):
+        self._target = target
+        self._limiter = limiter
+        self._name = name
+
+    def __getattr__(self, attr_name):
+        attr = getattr(self._target, attr_name)
+        name = f"{self._name}.{attr_name}"
+        if isinstance(attr, instrumentation.PLAIN_TYPES):
+            return attr
+        if not callable(attr):
+            return Throttled(attr, self._limiter, name)
+
+        def call(*args, **kwargs):
+            for attempt in range(MAX_RETRIES + 1):
+                self._limiter.acquire()
+                try:
+                    return attr(*args, **kwargs)
+                except Exception as e:
+                    if not is_rate_limited(e) or attempt == MAX_RETRIES:
+                        raise
+                    instrumentation.metrics.record_retry(name)
+                    time.sleep(retry_after(e, attempt))
+        return call
+
+def is_overloaded(error):
+    """True for 429s and timeouts, also when wrapped in another error (garminconnect wraps them)"""
+    while error is not None:
+        if is_rate_limited(error) or isinstance(error, TimeoutError):
+            return True
+        name = type(error).__name__
+        if "TooManyRequests" in name or "Timeout" in name:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on parallel requests: one more slot after every `limit` healthy
+    responses in a row, half as many slots after a 429 or timeout. Failures of
+    requests started before the last decrease do not halve it again, and the
+    level that failed last is probed again only after PROBE_FACTOR times as
+    many healthy responses. The learned limit is saved in the sync state, so
+    the next run starts there.
+    """
+
+    def __init__(self, state_name=GARMIN_STATE, initial=GARMIN_INITIAL_CONCURRENCY, maximum=GARMIN_MAX_CONCURRENCY):
+        self.state_name = state_name
+        self.state_dir = current_state_dir()
+        self.maximum = maximum
+        saved = load_state(state_name) or {}
+        self.limit = max(1, min(maximum, saved.get("limit", initial)))
+        self.ceiling = saved.get("ceiling")
+        self.in_flight = 0
+        self.healthy = 0
+        self.epoch = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """Waits for a free slot; returns the epoch to hand back to release()"""
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+            return self.epoch
+
+    def release(self, epoch, error=None):
+        """Frees a slot and adapts the limit to how the request went"""
+        with self.condition:
+            self.in_flight -= 1
+            previous = self.limit
+            if error is None:
+                self.healthy += 1
+                needed = self.limit * (PROBE_FACTOR if self.ceiling and self.limit + 1 >= self.ceiling else 1)
+                if self.healthy >= needed and self.limit < self.maximum:
+                    self.limit += 1
+                    self.healthy = 0
+            elif is_overloaded(error) and epoch == self.epoch:
+                self.ceiling = self.limit
+                self.limit = max(1, self.limit // 2)
+                self.healthy = 0
+                self.epoch += 1
+            changed = self.limit != previous
+            self.condition.notify_all()
+        if changed:
+            print(f"Garmin concurrency {'raised' if self.limit > previous else 'lowered'} to {self.limit}")
+            self.save()
+
+    def save(self):
+        with use_state_dir(self.state_dir):
+            save_state(self.state_name, {
+                "limit": self.limit,
+                "ceiling": self.ceiling,
+                "updated": datetime.datetime.now().isoformat(timespec="seconds"),
+            })
+
+_garmin_controllers = {}
+_garmin_controllers_lock = threading.Lock()
+
+def garmin_concurrency(account):
+    """One shared controller per Garmin account (and state folder), whichever stage or thread calls it"""
+    key = (account, current_state_dir())
+    with _garmin_controllers_lock:
+        if key not in _garmin_controllers:
+            _garmin_controllers[key] = AdaptiveConcurrency()
+        return _garmin_controllers[key]
+
+class Adaptive:
+    """
+    Wraps a client (e.g. garminconnect.Garmin) so every call takes a slot of
+    an AdaptiveConcurrency controller; 429s and timeouts are retried.
+    """
+
+    def __init__(self, target, controller, name="garmin"):
+        self._target = target
+        self._controller = controller
+        self._name = name
+
+    def __getattr__(self, attr_name):
+        attr = getattr(self._target, attr_name)
+        name = f"{self._name}.{attr_name}"
+        if isinstance(attr, instrumentation.PLAIN_TYPES):
+            return attr
+        if not callable(attr):
+            return Adaptive(attr, self._controller, name)
+
+        def call(*args, **kwargs):
+            for attempt in range(MAX_RETRIES + 1):
+                epoch = self._controller.acquire()
+                try:
+                    result = attr(*args, **kwargs)
+                except Exception as e:
+                    self._controller.release(epoch, e)
+                    if not is_overloaded(e) or attempt == MAX_RETRIES:
+                        raise
+                    instrumentation.metrics.record_retry(name)
+                    time.sleep(retry_after(e, attempt))
+                    continue
+                self._controller.release(epoch)
+                return result
+        return call
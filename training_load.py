@@ -0,0 +1,164 @@
+import os
+import datetime
+import numpy as np
+from sync_state import load_state, save_state
+
+# Heart rate zones for TRIMP (override with your own values)
+HR_MAX = float(os.getenv("HR_MAX", 190))
+HR_REST = float(os.getenv("HR_REST", 60))
+
+# Time constants (days) of the acute (fatigue) and chronic (fitness) averages
+ATL_DAYS = 7
+CTL_DAYS = 42
+
+STATE_NAME = "training_load"
+
+# Days recomputed on every run, for activities synced to Notion after their day
+RECOMPUTE_DAYS = 14
+
+# Chunk length for the vectorized EWMA; keeps decay**-i far from overflowing
+EWMA_CHUNK = 256
+
+def activity_load(duration_sec, avg_hr):
+    """
+    Banister TRIMP for arrays of activities:
+    minutes * HRr * 0.64 * e^(1.92 * HRr), with HRr the heart rate reserve fraction.
+    Activities without heart rate get a load of 0.
+    """
+    minutes = np.asarray(duration_sec, dtype=float) / 60
+    hr = np.asarray(avg_hr, dtype=float)
+    hrr = np.clip((hr - HR_REST) / (HR_MAX - HR_REST), 0, 1)
+    load = minutes * hrr * 0.64 * np.exp(1.92 * hrr)
+    return np.nan_to_num(load)
+
+def ewma_series(loads, initial, days):
+    """
+    Exponentially weighted average of daily loads in one vectorized pass:
+    y[t] = a * y[t-1] + (1 - a) * x[t], with a = e^(-1/days).
+    Solved in closed form per chunk with a cumulative sum.
+    """
+    decay = np.exp(-1.0 / days)
+    loads = np.asarray(loads, dtype=float)
+    out = np.empty_like(loads)
+    prev = initial
+    for start in range(0, len(loads), EWMA_CHUNK):
+        chunk = loads[start:start + EWMA_CHUNK]
+        powers = decay ** np.arange(1, len(chunk) + 1)
+        acc = np.cumsum(chunk / powers)
+        out[start:start + len(chunk)] = powers * (prev + (1 - decay) * acc)
+        prev = out[start + len(chunk) - 1]
+    return out
+
+def query_activities(client, database_id, on_or_after=None, before=None):
+    """Fetches (date, duration, avg HR) for all activities in the date window, following pagination"""
+    conditions = []
+    if on_or_after:
+        conditions.append({"property": "Date", "date": {"on_or_after": on_or_after}})
+    if before:
+        conditions.append({"property": "Date", "date": {"before": before}})
+    query = {"database_id": database_id}
+    if conditions:
+        query["filter"] = {"and": conditions}
+
+    rows = []
+    has_more = True
+    next_cursor = None
+    while has_more:
+        resp = client.databases.query(**query, start_cursor=next_cursor)
+        for page in resp['results']:
+            props = page['properties']
+            try:
+                date_str = props['Date']['date']['start'][:10]
+                duration = props['Duration']['number'] or 0
+                avg_hr = props.get('Avg HR', {}).get('number')
+            except (KeyError, TypeError):
+                continue
+            rows.append((date_str, duration, np.nan if avg_hr is None else avg_hr))
+        has_more = resp['has_more']
+        next_cursor = resp['next_cursor']
+    return rows
+
+def daily_loads(rows, first_day, last_day):
+    """Sums activity loads per calendar day between first_day and last_day (inclusive)"""
+    n_days = (last_day - first_day).days + 1
+    if n_days <= 0:
+        return np.zeros(0)
+    if not rows:
+        return np.zeros(n_days)
+    dates, durations, hrs = zip(*rows)
+    day_index = np.array([(datetime.date.fromisoformat(d) - first_day).days for d in dates])
+    loads = activity_load(durations, hrs)
+    in_range = (day_index >= 0) & (day_index < n_days)
+    return np.bincount(day_index[in_range], weights=loads[in_range], minlength=n_days)
+
+def _daily_rows(first_day, loads, atl, ctl):
+    days = [(first_day + datetime.timedelta(days=i)).isoformat() for i in range(len(loads))]
+    return {
+        day: [round(float(l), 1), round(float(a), 1), round(float(c), 1), round(float(c - a), 1)]
+        for day, l, a, c in zip(days, loads, atl, ctl)
+    }
+
+def update_training_load(client, database_id, today=None):
+    """
+    Brings the persisted ATL/CTL state up to yesterday (the last complete day).
+    The first run does the whole history in one vectorized pass; later runs
+    recompute from a checkpoint RECOMPUTE_DAYS before the last update, so
+    activities that reach Notion a few days late are still counted.
+    """
+    today = today or datetime.date.today()
+    yesterday = today - datetime.timedelta(days=1)
+    state = load_state(STATE_NAME)
+
+    if state is None:
+        rows = query_activities(client, database_id, before=today.isoformat())
+        first_day = min((datetime.date.fromisoformat(r[0]) for r in rows), default=today)
+        atl0 = ctl0 = 0.0
+        state = {"daily": {}}
+    else:
+        # States written before checkpoints existed continue from their last day
+        checkpoint = state.get("checkpoint") or {"day": state['last_day'], "atl": state['atl'], "ctl": state['ctl']}
+        first_day = datetime.date.fromisoformat(checkpoint['day']) + datetime.timedelta(days=1)
+        if first_day > yesterday:
+            return state
+        rows = query_activities(client, database_id, on_or_after=first_day.isoformat(), before=today.isoformat())
+        atl0, ctl0 = checkpoint['atl'], checkpoint['ctl']
+
+    loads = daily_loads(rows, first_day, yesterday)
+    if len(loads) == 0:
+        return {"last_day": None, "atl": 0.0, "ctl": 0.0, "daily": {}}
+    atl = ewma_series(loads, atl0, ATL_DAYS)
+    ctl = ewma_series(loads, ctl0, CTL_DAYS)
+    state['daily'].update(_daily_rows(first_day, loads, atl, ctl))
+
+    # Exact averages of the day before the window the next run recomputes
+    keep = max(0, len(loads) - RECOMPUTE_DAYS)
+    checkpoint = {"day": (first_day + datetime.timedelta(days=keep - 1)).isoformat(), "atl": atl0, "ctl": ctl0}
+    if keep:
+        checkpoint.update({"atl": float(atl[keep - 1]), "ctl": float(ctl[keep - 1])})
+    state.update({
+        "last_day": yesterday.isoformat(),
+        "atl": float(atl[-1]),
+        "ctl": float(ctl[-1]),
+        "checkpoint": checkpoint,
+    })
+    save_state(STATE_NAME, state)
+    return state
+
+def get_training_load(client, database_id, days=30):
+    """
+    Returns the last `days` days as a list of dicts:
+    {"date", "load", "atl", "ctl", "tsb"}
+    """
+    state = update_training_load(client, database_id)
+    daily = state['daily']
+    return [
+        {"date": day, "load": v[0], "atl": v[1], "ctl": v[2], "tsb": v[3]}
+        for day, v in sorted(daily.items())[-days:]
+    ]
+
+if __name__ == "__main__":
+    from notion_client import Client
+
+    notion = Client(auth=os.getenv("NOTION_TOKEN"))
+    for row in get_training_load(notion, os.getenv("NOTION_DB_ID"), days=14):
+        print(f"{row['date']}: load {row['load']}, ATL {row['atl']}, CTL {row['ctl']}, TSB {row['tsb']}")
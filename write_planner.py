@@ -0,0 +1,79 @@
+import json
+import uuid
+import hashlib
+
+class WritePlanner:
+    """
+    Collects the Notion page mutations of a run and sends one request per page.
+
+    Property patches for the same page are merged (the last value of a property
+    wins), icon and cover are replaced by the latest one, and updates to a page
+    that is created in the same run are folded into its pages.create call.
+    """
+
+    def __init__(self):
+        # target -> {"op", "key", "payload", "lookup"}; target is a page ID or a create key
+        self.plans = {}
+        self.planned = 0
+        # Part of every update key, so an update never matches one committed by an earlier run
+        # (a value that goes 1 -> 2 -> 1 must be written all three times)
+        self.run_id = uuid.uuid4().hex[:8]
+
+    def create(self, key, database_id, properties, icon=None, cover=None, lookup=None):
+        """Plans a new page; returns `key`, which update() accepts as target"""
+        self.planned += 1
+        payload = {"parent": {"database_id": database_id}, "properties": dict(properties)}
+        self._set_decoration(payload, icon, cover)
+        self.plans[key] = {"op": "create", "key": key, "payload": payload, "lookup": lookup}
+        return key
+
+    def update(self, target, properties=None, icon=None, cover=None):
+        """Plans a patch of an existing page ID or of a page planned with create()"""
+        self.planned += 1
+        plan = self.plans.get(target)
+        if plan is None:
+            plan = {"op": "update", "key": None, "payload": {"page_id": target, "properties": {}}, "lookup": None}
+            self.plans[target] = plan
+        plan["payload"]["properties"].update(properties or {})
+        self._set_decoration(plan["payload"], icon, cover)
+
+    def _set_decoration(self, payload, icon, cover):
+        if icon:
+            payload["icon"] = {"emoji": icon}
+        if cover:
+            payload["cover"] = {"type": "external", "external": {"url": cover}}
+
+    def flush(self, notion, journal=None):
+        """
+        Sends the planned requests and clears the plan; returns the number of failed requests.
+        With a journal, every request is logged before the first one is sent, so an
+        interrupted flush is finished by journal.recover() on the next run.
+        """
+        plans, self.plans = list(self.plans.values()), {}
+        planned, self.planned = self.planned, 0
+        if not plans:
+            return 0
+
+        for plan in plans:
+            if plan["key"] is None:
+                # One key per run, page and content; crash recovery replays pending keys whatever they are
+                digest = hashlib.sha1(json.dumps(plan["payload"], sort_keys=True).encode()).hexdigest()[:16]
+                plan["key"] = f"update:{plan['payload']['page_id']}:{self.run_id}:{digest}"
+            if journal:
+                journal.log(plan["key"], plan["op"], plan["payload"], plan["lookup"])
+
+        failed = 0
+        for plan in plans:
+            try:
+                if journal:
+                    journal.send(notion, plan["key"])
+                elif plan["op"] == "create":
+                    notion.pages.create(**plan["payload"])
+                else:
+                    notion.pages.update(**plan["payload"])
+            except Exception as e:
+                print(f"Error writing {plan['key']}: {e}")
+                failed += 1
+
+        print(f"Sent {len(plans)} Notion writes for {planned} planned changes")
+        return failed